@@ -1,4 +1,22 @@
-from pydantic import BaseSettings
+from typing import Dict, Optional
+
+from pydantic import BaseModel, BaseSettings
+
+
+class AdmissionLimit(BaseModel):
+    """
+    单个路由的准入控制配置
+    """
+
+    # 同时处理的请求数上限, 为空时不限制
+    max_concurrency: Optional[int] = None
+    # 达到并发上限后最多排队等待的请求数, 为 0 时直接拒绝
+    max_queue: int = 0
+    # 排队等待的最长时间(秒)
+    queue_timeout: float = 1.0
+    # 令牌桶限速: 每秒补充的令牌数, 为空时不限速; burst 为桶的容量, 即允许的突发请求数
+    rate: Optional[float] = None
+    burst: int = 1
 
 
 class Settings(BaseSettings):
@@ -8,9 +26,63 @@ class Settings(BaseSettings):
     # 数据库配置
     DATABASE_URI: str = "sqlite:///db.sqlite3"
     SQL_DEBUG: bool = False
+    # 开启后路由通过 AsyncSession 访问数据库, 否则在线程池中使用同步 Session
+    DATABASE_ASYNC: bool = False
+    # 异步数据库地址, 为空时根据 DATABASE_URI 推导, 例如 sqlite+aiosqlite:///db.sqlite3
+    ASYNC_DATABASE_URI: Optional[str] = None
+    # 读写分离: Query UseCase 使用只读连接池, Command UseCase 使用单个写连接, SQLite 下同时开启 WAL
+    DATABASE_READ_WRITE_SPLIT: bool = False
+    # 只读连接地址(例如只读副本), 为空时与 DATABASE_URI 相同
+    READ_DATABASE_URI: Optional[str] = None
+    READ_POOL_SIZE: int = 8
+    # SQLite 等待文件锁的最长时间(毫秒)
+    SQLITE_BUSY_TIMEOUT: int = 5000
+    # 写入后多少秒内该客户端的读请求仍使用写连接, 保证读到自己的写入, 为 0 时关闭
+    READ_YOUR_WRITES_SECONDS: float = 0
+    # 监控配置
+    # 在响应头 Server-Timing 中返回 SQL 条数与各阶段耗时
+    SERVER_TIMING_ENABLED: bool = True
+    # 开启 /metrics, 以 Prometheus 文本格式输出按路由汇总的耗时直方图
+    METRICS_ENABLED: bool = False
     # 认证配置
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 30  # 一个月
+    # 密码哈希进程池的进程数, 为空时等于 CPU 核数, 为 0 时在当前线程中计算
+    PASSWORD_HASH_WORKERS: Optional[int] = None
+    # 排队与执行中的密码哈希任务上限, 超过时立即失败而不是继续排队
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    # 已认证用户缓存, 避免每个请求都查询用户表, TTL 为 0 时关闭
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: int = 60
+    # 准入控制: 按 "方法 路径" 限制开销大的路由的并发数、排队长度与速率, 路径中可以包含 {参数}, 未配置的路由不受影响
+    # 超过速率立即返回 429, 排队已满或排队超时返回 503, 都带有 Retry-After; 通过环境变量以 JSON 设置
+    # 合适的上限取决于部署的 CPU 核数与数据库, 默认关闭, 需要按压测结果为具体路由开启
+    ADMISSION_ENABLED: bool = False
+    ADMISSION_LIMITS: Dict[str, AdmissionLimit] = {}
+    # 评论列表响应缓存的条数(不同的分页参数各占一条), 为 0 时关闭
+    # 缓存只随当前进程内的写入失效, 导入脚本、其他 worker 或直接修改数据库后最多返回 COMMENT_CACHE_TTL 秒的旧数据, 默认关闭
+    COMMENT_CACHE_SIZE: int = 0
+    COMMENT_CACHE_TTL: float = 5
+    # 构建 orjson 的中间对象时暂停循环垃圾回收, 10 万条评论的 orjson 序列化耗时约减半(见 benchmarks/bench_serializer.py)
+    # 暂停期间整个进程都不做循环垃圾回收, 默认关闭
+    SERIALIZER_PAUSE_GC: bool = False
+    # 启动时在进程内构建整个评论森林的索引, 全部评论与单条评论的读取不再访问数据库
+    # 索引只反映当前进程的写入, 只能在单进程部署时开启
+    COMMENT_INDEX_ENABLED: bool = False
+    # 领域事件: 写操作在同一事务中把事件写入 outbox 表, 由后台任务分批投递给订阅者
+    # 每次写入多一行 outbox 记录, 且目前只有评论实时推送订阅事件, 默认关闭
+    OUTBOX_ENABLED: bool = False
+    OUTBOX_BATCH_SIZE: int = 100
+    # 没有新事件通知时检查 outbox 的间隔(秒), 用于投递其他进程写入的事件
+    OUTBOX_POLL_INTERVAL: float = 1.0
+    # 认领一批事件后的租约时长(秒), 进程在投递中途退出时, 租约到期后由其他进程重新投递
+    OUTBOX_LEASE_SECONDS: float = 30
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    # 评论实时推送(SSE, 依赖 OUTBOX_ENABLED): 每个连接最多缓存的消息数, 超过时断开该连接
+    COMMENT_EVENTS_QUEUE_SIZE: int = 64
+    COMMENT_EVENTS_MAX_CLIENTS: int = 10000
+    # 空闲连接发送心跳的间隔(秒)
+    COMMENT_EVENTS_HEARTBEAT: float = 15
 
     class Config:
         case_sensitive = True
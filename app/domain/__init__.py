@@ -1,2 +1,3 @@
-from .user import User, UserBaseRepository, Email
-from .comment import Comment, CommentBaseRepository
+from .event import DomainEvent
+from .user import User, UserBaseRepository, Email, UserDeleted
+from .comment import Comment, CommentBaseRepository, CommentCreated, CommentDeleted
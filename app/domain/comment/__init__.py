@@ -1,3 +1,5 @@
 from .entity import Comment, CommentTreeNode
+from .forest import CommentForest, CommentForestNode
 from .repository import CommentBaseRepository
-from .exception import CommentDoesNotExistError
+from .exception import CommentDoesNotExistError, ParentCommentDoesNotExistError
+from .event import CommentCreated, CommentDeleted
@@ -15,6 +15,9 @@ class Comment:
     parent_id: Optional[int] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    # 直接回复数与全部子孙评论数, 由 Repository 在写入时维护
+    reply_count: int = 0
+    descendant_count: int = 0
 
 
 @dataclass
@@ -29,3 +32,7 @@ class CommentTreeNode:
     children: List["CommentTreeNode"] = field(default_factory=lambda: [])
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    reply_count: int = 0
+    descendant_count: int = 0
+    # 只返回了部分直接回复时, 指向已返回的最后一条回复的游标, 用于继续获取之后的回复
+    children_cursor: Optional[str] = None
@@ -0,0 +1,26 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from app.domain.event import DomainEvent
+
+
+@dataclass(frozen=True)
+class CommentCreated(DomainEvent):
+    """
+    评论已创建
+    """
+
+    comment_id: int
+    parent_id: Optional[int]
+    created_by: str
+
+
+@dataclass(frozen=True)
+class CommentDeleted(DomainEvent):
+    """
+    评论已删除, cascade 为 True 时整棵子树一起被删除, 否则其直接回复成为根评论
+    """
+
+    comment_id: int
+    parent_id: Optional[int]
+    cascade: bool = False
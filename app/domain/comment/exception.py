@@ -3,3 +3,10 @@ class CommentDoesNotExistError(Exception):
 
     def __str__(self):
         return CommentDoesNotExistError.message
+
+
+class ParentCommentDoesNotExistError(Exception):
+    message = "父评论不存在或已被删除"
+
+    def __str__(self):
+        return ParentCommentDoesNotExistError.message
@@ -0,0 +1,229 @@
+"""
+紧凑的评论森林
+
+CommentTreeNode 每个节点都是带 __dict__ 的对象, 另有 children 列表、两个 datetime 与若干 str/int 对象, 百万级节点需要数 GB 内存
+CommentForest 按列存储同样的数据: 每个字段一个 array, 节点按 id 升序排列, 节点之间通过数组下标
+(父节点、第一个子节点、下一个兄弟节点)相连, 全部评论内容以 UTF-8 拼接在一个字节串中, 按偏移量切片读取,
+created_by 与时区这类重复度很高的值只保存一份, 每个节点只记录其下标
+
+CommentForestNode 是按下标读取数组的只读视图, 字段与 CommentTreeNode 相同, 只在访问时创建
+"""
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, tzinfo
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+# 表示 None 的时间戳
+NULL_TIMESTAMP = -(2**63)
+# 表示没有父节点、子节点或兄弟节点的下标
+NULL_INDEX = -1
+
+
+class CommentForestNode(object):
+    """
+    CommentForest 中一个节点的只读视图
+    """
+
+    __slots__ = ("forest", "index")
+
+    def __init__(self, forest: "CommentForest", index: int):
+        self.forest = forest
+        self.index = index
+
+    @property
+    def id(self) -> int:
+        return self.forest.ids[self.index]
+
+    @property
+    def parent_id(self) -> Optional[int]:
+        parent = self.forest.parents[self.index]
+        return None if parent == NULL_INDEX else self.forest.ids[parent]
+
+    @property
+    def content(self) -> str:
+        return self.forest.content(self.index)
+
+    @property
+    def created_by(self) -> str:
+        return self.forest.authors[self.forest.author_indexes[self.index]]
+
+    @property
+    def created_at(self) -> Optional[datetime]:
+        forest = self.forest
+        return forest.timestamp(forest.created_at[self.index], forest.created_at_zones[self.index])
+
+    @property
+    def updated_at(self) -> Optional[datetime]:
+        forest = self.forest
+        return forest.timestamp(forest.updated_at[self.index], forest.updated_at_zones[self.index])
+
+    @property
+    def reply_count(self) -> int:
+        return self.forest.reply_counts[self.index]
+
+    @property
+    def descendant_count(self) -> int:
+        return self.forest.descendant_counts[self.index]
+
+    @property
+    def children_cursor(self) -> Optional[str]:
+        # CommentForest 总是包含全部子评论
+        return None
+
+    @property
+    def children(self) -> List["CommentForestNode"]:
+        return [CommentForestNode(self.forest, index) for index in self.forest.iter_children(self.index)]
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, CommentForestNode) and self.forest is other.forest and self.index == other.index
+
+    def __hash__(self) -> int:
+        return hash((id(self.forest), self.index))
+
+    def __repr__(self) -> str:
+        return f"CommentForestNode(id={self.id}, parent_id={self.parent_id})"
+
+
+class CommentForest(object):
+    """
+    按列存储的只读评论森林, 根节点顺序与 CommentRepository.find_all 一致(按 (created_at, id) 倒序), 子节点按 (created_at, id) 升序
+    """
+
+    def __init__(self):
+        self.ids = array("q")
+        self.parents = array("i")
+        self.first_children = array("i")
+        self.next_siblings = array("i")
+        # 第 i 条评论的内容为 contents[content_offsets[i]:content_offsets[i + 1]]
+        self.contents = b""
+        self.content_offsets = array("q", [0])
+        self.authors: List[str] = []
+        self.author_indexes = array("i")
+        # 时间以本地时间(不含时区)距 EPOCH 的微秒数保存, 时区保存在 zones 中, 节点只记录下标
+        self.zones: List[Optional[tzinfo]] = []
+        self.created_at = array("q")
+        self.created_at_zones = array("B")
+        self.updated_at = array("q")
+        self.updated_at_zones = array("B")
+        self.reply_counts = array("i")
+        self.descendant_counts = array("i")
+        self.roots = array("i")
+
+    @classmethod
+    def from_rows(cls, rows: Iterable) -> "CommentForest":
+        """
+        :param rows: 包含 COMMENT_TREE_COLUMNS 各字段的行, 必须按 id 升序排列, 可以是逐批读取的迭代器
+        父评论不在结果集中(例如已被删除)的评论与 get_comments_tree 一致, 不会出现在任何一棵评论树中
+        """
+        forest = cls()
+        contents = bytearray()
+        authors: Dict[str, int] = {}
+        zones: Dict[Optional[tzinfo], int] = {}
+        parent_ids = array("q")
+        roots: List[Tuple[datetime, int, int]] = []
+        for row in rows:
+            index = len(forest.ids)
+            forest.ids.append(row.id)
+            parent_ids.append(NULL_INDEX if row.parent_id is None else row.parent_id)
+            if row.parent_id is None:
+                roots.append((row.created_at, row.id, index))
+            contents += row.content.encode("utf-8")
+            forest.content_offsets.append(len(contents))
+            forest.author_indexes.append(authors.setdefault(row.created_by, len(authors)))
+            for value, timestamps, timestamp_zones in (
+                (row.created_at, forest.created_at, forest.created_at_zones),
+                (row.updated_at, forest.updated_at, forest.updated_at_zones),
+            ):
+                if value is None:
+                    timestamps.append(NULL_TIMESTAMP)
+                    timestamp_zones.append(0)
+                else:
+                    timestamps.append((value.replace(tzinfo=None) - EPOCH) // MICROSECOND)
+                    timestamp_zones.append(zones.setdefault(value.tzinfo, len(zones)))
+            forest.reply_counts.append(row.reply_count)
+            forest.descendant_counts.append(row.descendant_count)
+        forest.contents = bytes(contents)
+        forest.authors = list(authors)
+        forest.zones = list(zones)
+        forest._link(parent_ids)
+        roots.sort(reverse=True)
+        forest.roots = array("i", [index for _, _, index in roots])
+        return forest
+
+    def _link(self, parent_ids: array) -> None:
+        """
+        按 id 查找父节点下标并把每个节点接到父节点的子节点链表末尾, 节点按 (created_at, id) 升序处理, 子节点因此按此顺序排列
+        """
+        size = len(self.ids)
+        self.parents = array("i", [NULL_INDEX]) * size
+        self.first_children = array("i", [NULL_INDEX]) * size
+        self.next_siblings = array("i", [NULL_INDEX]) * size
+        last_children = array("i", [NULL_INDEX]) * size
+        order: Iterable[int] = range(size)
+        if any(previous > current for previous, current in zip(self.created_at, islice(self.created_at, 1, None))):
+            # 节点按 id 升序存储, 稳定排序后创建时间相同的节点仍按 id 升序
+            order = sorted(order, key=self.created_at.__getitem__)
+        for index in order:
+            parent_id = parent_ids[index]
+            if parent_id == NULL_INDEX:
+                continue
+            parent = bisect_left(self.ids, parent_id)
+            if parent == size or self.ids[parent] != parent_id:
+                continue
+            self.parents[index] = parent
+            if last_children[parent] == NULL_INDEX:
+                self.first_children[parent] = index
+            else:
+                self.next_siblings[last_children[parent]] = index
+            last_children[parent] = index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        数组与内容缓冲区占用的字节数, 不含 authors / zones 中的对象
+        """
+        arrays = (
+            self.ids,
+            self.parents,
+            self.first_children,
+            self.next_siblings,
+            self.content_offsets,
+            self.author_indexes,
+            self.created_at,
+            self.created_at_zones,
+            self.updated_at,
+            self.updated_at_zones,
+            self.reply_counts,
+            self.descendant_counts,
+            self.roots,
+        )
+        return len(self.contents) + sum(len(values) * values.itemsize for values in arrays)
+
+    def content(self, index: int) -> str:
+        return self.contents[self.content_offsets[index] : self.content_offsets[index + 1]].decode("utf-8")
+
+    def timestamp(self, value: int, zone: int) -> Optional[datetime]:
+        if value == NULL_TIMESTAMP:
+            return None
+        return (EPOCH + timedelta(microseconds=value)).replace(tzinfo=self.zones[zone])
+
+    def iter_children(self, index: int) -> Iterator[int]:
+        child = self.first_children[index]
+        while child != NULL_INDEX:
+            yield child
+            child = self.next_siblings[child]
+
+    def find(self, comment_id: int) -> Optional[CommentForestNode]:
+        index = bisect_left(self.ids, comment_id)
+        if index == len(self.ids) or self.ids[index] != comment_id:
+            return None
+        return CommentForestNode(self, index)
+
+    def root_nodes(self) -> List[CommentForestNode]:
+        return [CommentForestNode(self, index) for index in self.roots]
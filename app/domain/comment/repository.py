@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import Optional, List
+from datetime import datetime
+from typing import Optional, List, Tuple, Iterator, Iterable, Dict
 
-from app.domain.comment import Comment
+from app.domain.comment import Comment, CommentTreeNode, CommentForest
 
 
 class CommentBaseRepository(ABC):
@@ -13,17 +14,139 @@ class CommentBaseRepository(ABC):
     def find(self, comment_id: int) -> Optional[Comment]:
         raise NotImplementedError
 
-    def find_all(self) -> List[Comment]:
+    @abstractmethod
+    def find_many(self, comment_ids: Iterable[int]) -> List[Comment]:
+        """
+        按 id 批量获取评论, 不存在的评论不在结果中
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_lineages(self, comment_ids: Iterable[int]) -> Dict[int, List[int]]:
+        """
+        批量获取评论自身及其全部祖先评论的 id
+        :return: 评论 id -> 祖先评论与自身的 id 列表, 不存在的评论不在结果中
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_all(self, max_children: Optional[int] = None, max_depth: Optional[int] = None) -> List[CommentTreeNode]:
+        """
+        获取全部根评论及其子评论, 参数与 find_tree 相同, 都为 None 时返回整个评论森林
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_all_compact(self, batch_size: int = 10000) -> CommentForest:
+        """
+        与 find_all 相同, 以按列存储的 CommentForest 返回整个评论森林
+        :param batch_size: 每批从数据库读取的条数
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_page(
+        self,
+        limit: int,
+        after: Optional[Tuple[datetime, int]] = None,
+        max_children: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> Tuple[List[CommentTreeNode], bool]:
+        """
+        按 (created_at, id) 倒序获取一页根评论及其子评论
+        :param limit: 每页根评论数量
+        :param after: 上一页最后一条根评论的 (created_at, id), 为 None 时获取第一页
+        :param max_children: 参考 find_tree
+        :param max_depth: 参考 find_tree
+        :return: (评论树列表, 是否还有下一页)
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_tree(
+        self, comment_id: int, max_depth: Optional[int] = None, max_children: Optional[int] = None
+    ) -> Optional[CommentTreeNode]:
+        """
+        获取单条评论及其子孙评论
+        :param max_depth: 最多向下获取的层数, 为 None 时不限制
+        :param max_children: 每条评论最多获取的直接回复数, 按 (created_at, id) 取最早的回复, 为 None 时不限制
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_children(
+        self,
+        comment_id: int,
+        limit: int,
+        after: Optional[Tuple[datetime, int]] = None,
+        max_children: Optional[int] = None,
+        max_depth: Optional[int] = 0,
+    ) -> Tuple[List[CommentTreeNode], bool]:
+        """
+        按 (created_at, id) 顺序获取一页直接回复及其子评论
+        :param limit: 每页回复数量
+        :param after: 上一页最后一条回复的 (created_at, id), 为 None 时获取第一页
+        :param max_children: 参考 find_tree
+        :param max_depth: 参考 find_tree, 默认只获取回复本身
+        :return: (评论树列表, 是否还有下一页)
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_descendants(self, comment_id: int) -> List[Comment]:
+        """
+        按展示顺序(先序遍历, 同级按 (created_at, id) 升序)获取单条评论及其全部子孙评论
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def stream_all(self, batch_size: int = 1000) -> Iterator[Tuple[Comment, Optional[int]]]:
+        """
+        按 id 顺序逐批读取全部评论, 父评论总在子评论之前
+        :param batch_size: 每批从数据库读取的条数
+        :return: (评论, 层级) 的迭代器, 根评论为第 0 层, 层级未知时为 None
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(self, query: str, limit: int, offset: int = 0) -> Tuple[List[Tuple[Comment, str]], bool]:
+        """
+        按内容全文搜索评论, 空白分隔的多个词需要同时匹配
+        结果只在最新的 1000 条匹配结果中按相关度排序与分页; 只包含短词(少于 3 个字符)的查询只匹配最新的 10000 条评论, 按时间倒序
+        :return: ((评论, 高亮了匹配内容的摘要) 列表, 是否还有下一页)
+        """
         raise NotImplementedError
 
     @abstractmethod
     def save(self, comment: Comment) -> Optional[Comment]:
         raise NotImplementedError
 
+    @abstractmethod
+    def save_all(
+        self, comments: List[Comment], parent_indexes: List[Optional[int]], emit_events: bool = True
+    ) -> List[int]:
+        """
+        在一个事务中批量新增评论
+        SQLite 上预先分配 id 后一次写入全部评论, 其他数据库上逐条写入由数据库分配 id
+        :param comments: 待新增的评论, parent_id 指向已有评论
+        :param parent_indexes: 与 comments 一一对应, 父评论在同一批次中的下标, 必须小于自身下标, 为 None 时使用 parent_id
+        :param emit_events: 为 False 时不为每条评论写入 CommentCreated 事件, 用于离线导入等没有订阅者关心的大批量写入
+        :return: 新增评论的 id, 与 comments 一一对应
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def remove(self, comment_id: int):
         raise NotImplementedError
 
+    @abstractmethod
+    def remove_tree(self, comment_id: int) -> int:
+        """
+        在一个事务中删除评论及其全部子孙评论
+        :return: 删除的评论条数, 评论不存在时为 0
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def count(self) -> int:
         raise NotImplementedError
@@ -0,0 +1,27 @@
+from dataclasses import dataclass, asdict
+from typing import ClassVar, Dict, Type, Any
+
+
+@dataclass(frozen=True)
+class DomainEvent:
+    """
+    Domain Event 基类, 事件只包含可以直接序列化为 JSON 的字段
+    """
+
+    # 事件名 -> 事件类, 用于从 outbox 中还原事件
+    registry: ClassVar[Dict[str, Type["DomainEvent"]]] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        DomainEvent.registry[cls.__name__] = cls
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+    def to_payload(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @staticmethod
+    def from_payload(name: str, payload: Dict[str, Any]) -> "DomainEvent":
+        return DomainEvent.registry[name](**payload)
@@ -2,3 +2,4 @@ from .entity import User
 from .repository import UserBaseRepository
 from .vo import Email
 from .exception import UserDoesNotExistError, UserIsAlreadyExistsError
+from .event import UserDeleted
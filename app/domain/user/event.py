@@ -0,0 +1,13 @@
+from dataclasses import dataclass
+
+from app.domain.event import DomainEvent
+
+
+@dataclass(frozen=True)
+class UserDeleted(DomainEvent):
+    """
+    用户已删除
+    """
+
+    user_id: int
+    username: str
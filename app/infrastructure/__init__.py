@@ -1,2 +1,3 @@
-from .comment import CommentDO, CommentRepository
-from .user import UserDO, UserRepository
+from .comment import CommentDO, CommentRepository, AsyncCommentRepository
+from .user import UserDO, UserRepository, AsyncUserRepository
+from .outbox import OutboxEventDO, OutboxRepository, OutboxDispatcher, outbox_dispatcher
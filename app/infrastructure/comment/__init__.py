@@ -1,2 +1,2 @@
-from .repository import CommentRepository
-from .do import CommentDO
+from .repository import CommentRepository, AsyncCommentRepository
+from .do import CommentDO, CommentStatDO
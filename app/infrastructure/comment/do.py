@@ -1,10 +1,10 @@
+import re
 from datetime import datetime
-from typing import List
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from sqlalchemy import Column, Integer, DateTime, String
+from sqlalchemy import Column, Integer, DateTime, String, Index, event
 from sqlalchemy import Text, ForeignKey
 from sqlalchemy.orm import relationship
-from sqlalchemy.orm.collections import InstrumentedList
 
 from app.domain.comment import Comment, CommentTreeNode
 from app.infrastructure.database import Base
@@ -16,6 +16,10 @@ class CommentDO(Base):
     """
 
     __tablename__ = "comment"
+    __table_args__ = (
+        # 支持按 (created_at, id) 对根评论做键集分页, 同时作为 parent_id 上的索引查找子评论
+        Index("ix_comment_parent_id_created_at_id", "parent_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True)
     content = Column(Text(200), nullable=False)
@@ -24,6 +28,11 @@ class CommentDO(Base):
     created_by = Column(String(200), nullable=False)
     created_at = Column(DateTime(timezone=True), nullable=False)
     updated_at = Column(DateTime(timezone=True), nullable=True)
+    # 物化路径: 从根评论到自身的 id 依次补零拼接, 按 path 排序即为展示顺序, 参考 make_comment_path
+    path = Column(String, nullable=True, index=True)
+    # 反范式的计数器, 在 CommentRepository 的 save/remove 中与评论在同一事务内更新, 参考 rebuild_comment_counters
+    reply_count = Column(Integer, nullable=False, default=0, server_default="0")
+    descendant_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     def __repr__(self):
         return f"CommentDO(id={self.id!r}, content={self.content!r}, parent_id={self.parent_id!r})"
@@ -39,6 +48,8 @@ class CommentDO(Base):
             created_by=self.created_by,
             created_at=self.created_at,
             updated_at=self.updated_at,
+            reply_count=self.reply_count or 0,
+            descendant_count=self.descendant_count or 0,
         )
 
     @staticmethod
@@ -56,27 +67,188 @@ class CommentDO(Base):
         )
 
 
-def get_comments_tree(comment_dos: List[CommentDO]) -> List[CommentTreeNode]:
+class CommentStatDO(Base):
+    """
+    Comment Statistics Data Object, 按名称保存全局计数, 避免每次 COUNT(*) 全表扫描
+    """
+
+    __tablename__ = "comment_stat"
+
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"CommentStatDO(name={self.name!r}, value={self.value!r})"
+
+
+# 评论内容的全文索引: FTS5 外部内容表, 只保存倒排索引, 内容从 comment 表读取, 由触发器与 comment 表保持同步
+# trigram 分词对中文与英文都按任意 3 个字符的子串建立索引, 不需要额外的分词器
+COMMENT_SEARCH_TABLE = "comment_fts"
+COMMENT_SEARCH_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {COMMENT_SEARCH_TABLE} "
+    "USING fts5(content, content='comment', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {COMMENT_SEARCH_TABLE}_insert AFTER INSERT ON comment BEGIN "
+    f"INSERT INTO {COMMENT_SEARCH_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+    f"CREATE TRIGGER IF NOT EXISTS {COMMENT_SEARCH_TABLE}_delete AFTER DELETE ON comment BEGIN "
+    f"INSERT INTO {COMMENT_SEARCH_TABLE}({COMMENT_SEARCH_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); END",
+    f"CREATE TRIGGER IF NOT EXISTS {COMMENT_SEARCH_TABLE}_update AFTER UPDATE OF content ON comment BEGIN "
+    f"INSERT INTO {COMMENT_SEARCH_TABLE}({COMMENT_SEARCH_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); "
+    f"INSERT INTO {COMMENT_SEARCH_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+)
+
+
+@event.listens_for(CommentDO.__table__, "after_create")
+def create_comment_search(target, connection, **kwargs) -> None:
+    """
+    创建 comment 表时同时创建全文索引与同步触发器, 只支持 SQLite; 已有数据库由 upgrade_tables 调用 upgrade_comment_search
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in COMMENT_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+
+
+def upgrade_comment_search(connection) -> None:
+    """
+    已有数据库缺少全文索引时创建索引与同步触发器, 并为已有评论建立索引, 只支持 SQLite
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (COMMENT_SEARCH_TABLE,)
+    ).first()
+    for statement in COMMENT_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        connection.exec_driver_sql(f"INSERT INTO {COMMENT_SEARCH_TABLE}({COMMENT_SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+# upgrade_tables 补全字段与索引后调用
+CommentDO.__table__.info["upgrade"] = upgrade_comment_search
+
+# trigram 索引能够匹配的最短词长
+SEARCH_MIN_TERM_LENGTH = 3
+# 按相关度排序时参与排序的最新匹配结果条数, 只在这些结果中分页, 翻页时结果的顺序不变
+SEARCH_RANK_WINDOW = 1000
+# 只包含短词(无法使用 trigram 索引)的查询只在最新的 SEARCH_SCAN_WINDOW 条评论中逐条匹配, 不扫描整张表
+SEARCH_SCAN_WINDOW = 10000
+# 搜索结果摘要中标记匹配内容的符号, 不使用 HTML 标签, 前端展示时不需要额外转义
+SNIPPET_START = "【"
+SNIPPET_END = "】"
+# 摘要的最大字符数
+SNIPPET_LENGTH = 32
+
+
+def make_snippet(content: str, terms: List[str]) -> str:
+    """
+    截取第一处匹配附近的内容作为摘要, 标记出全部匹配的词
+    """
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+    found = pattern.search(content)
+    start = max(0, (found.start() if found else 0) - SNIPPET_LENGTH // 4)
+    end = start + SNIPPET_LENGTH
+    fragment = pattern.sub(lambda match: f"{SNIPPET_START}{match.group()}{SNIPPET_END}", content[start:end])
+    return ("…" if start > 0 else "") + fragment + ("…" if end < len(content) else "")
+
+
+# 评论总数在 comment_stat 中的名称
+COMMENT_COUNT_STAT = "comment_count"
+
+# 物化路径中每一级 id 的固定宽度
+PATH_SEGMENT_WIDTH = 10
+
+
+def make_comment_path(parent_path: Optional[str], comment_id: int) -> str:
+    """
+    生成评论的物化路径, 例如 id 为 5 的评论回复了 id 为 1 的根评论, 路径为 00000000010000000005
+    """
+    return (parent_path or "") + str(comment_id).zfill(PATH_SEGMENT_WIDTH)
+
+
+def get_path_upper_bound(path: str) -> str:
+    """
+    子孙评论的路径都以 path 为前缀且只包含数字, 因此都落在 [path, path + ":") 区间内, 可以直接走索引范围扫描
+    """
+    return path + ":"
+
+
+def get_path_depth(path: str) -> int:
+    """
+    根据物化路径计算评论深度, 根评论为 0
+    """
+    return len(path) // PATH_SEGMENT_WIDTH - 1
+
+
+def get_path_ids(path: str) -> List[int]:
+    """
+    从物化路径中解析出从根评论到自身的 id 列表
+    """
+    return [int(path[start : start + PATH_SEGMENT_WIDTH]) for start in range(0, len(path), PATH_SEGMENT_WIDTH)]
+
+
+# 构建评论树时需要读取的列, 只查询列而不加载 ORM 对象, 避免 identity map 与懒加载的开销
+COMMENT_TREE_COLUMNS = (
+    CommentDO.id,
+    CommentDO.parent_id,
+    CommentDO.content,
+    CommentDO.created_by,
+    CommentDO.created_at,
+    CommentDO.updated_at,
+    CommentDO.reply_count,
+    CommentDO.descendant_count,
+)
+
+
+def link_comment_nodes(rows: Iterable) -> Tuple[Dict[int, CommentTreeNode], List[CommentTreeNode]]:
+    """
+    将扁平的评论行在内存中组装成树, 子节点与 find_children 的分页顺序一致, 按 (created_at, id) 升序排列
+    :param rows: 包含 COMMENT_TREE_COLUMNS 各字段的行, 已按 (created_at, id) 排列时(例如按时间顺序写入的评论按 id 读取)排序为 O(n)
+    :return: (id 到节点的映射, parent_id 为 None 的根节点列表)
+    """
+    nodes: Dict[int, CommentTreeNode] = {}
+    parent_ids: List[Tuple[CommentTreeNode, Optional[int]]] = []
+    for row in rows:
+        node = CommentTreeNode(
+            id=row.id,
+            content=row.content,
+            created_by=row.created_by,
+            created_at=row.created_at,
+            updated_at=row.updated_at,
+            reply_count=row.reply_count,
+            descendant_count=row.descendant_count,
+        )
+        nodes[row.id] = node
+        parent_ids.append((node, row.parent_id))
+    # 导入的评论 id 顺序与创建时间不一致, 按 (created_at, id) 接入父节点
+    # 与 SQLite 中按保存的本地时间排序一致, 比较时忽略时区
+    parent_ids.sort(key=lambda item: (item[0].created_at.replace(tzinfo=None), item[0].id))
+    roots: List[CommentTreeNode] = []
+    for node, parent_id in parent_ids:
+        if parent_id is None:
+            roots.append(node)
+            continue
+        parent = nodes.get(parent_id)
+        # 父评论不在结果集中(例如已被删除)的子评论不会出现在树中
+        if parent is not None:
+            parent.children.append(node)
+    return nodes, roots
+
+
+def get_comments_tree(rows: Iterable) -> List[CommentTreeNode]:
     """
     获取整个评论树及其子节点
-    :param comment_dos: parent_id 为 None 的 CommentDo 列表
-    :return: List[CommentTreeNode]
+    :param rows: 全部评论行, 参考 link_comment_nodes
+    :return: 按创建时间倒序排列的根节点列表
     """
-    return [get_comment_tree(comment_do) for comment_do in comment_dos]
+    _, roots = link_comment_nodes(rows)
+    roots.sort(key=lambda node: (node.created_at, node.id), reverse=True)
+    return roots
 
 
-def get_comment_tree(comment_do: CommentDO) -> CommentTreeNode:
+def get_comment_tree(rows: Iterable, comment_id: int) -> Optional[CommentTreeNode]:
     """
-    递归获取单条评论下的子节点, 包括自身
+    获取单条评论下的子节点, 包括自身
+    :param rows: 该评论及其子孙评论的行, 参考 link_comment_nodes
     """
-    comment_tree = CommentTreeNode(
-        id=comment_do.id,
-        content=comment_do.content,
-        created_by=comment_do.created_by,
-        created_at=comment_do.created_at,
-        updated_at=comment_do.updated_at,
-    )
-    children: InstrumentedList = comment_do.children
-    if children:
-        comment_tree.children = [get_comment_tree(child) for child in children]
-    return comment_tree
+    nodes, _ = link_comment_nodes(rows)
+    return nodes.get(comment_id)
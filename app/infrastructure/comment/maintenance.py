@@ -0,0 +1,92 @@
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm.session import Session
+
+from app.infrastructure.comment.do import CommentDO, CommentStatDO, COMMENT_COUNT_STAT, make_comment_path
+from app.infrastructure.comment.do import COMMENT_SEARCH_TABLE, COMMENT_SEARCH_DDL
+
+
+def backfill_comment_paths(session: Session, batch_size: int = 1000) -> int:
+    """
+    为已有数据补全物化路径
+    父评论一定先于子评论创建, 按 id 升序遍历时父评论的路径总是已经计算完毕, 整体为 O(n)
+    :return: 更新的评论条数
+    """
+    rows = session.execute(select(CommentDO.id, CommentDO.parent_id, CommentDO.path).order_by(CommentDO.id)).all()
+    paths: Dict[int, Optional[str]] = {}
+    changes: List[Dict] = []
+    for comment_id, parent_id, old_path in rows:
+        if parent_id is None:
+            path = make_comment_path(None, comment_id)
+        elif paths.get(parent_id) is not None:
+            path = make_comment_path(paths[parent_id], comment_id)
+        else:
+            # 父评论已不存在, 该评论不在任何一棵评论树中
+            path = None
+        paths[comment_id] = path
+        if path != old_path:
+            changes.append({"comment_id": comment_id, "path": path})
+
+    statement = (
+        update(CommentDO.__table__).where(CommentDO.id == bindparam("comment_id")).values(path=bindparam("path"))
+    )
+    for start in range(0, len(changes), batch_size):
+        session.execute(statement, changes[start : start + batch_size])
+        session.commit()
+    return len(changes)
+
+
+def rebuild_comment_counters(session: Session, batch_size: int = 1000) -> int:
+    """
+    根据 parent_id 重新计算全部评论的回复数、子孙数以及评论总数, 用于修复计数器
+    子评论的 id 总是大于父评论, 按 id 倒序遍历时子评论的子孙数总是已经计算完毕, 整体为 O(n)
+    :return: 计数被修正的评论条数
+    """
+    rows = session.execute(
+        select(CommentDO.id, CommentDO.parent_id, CommentDO.reply_count, CommentDO.descendant_count).order_by(
+            CommentDO.id.desc()
+        )
+    ).all()
+    reply_counts: Dict[int, int] = {comment_id: 0 for comment_id, *_ in rows}
+    descendant_counts: Dict[int, int] = dict(reply_counts)
+    for comment_id, parent_id, *_ in rows:
+        if parent_id in reply_counts:
+            reply_counts[parent_id] += 1
+            descendant_counts[parent_id] += descendant_counts[comment_id] + 1
+
+    changes: List[Dict] = [
+        {
+            "comment_id": comment_id,
+            "reply_count": reply_counts[comment_id],
+            "descendant_count": descendant_counts[comment_id],
+        }
+        for comment_id, _, reply_count, descendant_count in rows
+        if (reply_count, descendant_count) != (reply_counts[comment_id], descendant_counts[comment_id])
+    ]
+    statement = (
+        update(CommentDO.__table__)
+        .where(CommentDO.id == bindparam("comment_id"))
+        .values(reply_count=bindparam("reply_count"), descendant_count=bindparam("descendant_count"))
+    )
+    for start in range(0, len(changes), batch_size):
+        session.execute(statement, changes[start : start + batch_size])
+        session.commit()
+    session.merge(CommentStatDO(name=COMMENT_COUNT_STAT, value=len(rows)))
+    session.commit()
+    return len(changes)
+
+
+def rebuild_comment_search(session: Session) -> int:
+    """
+    为已有数据库创建全文索引与同步触发器, 并根据 comment 表重建索引内容, 只支持 SQLite
+    :return: 建立索引的评论条数
+    """
+    connection = session.connection()
+    if connection.dialect.name != "sqlite":
+        return 0
+    for statement in COMMENT_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+    connection.exec_driver_sql(f"INSERT INTO {COMMENT_SEARCH_TABLE}({COMMENT_SEARCH_TABLE}) VALUES ('rebuild')")
+    session.commit()
+    return session.query(CommentDO).count()
@@ -1,10 +1,23 @@
-from typing import Optional, List
+from datetime import datetime
+from collections import Counter, defaultdict
+from typing import Optional, List, Tuple, Iterator, Dict, Iterable
 
+from sqlalchemy import select, literal, tuple_, update, insert, delete, bindparam, func
 from sqlalchemy.exc import NoResultFound
+from sqlalchemy.orm import aliased
 from sqlalchemy.orm.session import Session
+from sqlalchemy.sql import Select, table, column, literal_column
+from sqlalchemy.sql.elements import ColumnElement
 
-from app.domain.comment import CommentBaseRepository, Comment, CommentTreeNode
-from app.infrastructure.comment.do import CommentDO, get_comments_tree
+from app.domain.comment import CommentBaseRepository, Comment, CommentTreeNode, CommentCreated, CommentDeleted
+from app.domain.comment import CommentForest, ParentCommentDoesNotExistError
+from app.infrastructure.comment.do import CommentDO, COMMENT_TREE_COLUMNS, get_comments_tree, get_comment_tree
+from app.infrastructure.comment.do import link_comment_nodes
+from app.infrastructure.comment.do import CommentStatDO, COMMENT_COUNT_STAT, COMMENT_SEARCH_TABLE
+from app.infrastructure.comment.do import SEARCH_MIN_TERM_LENGTH, SEARCH_RANK_WINDOW, SEARCH_SCAN_WINDOW, make_snippet
+from app.infrastructure.comment.do import make_comment_path, get_path_upper_bound, get_path_depth, get_path_ids
+from app.infrastructure.database import AsyncRepository
+from app.infrastructure.outbox.repository import OutboxRepository
 
 
 class CommentRepository(CommentBaseRepository):
@@ -23,18 +36,175 @@ class CommentRepository(CommentBaseRepository):
         else:
             return comment_do.to_entity()
 
-    def find_all(self) -> List[CommentTreeNode]:
+    def find_many(self, comment_ids: Iterable[int]) -> List[Comment]:
         comment_dos: List[CommentDO] = (
-            self.session.query(CommentDO).filter_by(parent_id=None).order_by(CommentDO.created_at.desc())
+            self.session.query(CommentDO).filter(CommentDO.id.in_(list(comment_ids))).order_by(CommentDO.id).all()
         )
-        return get_comments_tree(comment_dos)
+        return [comment_do.to_entity() for comment_do in comment_dos]
+
+    def find_lineages(self, comment_ids: Iterable[int]) -> Dict[int, List[int]]:
+        rows = self.session.query(CommentDO.id, CommentDO.path).filter(CommentDO.id.in_(list(comment_ids)))
+        return {
+            comment_id: get_path_ids(path) if path else self.find_ancestor_ids(comment_id)
+            for comment_id, path in rows.all()
+        }
+
+    def find_all(self, max_children: Optional[int] = None, max_depth: Optional[int] = None) -> List[CommentTreeNode]:
+        if max_children is not None or max_depth is not None:
+            rows = self.session.execute(select_subtrees(CommentDO.parent_id.is_(None), max_depth, max_children)).all()
+            return get_comments_tree(rows)
+        # 一次查询读取全部评论, 在内存中组装评论树, 避免逐个节点懒加载 children
+        rows = self.session.query(*COMMENT_TREE_COLUMNS).order_by(CommentDO.id).all()
+        return get_comments_tree(rows)
+
+    def find_all_compact(self, batch_size: int = 10000) -> CommentForest:
+        # 逐批读取评论行直接写入数组, 不创建 CommentTreeNode, 内存占用只有 find_all 的一小部分
+        result = self.session.execute(
+            select(*COMMENT_TREE_COLUMNS)
+            .order_by(CommentDO.id)
+            .execution_options(stream_results=True, yield_per=batch_size)
+        )
+        return CommentForest.from_rows(result)
+
+    def find_page(
+        self,
+        limit: int,
+        after: Optional[Tuple[datetime, int]] = None,
+        max_children: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> Tuple[List[CommentTreeNode], bool]:
+        query = self.session.query(CommentDO.id).filter(CommentDO.parent_id.is_(None))
+        if after:
+            created_at, comment_id = after
+            # 行值比较可以直接作为索引的范围条件, 翻到任何一页的开销都相同, 不依赖 OFFSET
+            query = query.filter(
+                tuple_(CommentDO.created_at, CommentDO.id)
+                < tuple_(literal(created_at, CommentDO.created_at.type), literal(comment_id, CommentDO.id.type))
+            )
+        # 多取一条用于判断是否还有下一页
+        root_ids = [
+            root_id for (root_id,) in query.order_by(CommentDO.created_at.desc(), CommentDO.id.desc()).limit(limit + 1)
+        ]
+        has_more = len(root_ids) > limit
+        root_ids = root_ids[:limit]
+        if not root_ids:
+            return [], False
+        rows = self.session.execute(select_subtrees(CommentDO.id.in_(root_ids), max_depth, max_children)).all()
+        return get_comments_tree(rows), has_more
+
+    def find_tree(
+        self, comment_id: int, max_depth: Optional[int] = None, max_children: Optional[int] = None
+    ) -> Optional[CommentTreeNode]:
+        rows = self.session.execute(select_subtrees(CommentDO.id == comment_id, max_depth, max_children)).all()
+        return get_comment_tree(rows, comment_id)
+
+    def find_children(
+        self,
+        comment_id: int,
+        limit: int,
+        after: Optional[Tuple[datetime, int]] = None,
+        max_children: Optional[int] = None,
+        max_depth: Optional[int] = 0,
+    ) -> Tuple[List[CommentTreeNode], bool]:
+        query = self.session.query(CommentDO.id).filter(CommentDO.parent_id == comment_id)
+        if after:
+            created_at, child_id = after
+            query = query.filter(
+                tuple_(CommentDO.created_at, CommentDO.id)
+                > tuple_(literal(created_at, CommentDO.created_at.type), literal(child_id, CommentDO.id.type))
+            )
+        # 沿 (parent_id, created_at, id) 索引顺序读取, 多取一条用于判断是否还有下一页
+        child_ids = [child_id for (child_id,) in query.order_by(CommentDO.created_at, CommentDO.id).limit(limit + 1)]
+        has_more = len(child_ids) > limit
+        child_ids = child_ids[:limit]
+        if not child_ids:
+            return [], False
+        rows = self.session.execute(select_subtrees(CommentDO.id.in_(child_ids), max_depth, max_children)).all()
+        nodes, _ = link_comment_nodes(rows)
+        return [nodes[child_id] for child_id in child_ids if child_id in nodes], has_more
+
+    def find_descendants(self, comment_id: int) -> List[Comment]:
+        path: Optional[str] = self.session.query(CommentDO.path).filter_by(id=comment_id).scalar()
+        if path is None:
+            return []
+        rows = (
+            self.session.query(*COMMENT_TREE_COLUMNS)
+            .filter(CommentDO.path >= path, CommentDO.path < get_path_upper_bound(path))
+            .order_by(CommentDO.path)
+        )
+        # 按路径排序时同级评论按 id 排列, 导入的评论 id 顺序可能与创建时间不一致, 在内存中按 (created_at, id) 重新排列同级评论
+        comments = [
+            Comment(
+                id=row.id,
+                content=row.content,
+                parent_id=row.parent_id,
+                created_by=row.created_by,
+                created_at=row.created_at,
+                updated_at=row.updated_at,
+                reply_count=row.reply_count,
+                descendant_count=row.descendant_count,
+            )
+            for row in rows
+        ]
+        if not comments:
+            return []
+        children: Dict[int, List[Comment]] = defaultdict(list)
+        for comment in sorted(comments[1:], key=lambda comment: (comment.created_at.replace(tzinfo=None), comment.id)):
+            children[comment.parent_id].append(comment)
+        ordered: List[Comment] = []
+        stack = [comments[0]]
+        while stack:
+            comment = stack.pop()
+            ordered.append(comment)
+            stack.extend(reversed(children.get(comment.id, ())))
+        return ordered
+
+    def stream_all(self, batch_size: int = 1000) -> Iterator[Tuple[Comment, Optional[int]]]:
+        # 服务端游标 + yield_per 逐批读取, 内存占用与评论总数无关
+        result = self.session.execute(
+            select(*COMMENT_TREE_COLUMNS, CommentDO.path)
+            .order_by(CommentDO.id)
+            .execution_options(stream_results=True, yield_per=batch_size)
+        )
+        for rows in result.partitions(batch_size):
+            for row in rows:
+                comment = Comment(
+                    id=row.id,
+                    content=row.content,
+                    parent_id=row.parent_id,
+                    created_by=row.created_by,
+                    created_at=row.created_at,
+                    updated_at=row.updated_at,
+                    reply_count=row.reply_count,
+                    descendant_count=row.descendant_count,
+                )
+                yield comment, get_path_depth(row.path) if row.path else None
 
     def save(self, comment: Comment) -> Optional[Comment]:
         if not comment.id:
             # Create
             comment_do = CommentDO.from_entity(comment)
             try:
+                parent_path = None
+                if comment.parent_id is not None:
+                    parent = self.session.query(CommentDO.path).filter_by(id=comment.parent_id).one_or_none()
+                    if parent is None:
+                        raise ParentCommentDoesNotExistError()
+                    parent_path = parent.path
                 self.session.add(comment_do)
+                # 需要先写入数据库获取 id, 才能生成自身的物化路径
+                self.session.flush()
+                if comment.parent_id is None or parent_path is not None:
+                    comment_do.path = make_comment_path(parent_path, comment_do.id)
+                if comment.parent_id is not None:
+                    ancestor_ids = (
+                        get_path_ids(parent_path) if parent_path else self.find_ancestor_ids(comment.parent_id)
+                    )
+                    self.update_counters(comment.parent_id, ancestor_ids, 1)
+                self.update_comment_count(1)
+                OutboxRepository(self.session).add(
+                    CommentCreated(comment_id=comment_do.id, parent_id=comment.parent_id, created_by=comment.created_by)
+                )
             except:
                 self.session.rollback()
                 raise
@@ -45,14 +215,322 @@ class CommentRepository(CommentBaseRepository):
             # Update
             pass
 
+    def save_all(
+        self, comments: List[Comment], parent_indexes: List[Optional[int]], emit_events: bool = True
+    ) -> List[int]:
+        table = CommentDO.__table__
+        try:
+            counted = self.session.execute(
+                update(CommentStatDO)
+                .where(CommentStatDO.name == COMMENT_COUNT_STAT)
+                .values(value=CommentStatDO.value + len(comments))
+            ).rowcount
+            # 第一条写语句使 SQLite 取得写锁, 提交前其他连接无法写入, 因此可以预先分配 id 并一次写入全部评论
+            # 其他数据库上并发事务可能分配到相同的 id, 改为逐条写入由数据库分配 id
+            max_id: Optional[int] = None
+            if self.session.get_bind().dialect.name == "sqlite":
+                max_id = self.session.query(func.max(CommentDO.id)).scalar() or 0
+            parent_ids = {
+                comment.parent_id
+                for comment, parent_index in zip(comments, parent_indexes)
+                if parent_index is None and comment.parent_id is not None
+            }
+            parent_paths: Dict[int, Optional[str]] = dict(
+                self.session.query(CommentDO.id, CommentDO.path).filter(CommentDO.id.in_(parent_ids))
+            )
+            if len(parent_paths) < len(parent_ids):
+                raise ParentCommentDoesNotExistError()
+
+            ids: List[int] = []
+            rows: List[Dict] = []
+            for index, (comment, parent_index) in enumerate(zip(comments, parent_indexes)):
+                if parent_index is not None:
+                    if not 0 <= parent_index < index:
+                        raise ValueError(f"第 {index} 条评论的父评论下标无效: {parent_index}")
+                    parent_id, parent_path = ids[parent_index], rows[parent_index]["path"]
+                else:
+                    parent_id, parent_path = comment.parent_id, parent_paths.get(comment.parent_id)
+                row = {
+                    "content": comment.content,
+                    "parent_id": parent_id,
+                    "created_by": comment.created_by,
+                    "created_at": comment.created_at,
+                    "reply_count": 0,
+                    "descendant_count": 0,
+                }
+                if max_id is not None:
+                    comment_id = max_id + index + 1
+                else:
+                    comment_id = self.session.execute(insert(table).values(**row)).inserted_primary_key[0]
+                row["id"] = comment_id
+                row["path"] = make_comment_path(parent_path, comment_id) if parent_id is None or parent_path else None
+                ids.append(comment_id)
+                rows.append(row)
+
+            # 倒序遍历时子评论的计数总是先于父评论计算完毕; 批次内子树的根评论把计数累加到已有的祖先评论上
+            reply_deltas: Dict[int, int] = Counter()
+            descendant_deltas: Dict[int, int] = Counter()
+            ancestors: Dict[int, List[int]] = {}
+            for index in range(len(rows) - 1, -1, -1):
+                row, parent_index = rows[index], parent_indexes[index]
+                if parent_index is not None:
+                    rows[parent_index]["reply_count"] += 1
+                    rows[parent_index]["descendant_count"] += row["descendant_count"] + 1
+                elif row["parent_id"] is not None:
+                    parent_id = row["parent_id"]
+                    if parent_id not in ancestors:
+                        parent_path = parent_paths.get(parent_id)
+                        ancestors[parent_id] = (
+                            get_path_ids(parent_path) if parent_path else self.find_ancestor_ids(parent_id)
+                        )
+                    reply_deltas[parent_id] += 1
+                    for ancestor_id in ancestors[parent_id]:
+                        descendant_deltas[ancestor_id] += row["descendant_count"] + 1
+
+            if max_id is not None:
+                self.session.execute(insert(table), rows)
+            else:
+                self.session.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("comment_id"))
+                    .values(
+                        path=bindparam("comment_path"),
+                        reply_count=bindparam("comment_reply_count"),
+                        descendant_count=bindparam("comment_descendant_count"),
+                    ),
+                    [
+                        {
+                            "comment_id": row["id"],
+                            "comment_path": row["path"],
+                            "comment_reply_count": row["reply_count"],
+                            "comment_descendant_count": row["descendant_count"],
+                        }
+                        for row in rows
+                    ],
+                )
+            if reply_deltas:
+                self.session.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("comment_id"))
+                    .values(reply_count=table.c.reply_count + bindparam("delta")),
+                    [{"comment_id": comment_id, "delta": delta} for comment_id, delta in reply_deltas.items()],
+                )
+            if descendant_deltas:
+                self.session.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("comment_id"))
+                    .values(descendant_count=table.c.descendant_count + bindparam("delta")),
+                    [{"comment_id": comment_id, "delta": delta} for comment_id, delta in descendant_deltas.items()],
+                )
+            if not counted:
+                self.update_comment_count(0)
+            if emit_events:
+                OutboxRepository(self.session).add_all(
+                    CommentCreated(comment_id=row["id"], parent_id=row["parent_id"], created_by=row["created_by"])
+                    for row in rows
+                )
+        except:
+            self.session.rollback()
+            raise
+        else:
+            self.session.commit()
+            return ids
+
     def remove(self, comment_id: int):
         try:
             comment_do: CommentDO = self.session.query(CommentDO).filter_by(id=comment_id).one()
         except NoResultFound:
             return None
-        else:
+        try:
+            parent_id, path = comment_do.parent_id, comment_do.path
+            if parent_id is not None:
+                # 被删除评论的直接回复成为根评论, 整棵子树离开原来的评论树, 祖先评论的子孙数需要减去整棵子树
+                ancestor_ids = get_path_ids(path)[:-1] if path else self.find_ancestor_ids(parent_id)
+                self.update_counters(parent_id, ancestor_ids, -1 - comment_do.descendant_count)
+            # 删除时直接回复的 parent_id 被置空
             self.session.delete(comment_do)
+            self.session.flush()
+            if path:
+                # 子树中的物化路径同时去掉被删除评论及其祖先的前缀, 否则之后的写入会继续更新原来祖先的计数器
+                self.session.execute(
+                    update(CommentDO)
+                    .where(CommentDO.path > path, CommentDO.path < get_path_upper_bound(path))
+                    .values(path=func.substr(CommentDO.path, len(path) + 1))
+                    .execution_options(synchronize_session=False)
+                )
+            self.update_comment_count(-1)
+            OutboxRepository(self.session).add(CommentDeleted(comment_id=comment_id, parent_id=parent_id))
+        except:
+            self.session.rollback()
+            raise
+        else:
             self.session.commit()
 
+    def remove_tree(self, comment_id: int) -> int:
+        row = self.session.query(CommentDO.parent_id, CommentDO.path).filter_by(id=comment_id).one_or_none()
+        if row is None:
+            return 0
+        parent_id, path = row
+        try:
+            # 沿 parent_id 向下递归找出整棵子树, 不依赖物化路径(旧数据的路径可能缺失), 一条 DELETE 删除全部评论
+            # CTE 嵌套在子查询中, 语句以 DELETE 开头, sqlite3 驱动才会返回删除的行数
+            subtree = (
+                select(CommentDO.id).where(CommentDO.id == comment_id).cte("subtree", recursive=True, nesting=True)
+            )
+            child = aliased(CommentDO, name="child")
+            subtree = subtree.union_all(select(child.id).where(child.parent_id == subtree.c.id))
+            removed: int = self.session.execute(
+                delete(CommentDO)
+                .where(CommentDO.id.in_(select(subtree.c.id)))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if parent_id is not None:
+                ancestor_ids = get_path_ids(path)[:-1] if path else self.find_ancestor_ids(parent_id)
+                self.update_counters(parent_id, ancestor_ids, -removed)
+            self.update_comment_count(-removed)
+            OutboxRepository(self.session).add(CommentDeleted(comment_id=comment_id, parent_id=parent_id, cascade=True))
+        except:
+            self.session.rollback()
+            raise
+        else:
+            self.session.commit()
+            return removed
+
+    def search(self, query: str, limit: int, offset: int = 0) -> Tuple[List[Tuple[Comment, str]], bool]:
+        terms = query.split()
+        if not terms:
+            return [], False
+        # 少于 3 个字符的词无法使用 trigram 索引, 只能在其他词的匹配结果上过滤, 全部为短词时只匹配最新的一部分评论
+        long_terms = [term for term in terms if len(term) >= SEARCH_MIN_TERM_LENGTH]
+        short_conditions = [
+            CommentDO.content.contains(term, autoescape=True) for term in terms if len(term) < SEARCH_MIN_TERM_LENGTH
+        ]
+        if long_terms:
+            # 每个词作为短语匹配, 多个词之间为 AND
+            match = " ".join('"' + term.replace('"', '""') + '"' for term in long_terms)
+            search_table = table(COMMENT_SEARCH_TABLE, column("rowid"), column("rank"))
+            # 只对最新的 SEARCH_RANK_WINDOW 条匹配结果计算 bm25 相关度并排序, 常见词的查询耗时不随匹配条数增长
+            # 窗口大小固定, 各页都在同一批结果中分页, 不会因为翻页改变排序而重复或遗漏, 窗口之后不再有下一页
+            recent = (
+                select(search_table.c.rowid.label("id"), search_table.c.rank.label("rank"))
+                .join_from(search_table, CommentDO, CommentDO.id == search_table.c.rowid)
+                .where(literal_column(COMMENT_SEARCH_TABLE).op("MATCH")(match), *short_conditions)
+                .order_by(search_table.c.rowid.desc())
+                .limit(SEARCH_RANK_WINDOW)
+                .subquery("recent")
+            )
+            statement = (
+                select(CommentDO).join(recent, recent.c.id == CommentDO.id).order_by(recent.c.rank, CommentDO.id.desc())
+            )
+        else:
+            # 沿主键倒序取最新的 SEARCH_SCAN_WINDOW 条评论逐条匹配, 耗时与评论总数无关
+            latest = select(CommentDO.id).order_by(CommentDO.id.desc()).limit(SEARCH_SCAN_WINDOW).subquery("latest")
+            statement = (
+                select(CommentDO)
+                .where(CommentDO.id.in_(select(latest.c.id)), *short_conditions)
+                .order_by(CommentDO.id.desc())
+            )
+        comment_dos: List[CommentDO] = self.session.execute(statement.limit(limit + 1).offset(offset)).scalars().all()
+        results = [(comment_do.to_entity(), make_snippet(comment_do.content, terms)) for comment_do in comment_dos]
+        return results[:limit], len(results) > limit
+
     def count(self) -> int:
-        return self.session.query(CommentDO).count()
+        count: Optional[int] = self.session.query(CommentStatDO.value).filter_by(name=COMMENT_COUNT_STAT).scalar()
+        if count is None:
+            # 计数尚未初始化(例如升级前的数据库), 退化为全表计数
+            return self.session.query(CommentDO).count()
+        return count
+
+    def find_ancestor_ids(self, comment_id: int) -> List[int]:
+        """
+        物化路径缺失时, 通过 WITH RECURSIVE 向上查找 comment_id 及其全部祖先评论的 id
+        """
+        ancestors = (
+            select(CommentDO.id, CommentDO.parent_id).where(CommentDO.id == comment_id).cte("ancestors", recursive=True)
+        )
+        parent = aliased(CommentDO, name="parent")
+        ancestors = ancestors.union_all(select(parent.id, parent.parent_id).where(parent.id == ancestors.c.parent_id))
+        return [ancestor_id for (ancestor_id,) in self.session.execute(select(ancestors.c.id))]
+
+    def update_counters(self, parent_id: int, ancestor_ids: List[int], descendant_delta: int) -> None:
+        """
+        更新父评论的回复数与全部祖先评论的子孙数, 调用方负责提交事务
+        :param parent_id: 新增或删除的评论的父评论 id, 回复数随之加一或减一
+        :param ancestor_ids: 父评论及其全部祖先评论的 id
+        :param descendant_delta: 子孙数的变化量
+        """
+        reply_delta = 1 if descendant_delta > 0 else -1
+        self.session.execute(
+            update(CommentDO)
+            .where(CommentDO.id == parent_id)
+            .values(reply_count=CommentDO.reply_count + reply_delta)
+            .execution_options(synchronize_session=False)
+        )
+        self.session.execute(
+            update(CommentDO)
+            .where(CommentDO.id.in_(ancestor_ids))
+            .values(descendant_count=CommentDO.descendant_count + descendant_delta)
+            .execution_options(synchronize_session=False)
+        )
+
+    def update_comment_count(self, delta: int) -> None:
+        """
+        更新评论总数, 调用方负责提交事务
+        """
+        result = self.session.execute(
+            update(CommentStatDO)
+            .where(CommentStatDO.name == COMMENT_COUNT_STAT)
+            .values(value=CommentStatDO.value + delta)
+        )
+        if result.rowcount == 0:
+            # 首次写入时按实际条数初始化, 本次新增或删除已经 flush, 包含在计数中
+            self.session.add(CommentStatDO(name=COMMENT_COUNT_STAT, value=self.session.query(CommentDO).count()))
+
+
+class AsyncCommentRepository(AsyncRepository):
+    """
+    Comment Repository 异步实现
+    """
+
+    repository_class = CommentRepository
+    interface = CommentBaseRepository
+
+
+def select_subtrees(
+    root_filter: ColumnElement, max_depth: Optional[int] = None, max_children: Optional[int] = None
+) -> Select:
+    """
+    通过 WITH RECURSIVE 查询满足 root_filter 的评论及其子孙评论
+    :param root_filter: 子树根节点的过滤条件
+    :param max_depth: 最多向下查询的层数, 根节点为第 0 层, 为 None 时不限制
+    :param max_children: 每条评论最多查询的直接回复数, 按 (created_at, id) 取最早的回复, 为 None 时不限制
+    """
+    tree = select(*COMMENT_TREE_COLUMNS, literal(0).label("depth")).where(root_filter).cte("tree", recursive=True)
+    child = aliased(CommentDO, name="child")
+    children = select(
+        child.id,
+        child.parent_id,
+        child.content,
+        child.created_by,
+        child.created_at,
+        child.updated_at,
+        child.reply_count,
+        child.descendant_count,
+        (tree.c.depth + 1).label("depth"),
+    )
+    if max_children is None:
+        children = children.where(child.parent_id == tree.c.id)
+    else:
+        # 按主键读取子查询选出的回复, 回复很多的评论也只读取 max_children 行; 同时按 parent_id 过滤会扫描全部回复
+        sibling = aliased(CommentDO, name="sibling")
+        first_children = (
+            select(sibling.id)
+            .where(sibling.parent_id == tree.c.id)
+            .order_by(sibling.created_at, sibling.id)
+            .limit(max_children)
+        )
+        children = children.select_from(tree).join(child, child.id.in_(first_children))
+    if max_depth is not None:
+        children = children.where(tree.c.depth < max_depth)
+    tree = tree.union_all(children)
+    return select(tree).order_by(tree.c.id)
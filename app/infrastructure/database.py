@@ -1,35 +1,208 @@
-from typing import Iterator
+import time
+from typing import Any, Callable, Dict, Optional, Type, TypeVar, Union
 
-from sqlalchemy import create_engine
+from anyio import to_thread
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.session import Session
 
 from app.config import settings
+from app.utils.metrics import record_query
 
-engine = create_engine(
-    settings.DATABASE_URI,
-    echo=settings.SQL_DEBUG,
-    future=True,
-    # 避免 SQLite3 在多线程环境中出现错误
-    connect_args={"check_same_thread": False},
-)
+T = TypeVar("T")
+
+
+def is_sqlite(uri: str) -> bool:
+    return uri.startswith("sqlite")
+
+
+def get_engine_options(uri: str, pool_size: int, is_async: bool = False) -> Dict[str, Any]:
+    """
+    读写分离时的连接池配置: 写引擎只有一个连接, 写入在连接池中排队而不是在 SQLite 的文件锁上忙等; 读引擎使用独立的连接池
+    """
+    options: Dict[str, Any] = {"echo": settings.SQL_DEBUG, "future": True}
+    if is_sqlite(uri) and not is_async:
+        # 避免 SQLite3 在多线程环境中出现错误
+        options["connect_args"] = {"check_same_thread": False}
+    if settings.DATABASE_READ_WRITE_SPLIT:
+        options.update(
+            poolclass=AsyncAdaptedQueuePool if is_async else QueuePool,
+            pool_size=pool_size,
+            max_overflow=0,
+        )
+    return options
+
+
+def configure_sqlite_connections(engine: Engine, read_only: bool = False) -> None:
+    """
+    SQLite 开启 WAL, 读连接不会被写连接阻塞; 读引擎的连接设为只读, 误用时直接报错
+    """
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def get_read_database_uri() -> str:
+    return settings.READ_DATABASE_URI or settings.DATABASE_URI
+
+
+engine = create_engine(settings.DATABASE_URI, **get_engine_options(settings.DATABASE_URI, pool_size=1))
 
 SessionLocal = sessionmaker(
     autocommit=False,
     bind=engine,
 )
 
+# 查询使用的引擎, 未开启读写分离时与写引擎相同
+read_engine = engine
+ReadSessionLocal = SessionLocal
+if settings.DATABASE_READ_WRITE_SPLIT:
+    read_engine = create_engine(
+        get_read_database_uri(),
+        **get_engine_options(get_read_database_uri(), pool_size=settings.READ_POOL_SIZE),
+    )
+    ReadSessionLocal = sessionmaker(
+        autocommit=False,
+        bind=read_engine,
+    )
+    if is_sqlite(settings.DATABASE_URI):
+        configure_sqlite_connections(engine)
+    if is_sqlite(get_read_database_uri()):
+        configure_sqlite_connections(read_engine, read_only=True)
+
 Base = declarative_base()
 
 
-def get_session() -> Iterator[Session]:
-    session: Session = SessionLocal()
-    try:
-        yield session
-    finally:
-        session.close()
+def get_async_database_uri(uri: Optional[str] = None) -> str:
+    if uri is None and settings.ASYNC_DATABASE_URI:
+        return settings.ASYNC_DATABASE_URI
+    return (uri or settings.DATABASE_URI).replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+
+# 异步驱动(例如 aiosqlite)只在开启 DATABASE_ASYNC 时才需要安装
+async_engine: Optional[AsyncEngine] = None
+AsyncSessionLocal: Optional[sessionmaker] = None
+async_read_engine: Optional[AsyncEngine] = None
+AsyncReadSessionLocal: Optional[sessionmaker] = None
+if settings.DATABASE_ASYNC:
+    async_engine = create_async_engine(
+        get_async_database_uri(),
+        **get_engine_options(get_async_database_uri(), pool_size=1, is_async=True),
+    )
+    AsyncSessionLocal = sessionmaker(
+        autocommit=False,
+        bind=async_engine,
+        class_=AsyncSession,
+    )
+    async_read_engine = async_engine
+    AsyncReadSessionLocal = AsyncSessionLocal
+    if settings.DATABASE_READ_WRITE_SPLIT:
+        async_read_uri = get_async_database_uri(settings.READ_DATABASE_URI or None)
+        async_read_engine = create_async_engine(
+            async_read_uri,
+            **get_engine_options(async_read_uri, pool_size=settings.READ_POOL_SIZE, is_async=True),
+        )
+        AsyncReadSessionLocal = sessionmaker(
+            autocommit=False,
+            bind=async_read_engine,
+            class_=AsyncSession,
+        )
+        if is_sqlite(get_async_database_uri()):
+            configure_sqlite_connections(async_engine.sync_engine)
+        if is_sqlite(async_read_uri):
+            configure_sqlite_connections(async_read_engine.sync_engine, read_only=True)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    # 监听的是 Engine 类, 同步与异步引擎(及测试中创建的引擎)上执行的 SQL 都会计入当前请求
+    record_query(time.perf_counter() - conn.info["query_start_time"].pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def handle_error(context) -> None:
+    # 执行失败时不会触发 after_cursor_execute, 丢弃对应的开始时间
+    start_times = context.connection.info.get("query_start_time") if context.connection is not None else None
+    if start_times:
+        start_times.pop()
+
+
+class AsyncRepository(object):
+    """
+    Repository 的异步实现, 可以调用 interface 中声明的 Repository 方法, 返回协程
+    - AsyncSession: 通过 AsyncSession.run_sync 在 greenlet 中执行, 数据库 IO 由异步驱动完成
+    - Session: 在线程池中执行
+    两种方式下都不会阻塞事件循环, SQL 也只需要在同步 Repository 中维护一份
+    """
+
+    repository_class: Type = None
+    # 被包装的 Repository 接口, 只代理接口中声明的方法
+    interface: Type = None
+
+    def __init__(self, session: Union[Session, AsyncSession]):
+        self.session = session
+
+    async def run_sync(self, func: Callable[[Any], T]) -> T:
+        """
+        以同步 Repository 为参数执行 func
+        """
+        if isinstance(self.session, AsyncSession):
+            return await self.session.run_sync(lambda session: func(self.repository_class(session)))
+        return await to_thread.run_sync(func, self.repository_class(self.session))
+
+    def __getattr__(self, name: str):
+        if name.startswith("_") or not callable(getattr(self.interface, name, None)):
+            raise AttributeError(f"{type(self).__name__} 没有方法 {name}")
+        method = getattr(self.repository_class, name)
+
+        async def wrapper(*args, **kwargs):
+            return await self.run_sync(lambda repository: method(repository, *args, **kwargs))
+
+        return wrapper
 
 
 def create_tables() -> None:
     Base.metadata.create_all(bind=engine)
+
+
+def upgrade_tables() -> None:
+    """
+    为已有数据库补全模型中新增的字段和索引, 只支持新增, 不处理字段类型变更与删除
+    表的 info["upgrade"] 可以提供额外的升级函数(例如创建全文索引), 以连接为参数, 在同一事务中执行
+    """
+    create_tables()
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                connection.execute(text(ddl))
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
+            upgrade = table.info.get("upgrade")
+            if upgrade is not None:
+                upgrade(connection)
@@ -0,0 +1,3 @@
+from .do import OutboxEventDO
+from .repository import OutboxRepository
+from .dispatcher import OutboxDispatcher, outbox_dispatcher
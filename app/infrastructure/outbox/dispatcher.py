@@ -0,0 +1,169 @@
+import asyncio
+import inspect
+from collections import defaultdict
+from itertools import groupby
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Type, Union
+
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.orm.session import Session
+
+from app.config import settings
+from app.domain.event import DomainEvent
+from app.infrastructure.database import SessionLocal
+from app.infrastructure.outbox.repository import OutboxRepository, OUTBOX_PENDING
+
+# 订阅者一次接收同一类型的一批事件, 可以是普通函数(在线程池中执行)或协程函数(在事件循环中执行)
+Subscriber = Callable[[List[DomainEvent]], Union[None, Awaitable[None]]]
+
+
+class OutboxDispatcher(object):
+    """
+    在事件循环中运行的后台任务, 按写入顺序分批认领 outbox 中的事件, 按类型投递给订阅者, 全部订阅者成功后删除
+    有事务写入事件并提交后立即唤醒, 否则每隔 poll_interval 秒检查一次(例如其他进程写入的事件)
+
+    投递语义为至少一次: 一批事件中任何一个订阅者失败, 整批事件都会在之后重新投递给全部订阅者, 订阅者需要保证幂等
+    失败 max_attempts 次的事件记录日志后丢弃
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        batch_size: int = 100,
+        poll_interval: float = 1.0,
+        lease_seconds: float = 30,
+        max_attempts: int = 5,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.subscribers: Dict[Type[DomainEvent], List[Subscriber]] = defaultdict(list)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def subscribe(self, event_type: Type[DomainEvent], subscriber: Subscriber) -> None:
+        self.subscribers[event_type].append(subscriber)
+
+    def unsubscribe(self, event_type: Type[DomainEvent], subscriber: Subscriber) -> None:
+        self.subscribers[event_type].remove(subscriber)
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        self.loop = None
+
+    def notify(self) -> None:
+        """
+        唤醒后台任务, 可以在任意线程中调用
+        """
+        loop, wakeup = self.loop, self.wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def _call(self, method: str, *args):
+        """
+        在单独的会话中执行一次 OutboxRepository 的操作
+        """
+        session = self.session_factory()
+        try:
+            return getattr(OutboxRepository(session), method)(*args)
+        finally:
+            session.close()
+
+    async def run(self) -> None:
+        while True:
+            self.wakeup.clear()
+            try:
+                delivered = await self.dispatch_once()
+            except Exception:
+                logger.exception("投递领域事件失败")
+                delivered = 0
+            # 取满一批说明可能还有积压, 立即继续
+            if delivered < self.batch_size:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def dispatch_once(self) -> int:
+        """
+        认领并投递一批事件
+        :return: 认领的事件数
+        """
+        claimed = await asyncio.to_thread(self._call, "claim", self.batch_size, self.lease_seconds)
+        if not claimed:
+            return 0
+        events = [item for _, _, item in claimed]
+        try:
+            await self.deliver(events)
+        except Exception:
+            logger.exception(f"领域事件订阅者执行失败, {len(claimed)} 条事件将重新投递")
+            retry_ids = [event_id for event_id, attempts, _ in claimed if attempts + 1 < self.max_attempts]
+            dropped = [item for _, attempts, item in claimed if attempts + 1 >= self.max_attempts]
+            if dropped:
+                logger.error(f"领域事件超过最大投递次数, 已丢弃: {dropped}")
+                dropped_ids = [event_id for event_id, attempts, _ in claimed if attempts + 1 >= self.max_attempts]
+                await asyncio.to_thread(self._call, "complete", dropped_ids)
+            if retry_ids:
+                await asyncio.to_thread(self._call, "release", retry_ids)
+        else:
+            await asyncio.to_thread(self._call, "complete", [event_id for event_id, _, _ in claimed])
+        return len(claimed)
+
+    async def deliver(self, events: Sequence[DomainEvent]) -> None:
+        """
+        把相邻的同类型事件合并为一批, 按写入顺序投递给订阅者
+        """
+        for event_type, group in groupby(events, key=type):
+            group = list(group)
+            for subscriber in list(self.subscribers.get(event_type, ())):
+                if inspect.iscoroutinefunction(subscriber):
+                    await subscriber(group)
+                else:
+                    await asyncio.to_thread(subscriber, group)
+
+
+def notify_after_commit(dispatcher: OutboxDispatcher) -> None:
+    """
+    任何会话提交了写入事件的事务后唤醒 dispatcher, 同步会话与 AsyncSession 内部的同步会话都会触发
+    """
+
+    @event.listens_for(Session, "after_commit")
+    def after_commit(session: Session) -> None:
+        if session.info.pop(OUTBOX_PENDING, False):
+            dispatcher.notify()
+
+    @event.listens_for(Session, "after_rollback")
+    def after_rollback(session: Session) -> None:
+        session.info.pop(OUTBOX_PENDING, None)
+
+
+# 进程内唯一的 dispatcher, OUTBOX_ENABLED 开启时随应用启动
+outbox_dispatcher = OutboxDispatcher(
+    SessionLocal,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL,
+    lease_seconds=settings.OUTBOX_LEASE_SECONDS,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+)
+notify_after_commit(outbox_dispatcher)
@@ -0,0 +1,44 @@
+import json
+from datetime import datetime
+from typing import Any, Dict
+
+from sqlalchemy import Column, Integer, DateTime, String, Text
+
+from app.domain.event import DomainEvent
+from app.infrastructure.database import Base
+
+
+class OutboxEventDO(Base):
+    """
+    Outbox Event Data Object, 领域事件与产生它的写操作在同一事务中写入, 由 OutboxDispatcher 异步投递后删除
+    """
+
+    __tablename__ = "outbox_event"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    # 投递失败的次数
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    # 认领该事件的投递批次与租约到期时间, 租约到期前其他进程不会重复认领
+    claim_token = Column(String(32), nullable=True)
+    claimed_until = Column(DateTime(timezone=True), nullable=True, index=True)
+
+    def __repr__(self):
+        return f"OutboxEventDO(id={self.id!r}, name={self.name!r})"
+
+    def to_event(self) -> DomainEvent:
+        return DomainEvent.from_payload(self.name, json.loads(self.payload))
+
+    @staticmethod
+    def to_row(event: DomainEvent, created_at: datetime) -> Dict[str, Any]:
+        """
+        事件转换成 outbox_event 表的一行, 可以直接用于批量 insert
+        """
+        return {
+            "name": event.name,
+            "payload": json.dumps(event.to_payload(), ensure_ascii=False),
+            "created_at": created_at,
+            "attempts": 0,
+        }
@@ -0,0 +1,102 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Iterable, Tuple
+
+from sqlalchemy import select, update, delete, insert
+from sqlalchemy.orm.session import Session
+
+from app.config import settings
+from app.domain.event import DomainEvent
+from app.infrastructure.outbox.do import OutboxEventDO
+
+# 本次事务写入了事件的会话, 提交后唤醒 OutboxDispatcher, 参考 dispatcher.notify_after_commit
+OUTBOX_PENDING = "outbox_pending"
+
+
+class OutboxRepository(object):
+    """
+    Outbox Repository: 写入事件时不提交, 由调用方的 Repository 与业务数据一起提交
+    """
+
+    def __init__(self, session: Session):
+        self.session: Session = session
+
+    def add_all(self, events: Iterable[DomainEvent]) -> None:
+        if not settings.OUTBOX_ENABLED:
+            return
+        now = datetime.utcnow()
+        rows = [OutboxEventDO.to_row(event, now) for event in events]
+        if not rows:
+            return
+        self.session.execute(insert(OutboxEventDO.__table__), rows)
+        self.session.info[OUTBOX_PENDING] = True
+
+    def add(self, event: DomainEvent) -> None:
+        self.add_all([event])
+
+    def claim(self, limit: int, lease_seconds: float) -> List[Tuple[int, int, DomainEvent]]:
+        """
+        按写入顺序认领一批未投递或租约已过期的事件, 在租约期内其他进程不会重复认领
+        :return: (事件 id, 已失败次数, 事件) 列表
+        """
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        try:
+            claimable = (
+                select(OutboxEventDO.id)
+                .where((OutboxEventDO.claimed_until.is_(None)) | (OutboxEventDO.claimed_until < now))
+                .order_by(OutboxEventDO.id)
+                .limit(limit)
+            )
+            self.session.execute(
+                update(OutboxEventDO)
+                .where(OutboxEventDO.id.in_(claimable.scalar_subquery()))
+                .values(claim_token=token, claimed_until=now + timedelta(seconds=lease_seconds))
+                .execution_options(synchronize_session=False)
+            )
+            rows = self.session.execute(
+                select(OutboxEventDO).where(OutboxEventDO.claim_token == token).order_by(OutboxEventDO.id)
+            ).scalars()
+            claimed = [(row.id, row.attempts, row.to_event()) for row in rows]
+        except:
+            self.session.rollback()
+            raise
+        else:
+            self.session.commit()
+            return claimed
+
+    def complete(self, event_ids: List[int]) -> None:
+        """
+        删除已投递(或放弃投递)的事件
+        """
+        try:
+            self.session.execute(
+                delete(OutboxEventDO)
+                .where(OutboxEventDO.id.in_(event_ids))
+                .execution_options(synchronize_session=False)
+            )
+        except:
+            self.session.rollback()
+            raise
+        else:
+            self.session.commit()
+
+    def release(self, event_ids: List[int]) -> None:
+        """
+        投递失败, 记录失败次数并释放租约, 之后重新投递
+        """
+        try:
+            self.session.execute(
+                update(OutboxEventDO)
+                .where(OutboxEventDO.id.in_(event_ids))
+                .values(attempts=OutboxEventDO.attempts + 1, claim_token=None, claimed_until=None)
+                .execution_options(synchronize_session=False)
+            )
+        except:
+            self.session.rollback()
+            raise
+        else:
+            self.session.commit()
+
+    def count(self) -> int:
+        return self.session.query(OutboxEventDO).count()
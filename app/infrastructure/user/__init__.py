@@ -1,2 +1,2 @@
 from .do import UserDO
-from .repository import UserRepository
+from .repository import UserRepository, AsyncUserRepository
@@ -3,7 +3,9 @@ from typing import Optional, List
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm.session import Session
 from sqlalchemy.sql import exists
-from app.domain.user import User, UserBaseRepository
+from app.domain.user import User, UserBaseRepository, UserDeleted
+from app.infrastructure.database import AsyncRepository
+from app.infrastructure.outbox.repository import OutboxRepository
 from app.infrastructure.user.do import UserDO
 from sqlalchemy import or_
 
@@ -73,6 +75,20 @@ class UserRepository(UserBaseRepository):
             user_do: UserDO = self.session.query(UserDO).filter_by(id=user_id).one()
         except NoResultFound:
             return None
-        else:
+        try:
             self.session.delete(user_do)
+            OutboxRepository(self.session).add(UserDeleted(user_id=user_do.id, username=user_do.username))
+        except:
+            self.session.rollback()
+            raise
+        else:
             self.session.commit()
+
+
+class AsyncUserRepository(AsyncRepository):
+    """
+    User Repository 异步实现
+    """
+
+    repository_class = UserRepository
+    interface = UserBaseRepository
@@ -1,2 +1,3 @@
 from .user import api as user_api
 from .comment import api as comment_api
+from .metrics import api as metrics_api
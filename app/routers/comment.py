@@ -1,49 +1,89 @@
-from typing import List
+from typing import List, Optional, Union
 
-from fastapi import APIRouter, status, Depends, HTTPException, Response
+from fastapi import APIRouter, status, Depends, HTTPException, Response, Query, Request
+from fastapi.responses import StreamingResponse
 from loguru import logger
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.session import Session
 
-from app.domain.comment import CommentDoesNotExistError
+from app.domain.comment import CommentDoesNotExistError, ParentCommentDoesNotExistError
+from app.infrastructure.comment import AsyncCommentRepository
 from app.infrastructure.comment import CommentRepository
-from app.infrastructure.database import get_session
-from app.usecase.comment import CommentCommandUseCase
+from app.routers.session import get_db_session, get_db_read_session, get_read_session
+from app.usecase.comment import AsyncCommentCommandUseCase, comment_tree_cache
+from app.usecase.comment import comment_event_broadcaster, TooManySubscribersError
 from app.usecase.comment import CommentCreateDTO, CommentReadDTO
-from app.usecase.comment.dto import CommentTreeNodeDTO
+from app.usecase.comment import CommentBulkCreateDTO, CommentBulkResultDTO
+from app.usecase.comment.dto import CommentTreeNodeDTO, CommentPageDTO, CommentSearchPageDTO
 from app.usecase.comment.dto.query import CommentCountDTO
-from app.usecase.comment.usecase import CommentQueryUseCase
+from app.usecase.comment.usecase import AsyncCommentQueryUseCase, CommentQueryUseCase
 from app.usecase.user import UserReadDTO
+from app.utils import InvalidCursorError, make_etag, etag_matches, admit, defer_admission
 from .user import get_current_user, get_current_superuser
 
 api = APIRouter()
 
+MAX_CHILDREN_DESCRIPTION = "每条评论最多返回的直接回复数, 按时间顺序取最早的回复, 不传时返回全部回复"
 
-def comment_command_usecase(session: Session = Depends(get_session)) -> CommentCommandUseCase:
+
+def comment_command_usecase(
+    session: Union[Session, AsyncSession] = Depends(get_db_session),
+) -> AsyncCommentCommandUseCase:
     """
     创建 Comment Command UseCase 依赖
     """
-    repository: CommentRepository = CommentRepository(session)
-    return CommentCommandUseCase(repository)
+    repository: AsyncCommentRepository = AsyncCommentRepository(session)
+    return AsyncCommentCommandUseCase(repository)
 
 
-def comment_query_usecase(session: Session = Depends(get_session)) -> CommentQueryUseCase:
+def comment_query_usecase(
+    session: Union[Session, AsyncSession] = Depends(get_db_read_session),
+) -> AsyncCommentQueryUseCase:
     """
     创建 Comment Query UseCase 依赖
     """
-    repository: CommentRepository = CommentRepository(session)
-    return CommentQueryUseCase(repository)
+    repository: AsyncCommentRepository = AsyncCommentRepository(session)
+    return AsyncCommentQueryUseCase(repository)
 
 
-@api.get("/comments", response_model=List[CommentTreeNodeDTO])
+@api.get("/comments", response_model=Union[CommentPageDTO, List[CommentTreeNodeDTO]])
+@defer_admission
 async def get_comments(
-    query_usecase: CommentQueryUseCase = Depends(comment_query_usecase),
-) -> List[CommentTreeNodeDTO]:
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=100, description="每页根评论数量, 不传时返回全部评论"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    max_children: Optional[int] = Query(None, ge=1, le=1000, description=MAX_CHILDREN_DESCRIPTION),
+    max_depth: Optional[int] = Query(None, ge=0, description="最多返回的子评论层数, 不传时返回全部子评论"),
+    query_usecase: AsyncCommentQueryUseCase = Depends(comment_query_usecase),
+) -> Response:
     """
-    获取全部评论列表(未分页)
+    获取评论列表
+    不传 limit 与 cursor 时返回全部评论(未分页), 否则按根评论分页并返回 next_cursor
+    传入 max_children 或 max_depth 时只返回部分子评论, 其余回复通过 GET /comments/{id}/children 按需加载
+    响应体按数据版本缓存, 支持通过 If-None-Match 协商缓存; 配置了准入控制时只有缓存未命中的请求占用名额
     权限要求: 无
     """
-    comments = query_usecase.fetch_all()
-    return comments
+    cache_key = (limit, cursor, max_children, max_depth)
+    # 先记下版本号再查询, 查询期间发生写操作时不会把旧数据缓存到新版本下
+    version = comment_tree_cache.version
+    cached = comment_tree_cache.get(cache_key)
+    if cached is None:
+        async with admit(request):
+            if limit is None and cursor is None:
+                body = await query_usecase.fetch_all_json(max_children, max_depth)
+            else:
+                try:
+                    body = await query_usecase.fetch_page_json(limit or 20, cursor, max_children, max_depth)
+                except InvalidCursorError as e:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
+        cached = (body, make_etag(body))
+        comment_tree_cache.set(cache_key, cached, version)
+    body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
     # try:
     #     comments = query_usecase.fetch_all()
     # except Exception as e:
@@ -53,17 +93,72 @@ async def get_comments(
     #     return comments
 
 
+@api.get("/comments/export")
+def export_comments(
+    batch_size: int = Query(1000, ge=1, le=10000, description="每批从数据库读取的评论条数"),
+    session: Session = Depends(get_read_session),
+    current_user: UserReadDTO = Depends(get_current_superuser),
+) -> StreamingResponse:
+    """
+    以 NDJSON 格式流式导出全部评论, 每行一条评论, 包含 parent_id 与层级 depth
+    使用同步会话边读边写, 内存占用与评论总数无关
+    权限要求: 已登录的超级用户
+    """
+    query_usecase = CommentQueryUseCase(CommentRepository(session))
+    return StreamingResponse(query_usecase.export_ndjson(batch_size), media_type="application/x-ndjson")
+
+
+@api.get("/comments/search", response_model=CommentSearchPageDTO)
+async def search_comments(
+    q: str = Query(..., min_length=1, max_length=200, description="搜索词, 空白分隔的多个词需要同时匹配"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    query_usecase: AsyncCommentQueryUseCase = Depends(comment_query_usecase),
+):
+    """
+    按内容搜索评论, 包含至少 3 个字符的词时使用全文索引, 只在最新的 1000 条匹配结果中按相关度排序与分页;
+    全部为短词时只匹配最新的 10000 条评论, 按时间倒序
+    """
+    try:
+        return await query_usecase.search(q, limit, offset)
+    except OperationalError as e:
+        # 全文索引只支持 SQLite, 已有数据库需要先执行 upgrade_tables 或 repair_db.py 创建索引
+        logger.info(f"搜索评论失败: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="全文搜索不可用")
+
+
+@api.get("/comments/events")
+async def get_comment_events(
+    root_id: Optional[int] = Query(None, description="只推送该评论及其子孙评论的事件"),
+):
+    """
+    通过 Server-Sent Events 推送评论的新增(created)与删除(deleted)事件
+    连接因消费过慢被断开前会收到 evicted 事件, 客户端应重新获取评论后再次连接
+    """
+    if not comment_event_broadcaster.enabled:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="实时推送未开启")
+    try:
+        client = comment_event_broadcaster.connect(root_id)
+    except TooManySubscribersError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=e.message)
+    return StreamingResponse(
+        comment_event_broadcaster.stream(client),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @api.get("/comments/{comment_id}", response_model=CommentReadDTO)
 async def get_comment(
     comment_id: int,
-    query_usecase: CommentQueryUseCase = Depends(comment_query_usecase),
+    query_usecase: AsyncCommentQueryUseCase = Depends(comment_query_usecase),
 ) -> CommentReadDTO:
     """
     获取评论详情
     权限要求: 无
     """
     try:
-        comment = query_usecase.fetch_one(comment_id)
+        comment = await query_usecase.fetch_one(comment_id)
     except CommentDoesNotExistError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.message)
     except Exception as e:
@@ -73,6 +168,54 @@ async def get_comment(
         return comment
 
 
+@api.get("/comments/{comment_id}/tree", response_model=CommentTreeNodeDTO)
+async def get_comment_tree(
+    comment_id: int,
+    max_depth: Optional[int] = Query(None, ge=0, description="最多返回的子评论层数, 不传时返回全部子评论"),
+    max_children: Optional[int] = Query(None, ge=1, le=1000, description=MAX_CHILDREN_DESCRIPTION),
+    query_usecase: AsyncCommentQueryUseCase = Depends(comment_query_usecase),
+) -> Response:
+    """
+    获取单条评论及其子评论
+    权限要求: 无
+    """
+    try:
+        body = await query_usecase.fetch_tree_json(comment_id, max_depth, max_children)
+    except CommentDoesNotExistError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.message)
+    except Exception as e:
+        logger.info(f"查询评论失败: {e}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="查询评论失败")
+    else:
+        return Response(content=body, media_type="application/json")
+
+
+@api.get("/comments/{comment_id}/children", response_model=CommentPageDTO)
+async def get_comment_children(
+    comment_id: int,
+    limit: int = Query(20, ge=1, le=100, description="每页回复数量"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor, 或评论树中节点的 children_cursor"),
+    max_children: Optional[int] = Query(None, ge=1, le=1000, description=MAX_CHILDREN_DESCRIPTION),
+    max_depth: int = Query(0, ge=0, le=100, description="每条回复最多返回的子评论层数, 默认只返回回复本身"),
+    query_usecase: AsyncCommentQueryUseCase = Depends(comment_query_usecase),
+) -> Response:
+    """
+    按时间顺序分页获取一条评论的直接回复, 用于展开评论树中未全部返回回复的节点
+    权限要求: 无
+    """
+    try:
+        body = await query_usecase.fetch_children_json(comment_id, limit, cursor, max_children, max_depth)
+    except CommentDoesNotExistError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.message)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
+    except Exception as e:
+        logger.info(f"查询评论失败: {e}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="查询评论失败")
+    else:
+        return Response(content=body, media_type="application/json")
+
+
 @api.post(
     "/comments",
     response_model=CommentReadDTO,
@@ -80,7 +223,7 @@ async def get_comment(
 )
 async def create_comment(
     data: CommentCreateDTO,
-    command_usecase: CommentCommandUseCase = Depends(comment_command_usecase),
+    command_usecase: AsyncCommentCommandUseCase = Depends(comment_command_usecase),
     current_user: UserReadDTO = Depends(get_current_user),
 ) -> CommentReadDTO:
     """
@@ -89,7 +232,9 @@ async def create_comment(
     """
     data.created_by = f"{current_user.username}({current_user.email})"
     try:
-        comment = command_usecase.create_comment(data)
+        comment = await command_usecase.create_comment(data)
+    except ParentCommentDoesNotExistError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.message)
     except Exception as e:
         logger.info(f"创建评论失败: {e}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="创建评论失败")
@@ -97,31 +242,69 @@ async def create_comment(
         return comment
 
 
-@api.delete("/comments/{comment_id}")
+@api.post(
+    "/comments/bulk",
+    response_model=CommentBulkResultDTO,
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_comments(
+    data: CommentBulkCreateDTO,
+    command_usecase: AsyncCommentCommandUseCase = Depends(comment_command_usecase),
+    current_user: UserReadDTO = Depends(get_current_superuser),
+) -> CommentBulkResultDTO:
+    """
+    批量创建评论, 用于数据迁移, 一次请求为一个事务
+    同一批次中的评论可以通过 parent_index 回复之前的评论, 保留请求中的 created_by 与 created_at
+    权限要求: 已登录的超级用户
+    """
+    try:
+        result = await command_usecase.create_comments(data)
+    except ParentCommentDoesNotExistError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.message)
+    except Exception as e:
+        logger.info(f"批量创建评论失败: {e}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="批量创建评论失败")
+    else:
+        return result
+
+
+@api.delete(
+    "/comments/{comment_id}",
+    responses={
+        status.HTTP_200_OK: {"model": CommentCountDTO, "description": "级联删除成功, 返回删除的评论条数"},
+        status.HTTP_204_NO_CONTENT: {"description": "删除成功"},
+    },
+)
 async def delete_comment(
     comment_id: int,
-    command_usecase: CommentCommandUseCase = Depends(comment_command_usecase),
+    cascade: bool = Query(False, description="为 true 时删除整棵子树并返回删除的评论条数, 否则其直接回复成为根评论"),
+    command_usecase: AsyncCommentCommandUseCase = Depends(comment_command_usecase),
     current_user: UserReadDTO = Depends(get_current_superuser),
 ):
     """
-    创建评论
+    删除评论
+    只删除这条评论时返回 204, cascade=true 时返回 200 与删除的评论条数
     权限要求: 已登录的超级用户
     """
     try:
-        command_usecase.delete_comment(comment_id)
+        removed = await command_usecase.delete_comment(comment_id, cascade)
     except Exception as e:
         logger.info(f"删除评论失败: {e}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="删除评论失败")
-    return Response(status_code=status.HTTP_204_NO_CONTENT)
+    if not cascade:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    if not removed:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=CommentDoesNotExistError.message)
+    return CommentCountDTO(count=removed)
 
 
 @api.get("/comments/count/", response_model=CommentCountDTO)
 async def get_comment_count(
-    query_usecase: CommentQueryUseCase = Depends(comment_query_usecase),
+    query_usecase: AsyncCommentQueryUseCase = Depends(comment_query_usecase),
 ):
     """
     获取评论条数
     权限要求: 无
     """
-    count = query_usecase.count()
+    count = await query_usecase.count()
     return {"count": count}
@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.utils import metrics_registry, admission_controller
+
+api = APIRouter()
+
+
+@api.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics() -> PlainTextResponse:
+    """
+    以 Prometheus 文本格式输出按路由汇总的请求耗时、SQL 耗时、序列化耗时与 SQL 条数直方图, 以及准入控制的排队与拒绝统计
+    权限要求: 无, 需要通过 METRICS_ENABLED 开启, 建议只在内网开放
+    """
+    body = metrics_registry.render() + admission_controller.render()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,115 @@
+import math
+import time
+from typing import AsyncIterator, Iterator, Union
+
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.session import Session
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.infrastructure import database
+
+# 写入后用于把读请求固定到写引擎的 Cookie, 值为过期时间戳
+READ_YOUR_WRITES_COOKIE = "db_pin"
+
+
+def mark_written(request: Request) -> None:
+    request.state.database_written = True
+
+
+def is_pinned_to_writer(request: Request) -> bool:
+    """
+    开启 READ_YOUR_WRITES_SECONDS 时, 客户端写入后的一段时间内读请求也使用写引擎, 保证能读到自己的写入
+    """
+    if not settings.READ_YOUR_WRITES_SECONDS or database.read_engine is database.engine:
+        return False
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def get_writer_session(request: Request, session_factory: sessionmaker) -> Union[Session, AsyncSession]:
+    """
+    同一个请求中的写会话与固定到写引擎的读会话共用一个会话
+    读写分离时写引擎只有一个连接, 分别创建会话时先取得的读会话会一直占用该连接, 写会话等待连接池超时
+    """
+    session = getattr(request.state, "database_session", None)
+    if session is None:
+        session = request.state.database_session = session_factory()
+    return session
+
+
+def get_session(request: Request) -> Iterator[Session]:
+    mark_written(request)
+    session: Session = get_writer_session(request, database.SessionLocal)
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def get_read_session(request: Request) -> Iterator[Session]:
+    session: Session = (
+        get_writer_session(request, database.SessionLocal)
+        if is_pinned_to_writer(request)
+        else database.ReadSessionLocal()
+    )
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+async def get_async_session(request: Request) -> AsyncIterator[AsyncSession]:
+    mark_written(request)
+    session: AsyncSession = get_writer_session(request, database.AsyncSessionLocal)
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+async def get_async_read_session(request: Request) -> AsyncIterator[AsyncSession]:
+    if is_pinned_to_writer(request):
+        session: AsyncSession = get_writer_session(request, database.AsyncSessionLocal)
+    else:
+        session = database.AsyncReadSessionLocal()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+# 路由层使用的数据库会话依赖, 由 DATABASE_ASYNC 决定使用同步还是异步会话
+# Command UseCase 使用写会话, Query UseCase 使用读会话
+get_db_session = get_async_session if settings.DATABASE_ASYNC else get_session
+get_db_read_session = get_async_read_session if settings.DATABASE_ASYNC else get_read_session
+
+
+class ReadYourWritesMiddleware(object):
+    """
+    请求使用过写会话时, 在响应中设置 READ_YOUR_WRITES_COOKIE, 之后 seconds 秒内该客户端的读请求使用写引擎
+    """
+
+    def __init__(self, app: ASGIApp, seconds: float):
+        self.app = app
+        self.seconds = seconds
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.seconds:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and scope.get("state", {}).get("database_written"):
+                cookie = (
+                    f"{READ_YOUR_WRITES_COOKIE}={time.time() + self.seconds:.3f}; "
+                    f"Max-Age={int(math.ceil(self.seconds))}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,43 +1,44 @@
-from typing import List, Dict
+from typing import List, Dict, Union
 
 from fastapi import APIRouter, status, Depends, HTTPException, Response
 from jose import jwt
 from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.session import Session
 
 from app.config import settings
 from app.domain import User
 from app.domain.user import UserDoesNotExistError, UserIsAlreadyExistsError
 from app.domain.user.exception import AuthenticateError
-from app.infrastructure.database import get_session
-from app.infrastructure.user import UserRepository
-from app.usecase.user import UserQueryUseCase, UserCommandUseCase
-from app.usecase.user import UserRegisterDTO, UserCreateDTO, UserReadDTO
-from app.usecase.user.dto.query import JWTTokenDTO, UserLoginDTO
-from app.utils import get_authorization_from_headers, create_access_token
+from app.routers.session import get_db_session, get_db_read_session
+from app.infrastructure.user import AsyncUserRepository
+from app.usecase.user import AsyncUserQueryUseCase, AsyncUserCommandUseCase
+from app.usecase.user import UserRegisterDTO, UserCreateDTO, UserReadDTO, principal_cache
+from app.usecase.user.dto.query import JWTTokenDTO, UserLoginDTO, CacheStatsDTO
+from app.utils import get_authorization_from_headers, create_access_token, PasswordHasherBusyError
 
 api = APIRouter()
 
 
-def user_command_usecase(session: Session = Depends(get_session)) -> UserCommandUseCase:
+def user_command_usecase(session: Union[Session, AsyncSession] = Depends(get_db_session)) -> AsyncUserCommandUseCase:
     """
     创建 User Command UseCase 依赖
     """
-    repository: UserRepository = UserRepository(session)
-    return UserCommandUseCase(repository)
+    repository: AsyncUserRepository = AsyncUserRepository(session)
+    return AsyncUserCommandUseCase(repository)
 
 
-def user_query_usecase(session: Session = Depends(get_session)) -> UserQueryUseCase:
+def user_query_usecase(session: Union[Session, AsyncSession] = Depends(get_db_read_session)) -> AsyncUserQueryUseCase:
     """
     创建 User Query UseCase 依赖
     """
-    repository: UserRepository = UserRepository(session)
-    return UserQueryUseCase(repository)
+    repository: AsyncUserRepository = AsyncUserRepository(session)
+    return AsyncUserQueryUseCase(repository)
 
 
-def get_current_user(
+async def get_current_user(
     token: str = Depends(get_authorization_from_headers),
-    query_usecase: UserQueryUseCase = Depends(user_query_usecase),
+    query_usecase: AsyncUserQueryUseCase = Depends(user_query_usecase),
 ) -> UserReadDTO:
     """
     通过 JWT 获取当前登录的用户
@@ -48,16 +49,20 @@ def get_current_user(
         payload: Dict[str, str] = jwt.decode(token, settings.SECRET_KEY)
     except jwt.JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token已失效")
-    try:
-        user = query_usecase.fetch_one(user_id=int(payload.get("sub")))
-    except UserDoesNotExistError as e:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=e.message)
+    user_id = int(payload.get("sub"))
+    user = principal_cache.get(user_id)
+    if user is None:
+        try:
+            user = await query_usecase.fetch_one(user_id=user_id)
+        except UserDoesNotExistError as e:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=e.message)
+        principal_cache.set(user_id, user)
     if not user.is_active:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="用户未激活")
     return user
 
 
-def get_current_superuser(
+async def get_current_superuser(
     current_user: UserReadDTO = Depends(get_current_user),
 ) -> UserReadDTO:
     """
@@ -68,18 +73,28 @@ def get_current_superuser(
     return current_user
 
 
+def raise_service_busy(e: PasswordHasherBusyError):
+    """
+    密码哈希任务排队已满, 让客户端稍后重试
+    """
+    logger.warning(f"密码哈希任务排队已满: {e}")
+    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=e.message, headers={"Retry-After": "1"})
+
+
 @api.post("/login", response_model=JWTTokenDTO)
-async def login(data: UserLoginDTO, query_usecase: UserQueryUseCase = Depends(user_query_usecase)):
+async def login(data: UserLoginDTO, query_usecase: AsyncUserQueryUseCase = Depends(user_query_usecase)):
     """
     用户登录
     权限要求: 无
     """
     try:
-        user = query_usecase.authenticate(username=data.username, email=data.email, plain_password=data.password)
+        user = await query_usecase.authenticate(username=data.username, email=data.email, plain_password=data.password)
     except (UserDoesNotExistError, AuthenticateError) as e:
         # 避免用户名爆破攻击, 不能直接返回真实原因
         logger.info(f"用户登录失败: 用户名={data.username or data.email}, 原因={e.message}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="用户名或密码不正确")
+    except PasswordHasherBusyError as e:
+        raise_service_busy(e)
     except Exception as e:
         logger.error(f"系统错误: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="系统错误")
@@ -91,16 +106,18 @@ async def login(data: UserLoginDTO, query_usecase: UserQueryUseCase = Depends(us
 @api.post("/register", status_code=status.HTTP_201_CREATED, response_model=UserReadDTO)
 async def register(
     data: UserRegisterDTO,
-    command_usecase: UserCommandUseCase = Depends(user_command_usecase),
+    command_usecase: AsyncUserCommandUseCase = Depends(user_command_usecase),
 ) -> UserReadDTO:
     """
     用户注册
     权限要求: 无
     """
     try:
-        user = command_usecase.register_user(data)
+        user = await command_usecase.register_user(data)
     except UserIsAlreadyExistsError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
+    except PasswordHasherBusyError as e:
+        raise_service_busy(e)
     except Exception as e:
         logger.info(f"注册用户失败: {e}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="注册用户失败")
@@ -119,9 +136,20 @@ async def get_me(
     return current_user
 
 
+@api.get("/users/principal-cache", response_model=CacheStatsDTO)
+async def get_principal_cache_stats(
+    current_user: UserReadDTO = Depends(get_current_superuser),
+):
+    """
+    获取已认证用户缓存的命中情况
+    权限要求: 已登录的超级用户
+    """
+    return principal_cache.stats()
+
+
 @api.get("/users", response_model=List[UserReadDTO])
 async def get_users(
-    query_usecase: UserQueryUseCase = Depends(user_query_usecase),
+    query_usecase: AsyncUserQueryUseCase = Depends(user_query_usecase),
     current_user: UserReadDTO = Depends(get_current_superuser),
 ) -> List[UserReadDTO]:
     """
@@ -129,7 +157,7 @@ async def get_users(
     权限要求: 已登录的超级用户
     """
     try:
-        users = query_usecase.fetch_all()
+        users = await query_usecase.fetch_all()
     except Exception as e:
         logger.info(f"查询所有用户失败: {e}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="查询所有用户失败")
@@ -140,7 +168,7 @@ async def get_users(
 @api.get("/users/{user_id}", response_model=UserReadDTO)
 async def get_user(
     user_id: int,
-    query_usecase: UserQueryUseCase = Depends(user_query_usecase),
+    query_usecase: AsyncUserQueryUseCase = Depends(user_query_usecase),
     current_user: UserReadDTO = Depends(get_current_superuser),
 ):
     """
@@ -148,7 +176,7 @@ async def get_user(
     权限要求: 已登录的超级用户
     """
     try:
-        user = query_usecase.fetch_one(user_id)
+        user = await query_usecase.fetch_one(user_id)
     except UserDoesNotExistError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.message)
     except Exception as e:
@@ -165,7 +193,7 @@ async def get_user(
 )
 async def create_user(
     data: UserCreateDTO,
-    command_usecase: UserCommandUseCase = Depends(user_command_usecase),
+    command_usecase: AsyncUserCommandUseCase = Depends(user_command_usecase),
     current_user: UserReadDTO = Depends(get_current_superuser),
 ):
     """
@@ -173,9 +201,11 @@ async def create_user(
     权限要求: 已登录的超级用户
     """
     try:
-        user = command_usecase.create_user(data)
+        user = await command_usecase.create_user(data)
     except UserIsAlreadyExistsError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
+    except PasswordHasherBusyError as e:
+        raise_service_busy(e)
     except Exception as e:
         logger.info(f"创建用户失败: {e}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="创建用户失败")
@@ -186,7 +216,7 @@ async def create_user(
 @api.delete("/users/{user_id}")
 async def delete_user(
     user_id: int,
-    command_usecase: UserCommandUseCase = Depends(user_command_usecase),
+    command_usecase: AsyncUserCommandUseCase = Depends(user_command_usecase),
     current_user: UserReadDTO = Depends(get_current_superuser),
 ):
     """
@@ -194,7 +224,7 @@ async def delete_user(
     权限要求: 已登录的超级用户
     """
     try:
-        command_usecase.delete_user(user_id)
+        await command_usecase.delete_user(user_id)
     except Exception as e:
         logger.info(f"删除用户失败: {e}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="删除用户失败")
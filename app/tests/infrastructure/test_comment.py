@@ -0,0 +1,257 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.domain.comment import Comment, CommentTreeNode
+from app.infrastructure.comment import CommentRepository, CommentDO, AsyncCommentRepository
+from app.infrastructure.comment import repository as comment_repository
+from app.infrastructure.comment.do import COMMENT_SEARCH_TABLE, upgrade_comment_search
+from app.infrastructure.comment.maintenance import backfill_comment_paths, rebuild_comment_counters
+from app.infrastructure.database import Base
+from app.tests.setup_test_db import TestingSessionLocal, engine, ASYNC_SQLALCHEMY_DATABASE_URL
+from app.usecase.comment.serializer import dumps_comment_forest, dumps_compact_forest
+from app.usecase.comment.usecase import AsyncCommentQueryUseCase
+
+
+def create_chain(repository: CommentRepository, depth: int) -> Comment:
+    """
+    创建一条 depth 层嵌套的评论链, 返回根评论
+    """
+    root = parent = repository.save(Comment(content="测试评论", created_by="test", created_at=datetime.utcnow()))
+    for _ in range(depth - 1):
+        parent = repository.save(
+            Comment(content="测试回复", created_by="test", parent_id=parent.id, created_at=datetime.utcnow())
+        )
+    return root
+
+
+def count_find_all_queries(repository: CommentRepository) -> int:
+    statements: List[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        repository.find_all()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return len(statements)
+
+
+def test_find_all_query_count_is_constant():
+    """
+    评论树变大时, find_all 的查询次数保持不变
+    """
+    session = TestingSessionLocal()
+    repository = CommentRepository(session)
+    create_chain(repository, depth=5)
+    small_tree_queries = count_find_all_queries(repository)
+    for _ in range(5):
+        create_chain(repository, depth=20)
+    large_tree_queries = count_find_all_queries(repository)
+    session.close()
+    assert small_tree_queries == large_tree_queries == 1
+
+
+def test_find_all_builds_tree():
+    session = TestingSessionLocal()
+    repository = CommentRepository(session)
+    root = create_chain(repository, depth=3)
+    comments = repository.find_all()
+    session.close()
+
+    node: CommentTreeNode = next(comment for comment in comments if comment.id == root.id)
+    depth = 1
+    while node.children:
+        assert len(node.children) == 1
+        node = node.children[0]
+        depth += 1
+    assert depth == 3
+    # 根评论按创建时间倒序排列
+    created_ats = [comment.created_at for comment in comments]
+    assert created_ats == sorted(created_ats, reverse=True)
+
+
+def test_find_all_compact_matches_find_all():
+    session = TestingSessionLocal()
+    repository = CommentRepository(session)
+    root = create_chain(repository, depth=3)
+    forest = repository.find_all_compact()
+    comments = repository.find_all()
+    session.close()
+
+    assert dumps_compact_forest(forest) == dumps_comment_forest(comments)
+    node = forest.find(root.id)
+    assert node.descendant_count == 2 and node.children[0].children[0].parent_id == node.children[0].id
+
+
+def test_find_descendants_in_display_order():
+    session = TestingSessionLocal()
+    repository = CommentRepository(session)
+    root = create_chain(repository, depth=3)
+    second = repository.save(
+        Comment(content="测试回复", created_by="test", parent_id=root.id, created_at=datetime.utcnow())
+    )
+    comments = repository.find_descendants(root.id)
+    session.close()
+
+    # 先序遍历: 根评论, 第一条回复及其子回复, 第二条回复
+    assert [comment.id for comment in comments][0] == root.id
+    assert [comment.id for comment in comments][-1] == second.id
+    assert len(comments) == 4
+
+
+def test_siblings_ordered_by_created_at():
+    """
+    导入的评论 id 顺序与创建时间不一致, 各处的同级评论都与 find_children 的分页顺序一致, 按 (created_at, id) 排列
+    """
+    session = TestingSessionLocal()
+    repository = CommentRepository(session)
+    now = datetime.utcnow()
+    root = repository.save(Comment(content="测试评论", created_by="test", created_at=now))
+    later, earlier = [
+        repository.save(Comment(content="测试回复", created_by="test", parent_id=root.id, created_at=created_at))
+        for created_at in (now + timedelta(minutes=2), now + timedelta(minutes=1))
+    ]
+    nested = repository.save(Comment(content="测试回复", created_by="test", parent_id=earlier.id, created_at=now))
+    expected = [earlier.id, later.id]
+    children, _ = repository.find_children(root.id, 10)
+    tree = repository.find_tree(root.id)
+    forest = repository.find_all_compact()
+    comments = repository.find_all()
+    descendants = repository.find_descendants(root.id)
+    repository.remove_tree(root.id)
+    session.close()
+
+    assert [child.id for child in children] == expected
+    assert [child.id for child in tree.children] == expected
+    assert [child.id for child in forest.find(root.id).children] == expected
+    assert dumps_compact_forest(forest) == dumps_comment_forest(comments)
+    assert [comment.id for comment in descendants] == [root.id, earlier.id, nested.id, later.id]
+
+
+def test_backfill_comment_paths():
+    session = TestingSessionLocal()
+    repository = CommentRepository(session)
+    root = create_chain(repository, depth=3)
+    expected = [comment.id for comment in repository.find_descendants(root.id)]
+    session.query(CommentDO).filter(CommentDO.id.in_(expected)).update({"path": None})
+    session.commit()
+    assert repository.find_descendants(root.id) == []
+
+    assert backfill_comment_paths(session) >= len(expected)
+    assert [comment.id for comment in repository.find_descendants(root.id)] == expected
+    session.close()
+
+
+def test_comment_counters():
+    session = TestingSessionLocal()
+    repository = CommentRepository(session)
+    count = repository.count()
+    root = create_chain(repository, depth=3)
+    second = repository.save(
+        Comment(content="测试回复", created_by="test", parent_id=root.id, created_at=datetime.utcnow())
+    )
+    assert repository.count() == count + 4
+    root = repository.find(root.id)
+    assert (root.reply_count, root.descendant_count) == (2, 3)
+
+    # 删除中间的评论, 其子评论随之从评论树中移除
+    middle = repository.find_descendants(root.id)[1]
+    repository.remove(middle.id)
+    root = repository.find(root.id)
+    assert (root.reply_count, root.descendant_count) == (1, 1)
+    assert repository.count() == count + 3
+
+    # 破坏计数后可以批量修复
+    session.query(CommentDO).filter(CommentDO.id.in_([root.id, second.id])).update(
+        {"reply_count": 10, "descendant_count": 10}
+    )
+    session.commit()
+    assert rebuild_comment_counters(session) == 2
+    root = repository.find(root.id)
+    assert (root.reply_count, root.descendant_count) == (1, 1)
+    assert repository.count() == session.query(CommentDO).count()
+    session.close()
+
+
+def test_async_comment_repository():
+    async def run():
+        async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, future=True)
+        async with AsyncSession(async_engine) as session:
+            repository = AsyncCommentRepository(session)
+            root = await repository.save(Comment(content="测试评论", created_by="test", created_at=datetime.utcnow()))
+            await repository.save(
+                Comment(content="测试回复", created_by="test", parent_id=root.id, created_at=datetime.utcnow())
+            )
+            found = await repository.find(root.id)
+            # 只代理 CommentBaseRepository 中声明的方法
+            with pytest.raises(AttributeError):
+                repository.update_counters
+            tree = await AsyncCommentQueryUseCase(repository).fetch_tree(root.id)
+        await async_engine.dispose()
+        return root, found, tree
+
+    root, found, tree = asyncio.run(run())
+    assert found.id == root.id
+    assert found.reply_count == found.descendant_count == 1
+    assert tree.id == root.id
+    assert len(tree.children) == 1
+
+
+def test_upgrade_comment_search(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'upgrade.db'}", future=True)
+    Base.metadata.create_all(engine)
+    # 模拟加入全文索引之前创建的数据库
+    with engine.begin() as connection:
+        for suffix in ("insert", "delete", "update"):
+            connection.exec_driver_sql(f"DROP TRIGGER {COMMENT_SEARCH_TABLE}_{suffix}")
+        connection.exec_driver_sql(f"DROP TABLE {COMMENT_SEARCH_TABLE}")
+    session = sessionmaker(bind=engine)()
+    repository = CommentRepository(session)
+    repository.save(Comment(content="升级前的评论", created_by="test", created_at=datetime.utcnow()))
+    with pytest.raises(OperationalError):
+        repository.search("升级前", 10)
+    session.rollback()
+
+    with engine.begin() as connection:
+        upgrade_comment_search(connection)
+    repository.save(Comment(content="升级后的评论", created_by="test", created_at=datetime.utcnow()))
+    results, _ = repository.search("的评论", 10)
+    assert [comment.content for comment, _ in results] == ["升级后的评论", "升级前的评论"]
+
+    # 只在固定的排序窗口内分页, 窗口之后没有下一页
+    monkeypatch.setattr(comment_repository, "SEARCH_RANK_WINDOW", 1)
+    assert len(repository.search("的评论", 1)[0]) == 1 and not repository.search("的评论", 1)[1]
+    assert repository.search("的评论", 1, offset=1) == ([], False)
+    session.close()
+    engine.dispose()
+
+
+def test_save_all_without_preallocated_ids(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'save_all.db'}", future=True)
+    Base.metadata.create_all(engine)
+    # 非 SQLite 数据库上不能预先分配 id, 逐条写入
+    monkeypatch.setattr(engine.dialect, "name", "postgresql")
+    with sessionmaker(bind=engine)() as session:
+        repository = CommentRepository(session)
+        root = repository.save(Comment(content="已有评论", created_by="test", created_at=datetime.utcnow()))
+        comments = [
+            Comment(content=content, created_by="test", parent_id=parent_id, created_at=datetime.utcnow())
+            for content, parent_id in (("回复", root.id), ("回复的回复", None), ("根评论", None))
+        ]
+        ids = repository.save_all(comments, [None, 0, None])
+        tree = repository.find_tree(root.id)
+        assert ids == sorted(ids) and root.id not in ids
+        assert tree.descendant_count == 2 and tree.children[0].id == ids[0]
+        assert tree.children[0].children[0].id == ids[1]
+        assert repository.find(ids[2]).parent_id is None
+        assert repository.count() == 4
+    engine.dispose()
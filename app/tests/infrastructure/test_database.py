@@ -0,0 +1,24 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.infrastructure.database import configure_sqlite_connections
+
+
+def test_sqlite_read_only_connections(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'read_write.db'}"
+    write_engine = create_engine(uri, future=True)
+    read_engine = create_engine(uri, future=True)
+    configure_sqlite_connections(write_engine)
+    configure_sqlite_connections(read_engine, read_only=True)
+
+    with write_engine.begin() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        connection.execute(text("CREATE TABLE item (id INTEGER PRIMARY KEY)"))
+        connection.execute(text("INSERT INTO item (id) VALUES (1)"))
+    with read_engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM item")).scalar() == 1
+        with pytest.raises(OperationalError):
+            connection.execute(text("INSERT INTO item (id) VALUES (2)"))
+    write_engine.dispose()
+    read_engine.dispose()
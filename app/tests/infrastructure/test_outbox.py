@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.domain.comment import Comment, CommentCreated, CommentDeleted
+from app.infrastructure.comment import CommentRepository
+from app.infrastructure.database import Base
+from app.infrastructure.outbox import OutboxDispatcher, OutboxRepository
+
+
+@pytest.fixture(autouse=True)
+def outbox_enabled(monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_ENABLED", True)
+
+
+def make_session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}", future=True)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def test_events_written_with_comments(tmp_path):
+    session = make_session_factory(tmp_path)()
+    repository = CommentRepository(session)
+    root = repository.save(Comment(content="根评论", created_by="test", created_at=datetime.utcnow()))
+    reply = repository.save(Comment(content="回复", created_by="test", parent_id=root.id, created_at=datetime.utcnow()))
+    ids = repository.save_all([Comment(content="批量", created_by="test", created_at=datetime.utcnow())], [None])
+    # 关闭事件的批量写入(例如离线导入)不写入 outbox
+    repository.save_all([Comment(content="导入", created_by="test", created_at=datetime.utcnow())], [None], False)
+    repository.remove(reply.id)
+
+    events = [item for _, _, item in OutboxRepository(session).claim(10, lease_seconds=30)]
+    assert events == [
+        CommentCreated(comment_id=root.id, parent_id=None, created_by="test"),
+        CommentCreated(comment_id=reply.id, parent_id=root.id, created_by="test"),
+        CommentCreated(comment_id=ids[0], parent_id=None, created_by="test"),
+        CommentDeleted(comment_id=reply.id, parent_id=root.id),
+    ]
+    # 租约期内不会被重复认领
+    assert OutboxRepository(session).claim(10, lease_seconds=30) == []
+    session.close()
+
+
+def test_dispatcher_delivers_and_retries(tmp_path):
+    session_factory = make_session_factory(tmp_path)
+    session = session_factory()
+    repository = CommentRepository(session)
+    for index in range(3):
+        repository.save(Comment(content=f"评论{index}", created_by="test", created_at=datetime.utcnow()))
+    session.close()
+
+    received = []
+    failures = []
+
+    def collect(events):
+        received.append([item.comment_id for item in events])
+
+    async def flaky(events):
+        if not failures:
+            failures.append(events)
+            raise RuntimeError("订阅者暂时不可用")
+
+    dispatcher = OutboxDispatcher(session_factory, batch_size=2, max_attempts=2)
+    dispatcher.subscribe(CommentCreated, collect)
+    dispatcher.subscribe(CommentCreated, flaky)
+
+    async def dispatch_all():
+        while await dispatcher.dispatch_once():
+            pass
+
+    asyncio.run(dispatch_all())
+    # 第一批失败后重新投递, 订阅者会再次收到同样的事件
+    assert received == [[1, 2], [1, 2], [3]]
+    session = session_factory()
+    assert OutboxRepository(session).count() == 0
+    session.close()
@@ -0,0 +1,36 @@
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .setup_test_db import engine as test_engine
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_queries: int, engine: Engine = test_engine) -> Iterator[List[str]]:
+    """
+    断言代码块中执行的 SQL 条数不超过 max_queries, 超出时列出执行过的全部 SQL, 用于发现 N+1 查询
+    用法:
+        with query_budget(3):
+            client.get("/api/v1/comments")
+    """
+    statements: List[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    if len(statements) > max_queries:
+        details = "\n".join(
+            f"  [{index}] {' '.join(statement.split())}" for index, statement in enumerate(statements, 1)
+        )
+        raise QueryBudgetExceeded(f"执行了 {len(statements)} 条 SQL, 超出预算 {max_queries} 条:\n{details}")
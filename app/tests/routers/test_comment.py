@@ -1,14 +1,20 @@
+import json
 import time
 
+import pytest
+
 from fastapi.testclient import TestClient
 
-from app.infrastructure.database import get_session
+from app.routers.session import get_session, get_read_session
+from app.tests.query_budget import query_budget, QueryBudgetExceeded
 from app.tests.setup_test_db import override_get_session
+from app.usecase.comment import comment_tree_cache
 from server import app
 
 from .test_user import superuser_token_in_headers, normal_user_token_in_headers
 
 app.dependency_overrides[get_session] = override_get_session
+app.dependency_overrides[get_read_session] = override_get_session
 
 client = TestClient(app)
 
@@ -45,6 +51,11 @@ def test_create_comment(normal_user_token_in_headers):
     response_data = response.json()
     assert response_data["content"] == data["content"]
 
+    response = client.post(
+        "/api/v1/comments", json={**data, "parent_id": 10**9}, headers=normal_user_token_in_headers
+    )
+    assert response.status_code == 404
+
 
 def test_delete_comment(superuser_token_in_headers):
     """
@@ -55,3 +66,285 @@ def test_delete_comment(superuser_token_in_headers):
     comment_id = response.json()["id"]
     response = client.delete(f"/api/v1/comments/{comment_id}", headers=superuser_token_in_headers)
     assert response.status_code == 204
+
+
+def test_delete_comment_cascade(superuser_token_in_headers):
+    """
+    级联删除整棵子树
+    """
+
+    def create(parent_id=None):
+        data = {"content": "级联删除测试", "parent_id": parent_id}
+        return client.post("/api/v1/comments", json=data, headers=superuser_token_in_headers).json()["id"]
+
+    root_id = create()
+    reply_id = create(root_id)
+    nested_ids = [create(reply_id), create(reply_id)]
+    create(nested_ids[0])
+    sibling_id = create(root_id)
+    count = client.get("/api/v1/comments/count/").json()["count"]
+
+    response = client.delete(f"/api/v1/comments/{reply_id}?cascade=true", headers=superuser_token_in_headers)
+    assert response.status_code == 200
+    assert response.json() == {"count": 4}
+    assert client.get("/api/v1/comments/count/").json()["count"] == count - 4
+    root = client.get(f"/api/v1/comments/{root_id}").json()
+    assert root["reply_count"] == 1 and root["descendant_count"] == 1
+    assert client.get(f"/api/v1/comments/{nested_ids[1]}").status_code == 404
+
+    response = client.delete(f"/api/v1/comments/{reply_id}?cascade=true", headers=superuser_token_in_headers)
+    assert response.status_code == 404
+    response = client.delete(f"/api/v1/comments/{root_id}?cascade=true", headers=superuser_token_in_headers)
+    assert response.json() == {"count": 2}
+    assert client.get(f"/api/v1/comments/{sibling_id}").status_code == 404
+
+
+def test_delete_comment_responses_documented():
+    responses = client.get("/openapi.json").json()["paths"]["/api/v1/comments/{comment_id}"]["delete"]["responses"]
+    assert "content" not in responses["204"]
+    assert responses["200"]["content"]["application/json"]["schema"] == {"$ref": "#/components/schemas/CommentCountDTO"}
+
+
+def test_get_comments_by_page(normal_user_token_in_headers):
+    for _ in range(5):
+        response = client.post("/api/v1/comments", json={"content": "测试评论"}, headers=normal_user_token_in_headers)
+        client.post(
+            "/api/v1/comments",
+            json={"content": "测试回复", "parent_id": response.json()["id"]},
+            headers=normal_user_token_in_headers,
+        )
+    root_ids = [comment["id"] for comment in client.get("/api/v1/comments").json()]
+
+    page_ids, cursor = [], None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/v1/comments", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) <= 2
+        page_ids.extend(comment["id"] for comment in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert page_ids == root_ids
+
+
+def test_get_comments_by_invalid_cursor():
+    response = client.get("/api/v1/comments", params={"limit": 2, "cursor": "invalid"})
+    assert response.status_code == 400
+
+
+def test_get_comment_tree(normal_user_token_in_headers):
+    response = client.post("/api/v1/comments", json={"content": "测试评论"}, headers=normal_user_token_in_headers)
+    root_id = parent_id = response.json()["id"]
+    for _ in range(5):
+        response = client.post(
+            "/api/v1/comments",
+            json={"content": "测试回复", "parent_id": parent_id},
+            headers=normal_user_token_in_headers,
+        )
+        parent_id = response.json()["id"]
+
+    def tree_depth(node: dict) -> int:
+        depth = 0
+        while node["children"]:
+            node = node["children"][0]
+            depth += 1
+        return depth
+
+    response = client.get(f"/api/v1/comments/{root_id}/tree")
+    assert response.status_code == 200
+    assert response.json()["id"] == root_id
+    assert tree_depth(response.json()) == 5
+
+    response = client.get(f"/api/v1/comments/{root_id}/tree", params={"max_depth": 2})
+    assert response.status_code == 200
+    assert tree_depth(response.json()) == 2
+
+    response = client.get("/api/v1/comments/0/tree")
+    assert response.status_code == 404
+
+
+def test_get_comment_children(normal_user_token_in_headers):
+    """
+    评论树只返回部分回复, 通过 children_cursor 逐页加载其余回复
+    """
+
+    def create(parent_id=None):
+        data = {"content": "加载更多测试", "parent_id": parent_id}
+        return client.post("/api/v1/comments", json=data, headers=normal_user_token_in_headers).json()["id"]
+
+    root_id = create()
+    reply_ids = [create(root_id) for _ in range(5)]
+    nested_ids = [create(reply_ids[3]) for _ in range(2)]
+
+    tree = client.get(f"/api/v1/comments/{root_id}/tree", params={"max_children": 2}).json()
+    assert [child["id"] for child in tree["children"]] == reply_ids[:2]
+    assert tree["reply_count"] == 5 and tree["children_cursor"]
+    assert tree["children"][0]["children_cursor"] is None
+
+    loaded, cursor = [], tree["children_cursor"]
+    while cursor:
+        response = client.get(f"/api/v1/comments/{root_id}/children", params={"cursor": cursor, "limit": 2})
+        assert response.status_code == 200
+        page = response.json()
+        loaded += page["items"]
+        cursor = page["next_cursor"]
+    assert [item["id"] for item in loaded] == reply_ids[2:]
+    # 默认只返回回复本身, 根据 reply_count 判断是否还能继续展开
+    assert loaded[1]["children"] == [] and loaded[1]["reply_count"] == 2
+
+    page = client.get(f"/api/v1/comments/{reply_ids[3]}/children", params={"max_depth": 1, "max_children": 1}).json()
+    assert [item["id"] for item in page["items"]] == nested_ids and page["next_cursor"] is None
+
+    page = client.get("/api/v1/comments", params={"limit": 1, "max_children": 1, "max_depth": 1}).json()
+    assert page["items"][0]["id"] == root_id
+    assert [child["id"] for child in page["items"][0]["children"]] == reply_ids[:1]
+    assert client.get("/api/v1/comments/0/children").status_code == 404
+    assert client.get(f"/api/v1/comments/{root_id}/children", params={"cursor": "!"}).status_code == 400
+
+
+def test_get_comments_not_modified(normal_user_token_in_headers):
+    response = client.get("/api/v1/comments")
+    etag = response.headers["ETag"]
+    response = client.get("/api/v1/comments", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    # 写操作后缓存失效, 旧的 ETag 不再命中
+    client.post("/api/v1/comments", json={"content": "测试评论"}, headers=normal_user_token_in_headers)
+    response = client.get("/api/v1/comments", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_export_comments(normal_user_token_in_headers, superuser_token_in_headers):
+    response = client.post("/api/v1/comments", json={"content": "测试评论"}, headers=normal_user_token_in_headers)
+    root_id = response.json()["id"]
+    data = {"content": "测试回复", "parent_id": root_id}
+    response = client.post("/api/v1/comments", json=data, headers=normal_user_token_in_headers)
+    reply_id = response.json()["id"]
+
+    response = client.get("/api/v1/comments/export", headers=normal_user_token_in_headers)
+    assert response.status_code == 403
+    response = client.get("/api/v1/comments/export", params={"batch_size": 7}, headers=superuser_token_in_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == client.get("/api/v1/comments/count/").json()["count"]
+    ids = [line["id"] for line in lines]
+    assert ids == sorted(ids)
+    comments = {line["id"]: line for line in lines}
+    assert comments[root_id]["depth"] == 0
+    assert comments[reply_id]["parent_id"] == root_id
+    assert comments[reply_id]["depth"] == 1
+
+
+def test_create_comments_in_bulk(normal_user_token_in_headers, superuser_token_in_headers):
+    response = client.post("/api/v1/comments", json={"content": "测试评论"}, headers=normal_user_token_in_headers)
+    parent_id = response.json()["id"]
+    count = client.get("/api/v1/comments/count/").json()["count"]
+    items = [
+        {"content": "批量根评论"},
+        {"content": "批量回复一", "parent_index": 0},
+        {"content": "批量回复二", "parent_index": 1},
+        {"content": "回复已有评论", "parent_id": parent_id},
+    ]
+
+    response = client.post("/api/v1/comments/bulk", json={"items": items}, headers=normal_user_token_in_headers)
+    assert response.status_code == 403
+    response = client.post(
+        "/api/v1/comments/bulk",
+        json={"items": [{"content": "测试评论", "parent_index": 0}]},
+        headers=superuser_token_in_headers,
+    )
+    assert response.status_code == 400  # parent_index 必须指向之前的评论
+    response = client.post(
+        "/api/v1/comments/bulk",
+        json={"items": [{"content": "测试评论", "parent_id": 10**9}]},
+        headers=superuser_token_in_headers,
+    )
+    assert response.status_code == 404
+    assert client.get("/api/v1/comments/count/").json()["count"] == count
+
+    response = client.post("/api/v1/comments/bulk", json={"items": items}, headers=superuser_token_in_headers)
+    assert response.status_code == 201
+    result = response.json()
+    assert result["count"] == 4
+    assert client.get("/api/v1/comments/count/").json()["count"] == count + 4
+
+    root_id, _, leaf_id, reply_id = result["ids"]
+    tree = client.get(f"/api/v1/comments/{root_id}/tree").json()
+    assert (tree["reply_count"], tree["descendant_count"]) == (1, 2)
+    assert tree["children"][0]["children"][0]["id"] == leaf_id
+    parent = client.get(f"/api/v1/comments/{parent_id}").json()
+    assert (parent["reply_count"], parent["descendant_count"]) == (1, 1)
+    assert client.get(f"/api/v1/comments/{reply_id}").json()["parent_id"] == parent_id
+
+
+def test_server_timing():
+    response = client.get("/api/v1/comments/count/")
+    server_timing = response.headers["Server-Timing"]
+    assert 'desc="1 queries"' in server_timing
+    assert "ser;dur=" in server_timing and "app;dur=" in server_timing
+
+
+def test_query_budget(superuser_token_in_headers):
+    """
+    读取评论的 SQL 条数与评论数量无关, 防止逐个节点懒加载的 N+1 查询
+    """
+    items = [{"content": "预算测试评论"}]
+    items += [{"content": "预算测试回复", "parent_index": index // 3} for index in range(999)]
+    response = client.post("/api/v1/comments/bulk", json={"items": items}, headers=superuser_token_in_headers)
+    root_id = response.json()["ids"][0]
+
+    comment_tree_cache.bump()
+    with query_budget(3):
+        response = client.get("/api/v1/comments")
+    assert response.status_code == 200
+    comment_tree_cache.bump()
+    with query_budget(3):
+        client.get("/api/v1/comments", params={"limit": 20})
+    with query_budget(1):
+        response = client.get(f"/api/v1/comments/{root_id}/tree")
+    assert response.json()["descendant_count"] == 999
+    with query_budget(1):
+        response = client.get(f"/api/v1/comments/{root_id}/tree", params={"max_children": 2, "max_depth": 3})
+    assert len(response.json()["children"]) == 2
+    with query_budget(2):
+        client.get(f"/api/v1/comments/{root_id}/children", params={"limit": 2})
+    with query_budget(1):
+        client.get(f"/api/v1/comments/{root_id}")
+    with query_budget(1):
+        client.get("/api/v1/comments/count/")
+
+    with pytest.raises(QueryBudgetExceeded, match="FROM comment"):
+        with query_budget(0):
+            client.get(f"/api/v1/comments/{root_id}")
+
+
+def test_search_comments(normal_user_token_in_headers, superuser_token_in_headers):
+    for content in ("全文搜索的第一条评论", "另一条全文搜索评论 FastAPI", "无关内容"):
+        client.post("/api/v1/comments", json={"content": content}, headers=normal_user_token_in_headers)
+
+    response = client.get("/api/v1/comments/search", params={"q": "全文搜索", "limit": 1})
+    assert response.status_code == 200
+    page = response.json()
+    assert len(page["items"]) == 1 and page["next_offset"] == 1
+    assert "【全文搜索】" in page["items"][0]["snippet"]
+    page = client.get("/api/v1/comments/search", params={"q": "全文搜索", "offset": 1}).json()
+    assert len(page["items"]) == 1 and page["next_offset"] is None
+
+    # 多个词同时匹配, 英文不区分大小写
+    items = client.get("/api/v1/comments/search", params={"q": "全文搜索 fastapi"}).json()["items"]
+    assert [item["content"] for item in items] == ["另一条全文搜索评论 FastAPI"]
+    # 少于 3 个字符的词不走全文索引
+    items = client.get("/api/v1/comments/search", params={"q": "无关"}).json()["items"]
+    assert items[0]["snippet"] == "【无关】内容"
+
+    # 删除的评论同时从索引中移除
+    client.delete(f"/api/v1/comments/{items[0]['id']}", headers=superuser_token_in_headers)
+    assert client.get("/api/v1/comments/search", params={"q": "无关内容"}).json()["items"] == []
+    assert client.get("/api/v1/comments/search", params={"q": " "}).json()["items"] == []
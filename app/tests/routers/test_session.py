@@ -0,0 +1,51 @@
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from app.config import settings
+from app.infrastructure import database
+from app.infrastructure.database import configure_sqlite_connections
+from app.routers.session import READ_YOUR_WRITES_COOKIE, ReadYourWritesMiddleware, get_read_session, get_session
+
+
+def test_pinned_reads_share_writer_session(tmp_path, monkeypatch):
+    """
+    读写分离时写引擎只有一个连接, 客户端被固定到写引擎后, 同一请求中的读会话与写会话不能各占一个连接
+    """
+    uri = f"sqlite:///{tmp_path / 'pinned.db'}"
+    options = {"future": True, "poolclass": QueuePool, "max_overflow": 0, "connect_args": {"check_same_thread": False}}
+    write_engine = create_engine(uri, pool_size=1, pool_timeout=1, **options)
+    read_engine = create_engine(uri, pool_size=2, **options)
+    configure_sqlite_connections(write_engine)
+    configure_sqlite_connections(read_engine, read_only=True)
+    with write_engine.begin() as connection:
+        connection.execute(text("CREATE TABLE item (id INTEGER PRIMARY KEY)"))
+    monkeypatch.setattr(database, "engine", write_engine)
+    monkeypatch.setattr(database, "read_engine", read_engine)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(autocommit=False, bind=write_engine))
+    monkeypatch.setattr(database, "ReadSessionLocal", sessionmaker(autocommit=False, bind=read_engine))
+    monkeypatch.setattr(settings, "READ_YOUR_WRITES_SECONDS", 60)
+
+    app = FastAPI()
+    app.add_middleware(ReadYourWritesMiddleware, seconds=60)
+
+    # 与 get_current_user 一样在写请求中使用读会话
+    def count_items(session: Session = Depends(get_read_session)) -> int:
+        return session.execute(text("SELECT COUNT(*) FROM item")).scalar()
+
+    @app.post("/items")
+    def create_item(count: int = Depends(count_items), session: Session = Depends(get_session)) -> int:
+        session.execute(text("INSERT INTO item DEFAULT VALUES"))
+        session.commit()
+        return count + 1
+
+    client = TestClient(app)
+    assert client.post("/items").json() == 1
+    assert READ_YOUR_WRITES_COOKIE in client.cookies
+    # 第二次写入时读会话已固定到写引擎
+    assert client.post("/items").json() == 2
+    assert client.post("/items").json() == 3
+    write_engine.dispose()
+    read_engine.dispose()
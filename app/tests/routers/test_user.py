@@ -1,11 +1,12 @@
 import pytest
 from fastapi.testclient import TestClient
 
-from app.infrastructure.database import get_session
+from app.routers.session import get_session, get_read_session
 from app.tests.setup_test_db import override_get_session
 from server import app
 
 app.dependency_overrides[get_session] = override_get_session
+app.dependency_overrides[get_read_session] = override_get_session
 
 client = TestClient(app)
 
@@ -125,3 +126,24 @@ def test_delete_user(superuser_token_in_headers):
     user_id = response.json()["id"]
     response = client.delete(f"/api/v1/users/{user_id}", headers=superuser_token_in_headers)
     assert response.status_code == 204
+
+
+def test_deleted_user_token_is_rejected(superuser_token_in_headers):
+    """
+    删除用户后, 已缓存的认证信息立即失效
+    """
+    data = {"username": "user05", "password": "User@123", "email": "user05@devops.com"}
+    user_id = client.post("/api/v1/users", json=data, headers=superuser_token_in_headers).json()["id"]
+    token = client.post("/api/v1/login", json=data).json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 200
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 200
+
+    client.delete(f"/api/v1/users/{user_id}", headers=superuser_token_in_headers)
+    assert client.get("/api/v1/users/me", headers=headers).status_code == 401
+
+
+def test_get_principal_cache_stats(superuser_token_in_headers):
+    response = client.get("/api/v1/users/principal-cache", headers=superuser_token_in_headers)
+    assert response.status_code == 200
+    assert response.json()["hits"] > 0
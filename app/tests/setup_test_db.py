@@ -6,6 +6,7 @@ from app.infrastructure.database import Base
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///test.db"
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///test.db"
 
 
 engine = create_engine(
@@ -0,0 +1,76 @@
+import asyncio
+from contextlib import contextmanager
+from datetime import datetime
+
+from app.domain.comment import Comment, CommentCreated, CommentDeleted
+from app.infrastructure.comment import CommentRepository
+from app.tests.setup_test_db import TestingSessionLocal
+from app.usecase.comment.events import CommentEventBroadcaster, EVICTED_MESSAGE, CONNECTED_MESSAGE
+
+
+@contextmanager
+def comment_repository():
+    with TestingSessionLocal() as session:
+        yield CommentRepository(session)
+
+
+def drain(client):
+    messages = []
+    while not client.queue.empty():
+        messages.append(client.queue.get_nowait())
+    return messages
+
+
+def test_broadcaster_filters_subtrees():
+    async def run():
+        session = TestingSessionLocal()
+        repository = CommentRepository(session)
+        root = repository.save(Comment(content="推送根评论", created_by="test", created_at=datetime.utcnow()))
+        reply = repository.save(
+            Comment(content="推送回复", created_by="test", parent_id=root.id, created_at=datetime.utcnow())
+        )
+        other = repository.save(Comment(content="其他评论", created_by="test", created_at=datetime.utcnow()))
+
+        broadcaster = CommentEventBroadcaster(
+            queue_size=8, max_clients=10, heartbeat=60, repository_factory=comment_repository
+        )
+        everything, subtree, unrelated = broadcaster.connect(), broadcaster.connect(root.id), broadcaster.connect(-1)
+        await broadcaster.on_comments_created(
+            [CommentCreated(comment_id=comment.id, parent_id=None, created_by="test") for comment in (reply, other)]
+        )
+        repository.remove(reply.id)
+        await broadcaster.on_comments_deleted([CommentDeleted(comment_id=reply.id, parent_id=root.id)])
+        repository.remove(root.id)
+        repository.remove(other.id)
+        session.close()
+
+        assert len(drain(everything)) == 3
+        created, deleted = drain(subtree)
+        assert created.startswith(b"event: created\ndata: {") and f'"id": {reply.id},'.encode() in created
+        assert deleted == f'event: deleted\ndata: {{"id": {reply.id}, "parent_id": {root.id}}}\n\n'.encode()
+        assert drain(unrelated) == []
+        assert broadcaster.client_count == 3
+
+    asyncio.run(run())
+
+
+def test_broadcaster_evicts_slow_clients():
+    async def run():
+        broadcaster = CommentEventBroadcaster(queue_size=2, max_clients=10, heartbeat=60)
+        slow, fast = broadcaster.connect(), broadcaster.connect()
+        stream = broadcaster.stream(fast)
+        assert await stream.__anext__() == CONNECTED_MESSAGE
+        for index in range(3):
+            broadcaster.publish([1], f"data: {index}\n\n".encode())
+            assert await stream.__anext__() == f"data: {index}\n\n".encode()
+
+        # 队列已满的客户端被断开, 只收到 evicted 事件
+        assert broadcaster.client_count == 1
+        messages = [message async for message in broadcaster.stream(slow)]
+        assert messages == [CONNECTED_MESSAGE, EVICTED_MESSAGE]
+
+        broadcaster.close_all()
+        assert [message async for message in stream] == []
+        assert broadcaster.client_count == 0
+
+    asyncio.run(run())
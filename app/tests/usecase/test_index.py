@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.domain.comment import Comment
+from app.infrastructure.comment import CommentRepository
+from app.tests.setup_test_db import TestingSessionLocal
+from app.usecase.comment import CommentCommandUseCase, CommentCreateDTO, comment_forest_index
+from app.usecase.comment.dto import CommentBulkCreateDTO, CommentBulkItemDTO, CommentTreeNodeDTO
+from app.usecase.comment.serializer import dumps_comment_forest
+from app.usecase.comment.usecase import CommentQueryUseCase
+
+
+@pytest.fixture
+def repository():
+    session = TestingSessionLocal()
+    repository = CommentRepository(session)
+    comment_forest_index.build(repository.find_all())
+    try:
+        yield repository
+    finally:
+        comment_forest_index.disable()
+        session.close()
+
+
+def create(command: CommentCommandUseCase, content: str, parent_id=None) -> int:
+    data = CommentCreateDTO(content=content, parent_id=parent_id, created_by="test1(test1@devops.com)")
+    return command.create_comment(data).id
+
+
+def test_index_matches_repository(repository):
+    command = CommentCommandUseCase(repository)
+    query = CommentQueryUseCase(repository)
+
+    root_id = create(command, "索引根评论")
+    reply_id = create(command, "索引回复", root_id)
+    nested_id = create(command, "索引嵌套回复", reply_id)
+    sibling_id = create(command, "索引另一条回复", root_id)
+    assert query.fetch_all_json() == dumps_comment_forest(repository.find_all())
+    assert query.fetch_all() == [CommentTreeNodeDTO.from_entity(node) for node in repository.find_all()]
+
+    snapshot = comment_forest_index.snapshot
+    assert snapshot.nodes[root_id].reply_count == 2
+    assert snapshot.nodes[root_id].descendant_count == 3
+    assert query.fetch_one(nested_id).parent_id == reply_id
+
+    command.delete_comment(reply_id)
+    # 已发布的快照不受之后写入的影响
+    assert snapshot.nodes[root_id].descendant_count == 3
+    assert [child.id for child in snapshot.nodes[root_id].children] == [reply_id, sibling_id]
+
+    current = comment_forest_index.snapshot
+    assert current.version > snapshot.version
+    assert reply_id not in current.nodes
+    assert current.nodes[root_id].descendant_count == 1
+    # 被删除评论的直接回复成为根评论
+    assert query.fetch_one(nested_id).parent_id is None
+    # 之后回复这条评论不再计入原来祖先评论的子孙数
+    nested_reply_id = create(command, "回复成为根评论的评论", nested_id)
+    assert repository.find(root_id).descendant_count == 1
+    assert query.fetch_all_json() == dumps_comment_forest(repository.find_all())
+
+    command.delete_comment(root_id)
+    command.delete_comment(sibling_id)
+    command.delete_comment(nested_id)
+    command.delete_comment(nested_reply_id)
+    assert query.fetch_all_json() == dumps_comment_forest(repository.find_all())
+
+
+def test_index_cascade_delete(repository):
+    command = CommentCommandUseCase(repository)
+    query = CommentQueryUseCase(repository)
+
+    root_id = create(command, "级联删除根评论")
+    reply_id = create(command, "级联删除回复", root_id)
+    nested_id = create(command, "级联删除嵌套回复", reply_id)
+    create(command, "级联删除更深的回复", nested_id)
+
+    assert command.delete_comment(reply_id, cascade=True) == 3
+    assert nested_id not in comment_forest_index.snapshot.nodes
+    assert comment_forest_index.snapshot.nodes[root_id].descendant_count == 0
+    assert query.fetch_all_json() == dumps_comment_forest(repository.find_all())
+    assert command.delete_comment(reply_id, cascade=True) == 0
+
+
+def test_index_incremental_updates(repository, monkeypatch):
+    command = CommentCommandUseCase(repository)
+    query = CommentQueryUseCase(repository)
+    root_id = create(command, "增量更新根评论")
+    # 写入后不再全量重新构建索引
+    monkeypatch.setattr(repository, "find_all", None)
+
+    items = [
+        CommentBulkItemDTO(content="批量根评论"),
+        CommentBulkItemDTO(content="批量回复", parent_index=0),
+        CommentBulkItemDTO(content="回复已有评论", parent_id=root_id),
+    ]
+    bulk_root_id, bulk_reply_id, _ = command.create_comments(CommentBulkCreateDTO(items=items)).ids
+    snapshot = comment_forest_index.snapshot
+    assert snapshot.nodes[bulk_root_id].children[0].id == bulk_reply_id
+    assert snapshot.nodes[root_id].reply_count == 1
+
+    # 模拟其他进程写入的评论, 回复它时只重新读取所在的评论树
+    other = Comment(content="其他进程写入的评论", parent_id=root_id, created_by="test1", created_at=datetime.utcnow())
+    other_id = repository.save(other).id
+    assert other_id not in comment_forest_index.snapshot.nodes
+    reply_id = create(command, "回复其他进程写入的评论", other_id)
+    snapshot = comment_forest_index.snapshot
+    assert snapshot.parents[reply_id] == other_id
+    assert snapshot.nodes[root_id].descendant_count == 3
+    monkeypatch.undo()
+    assert query.fetch_all_json() == dumps_comment_forest(repository.find_all())
+    command.delete_comment(root_id, cascade=True)
+    command.delete_comment(bulk_root_id, cascade=True)
+
+
+def test_index_orders_siblings_by_created_at(repository):
+    command = CommentCommandUseCase(repository)
+    query = CommentQueryUseCase(repository)
+    root_id = create(command, "同级顺序根评论")
+    now = datetime.utcnow()
+    # 后写入但创建时间更早的回复(例如导入的评论)排在前面
+    items = [
+        CommentBulkItemDTO(content="较晚的回复", parent_id=root_id, created_at=now + timedelta(minutes=2)),
+        CommentBulkItemDTO(content="较早的回复", parent_id=root_id, created_at=now + timedelta(minutes=1)),
+        CommentBulkItemDTO(content="嵌套回复", parent_index=0, created_at=now + timedelta(minutes=3)),
+    ]
+    later_id, earlier_id, nested_id = command.create_comments(CommentBulkCreateDTO(items=items)).ids
+    snapshot = comment_forest_index.snapshot
+    assert [child.id for child in snapshot.nodes[root_id].children] == [earlier_id, later_id]
+    assert query.fetch_all_json() == dumps_comment_forest(repository.find_all())
+
+    create(command, "回复嵌套回复", nested_id)
+    command.delete_comment(earlier_id)
+    assert [child.id for child in comment_forest_index.snapshot.nodes[root_id].children] == [later_id]
+    assert comment_forest_index.snapshot.nodes[root_id].descendant_count == 3
+    assert query.fetch_all_json() == dumps_comment_forest(repository.find_all())
+    command.delete_comment(root_id, cascade=True)
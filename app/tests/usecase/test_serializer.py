@@ -0,0 +1,114 @@
+import gc
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.domain.comment import CommentTreeNode, CommentForest
+from app.infrastructure.comment.do import get_comments_tree
+from app.usecase.comment.dto import CommentTreeNodeDTO, CommentPageDTO
+from app.usecase.comment.serializer import dumps_comment_forest, dumps_comment_tree, dumps_comment_page
+from app.usecase.comment.serializer import dumps_compact_forest, _gc_paused
+
+
+def render(content) -> bytes:
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def make_forest():
+    root = CommentTreeNode(
+        id=1, content='引号" 反斜杠\\ 换行\n 控制符\x01 😀', created_by="admin(admin@devops.com)", created_at=datetime(2022, 6, 1)
+    )
+    reply = CommentTreeNode(
+        id=2,
+        content="回复",
+        created_by="test",
+        created_at=datetime(2022, 6, 1, 8, 0, 0, 123456),
+        updated_at=datetime(2022, 6, 2),
+    )
+    reply.children.append(CommentTreeNode(id=3, content="", created_by="test", created_at=datetime(2022, 6, 3)))
+    root.children.append(reply)
+    root.reply_count, root.descendant_count = 1, 2
+    return [root, CommentTreeNode(id=4, content="另一条评论", created_by="test")]
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_serializer_matches_pydantic(use_orjson):
+    forest = make_forest()
+    items = [CommentTreeNodeDTO.from_entity(node) for node in forest]
+
+    assert dumps_comment_forest(forest, use_orjson) == render(items)
+    assert dumps_comment_forest([], use_orjson) == render([])
+    assert dumps_comment_tree(forest[0], use_orjson) == render(items[0])
+    assert dumps_comment_page(forest, "abc", use_orjson) == render(CommentPageDTO(items=items, next_cursor="abc"))
+    assert dumps_comment_page(forest, None, use_orjson) == render(CommentPageDTO(items=items))
+
+
+def test_serializer_deep_tree():
+    root = node = CommentTreeNode(id=0, content="comment", created_by="test")
+    for comment_id in range(1, 3000):
+        child = CommentTreeNode(id=comment_id, content="reply", created_by="test")
+        node.children.append(child)
+        node = child
+    body = dumps_comment_tree(root)
+    assert body.startswith(b'{"id":0,"content":"comment","children":[{"id":1,')
+    assert body.count(b'"id":') == 3000
+    assert body.endswith(
+        b'"descendant_count":0,"children_cursor":null}],"created_by":"test","created_at":null,"updated_at":null'
+        b',"reply_count":0,"descendant_count":0,"children_cursor":null}'
+    )
+
+
+Row = namedtuple(
+    "Row", "id parent_id content created_by created_at updated_at reply_count descendant_count", defaults=(None, 0, 0)
+)
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_compact_forest_matches_tree(use_orjson):
+    created_at = datetime(2022, 6, 1, 8, 0, 0, 123456)
+    rows = [
+        Row(1, None, '引号" 反斜杠\\ 换行\n 😀', "admin", created_at, reply_count=2, descendant_count=3),
+        Row(2, 1, "回复", "test", created_at.replace(tzinfo=timezone(timedelta(hours=8))), datetime(2022, 6, 2)),
+        Row(3, 2, "", "test", created_at.replace(tzinfo=timezone.utc)),
+        Row(4, None, "同一时间的根评论", "admin", created_at),
+        Row(5, 1, "回复", "test", created_at),
+        # 父评论不存在的评论不在任何一棵评论树中
+        Row(7, 6, "孤立的回复", "test", created_at),
+        Row(8, None, "较早的根评论", "test", datetime(1960, 1, 1)),
+    ]
+    forest = CommentForest.from_rows(rows)
+    expected = get_comments_tree(rows)
+
+    assert dumps_compact_forest(forest, use_orjson) == dumps_comment_forest(expected, use_orjson)
+    assert dumps_compact_forest(CommentForest.from_rows([]), use_orjson) == b"[]"
+    assert [node.id for node in forest.root_nodes()] == [4, 1, 8]
+    assert forest.authors == ["admin", "test"]
+
+    node = forest.find(2)
+    assert (node.parent_id, node.content, node.created_at, node.updated_at) == (
+        1,
+        "回复",
+        rows[1].created_at,
+        rows[1].updated_at,
+    )
+    assert [child.id for child in forest.find(1).children] == [2, 5]
+    assert forest.find(6) is None
+    assert CommentTreeNodeDTO.from_entity(forest.find(1)) == CommentTreeNodeDTO.from_entity(expected[1])
+
+
+def test_gc_paused_restores_state_after_overlapping_pauses():
+    assert gc.isenabled()
+    with _gc_paused():
+        # 默认不暂停
+        assert gc.isenabled()
+    first, second = _gc_paused(True), _gc_paused(True)
+    first.__enter__()
+    second.__enter__()
+    # 模拟两个线程交错退出, 先进入的先退出时另一个仍在暂停中
+    first.__exit__(None, None, None)
+    assert not gc.isenabled()
+    second.__exit__(None, None, None)
+    assert gc.isenabled()
@@ -0,0 +1,114 @@
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.config import AdmissionLimit
+from app.utils.admission import AdmissionController, AdmissionMiddleware, TokenBucket, admit, defer_admission
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock)
+    assert bucket.take() == 0 and bucket.take() == 0
+    assert bucket.take() == 0.5
+    clock.now = 0.5
+    assert bucket.take() == 0
+    clock.now = 10
+    # 令牌数不超过桶的容量
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0.5]
+
+
+def test_admission_middleware_sheds_load():
+    async def run():
+        release = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await release.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        clock = FakeClock()
+        limits = {
+            "GET /comments/{comment_id}/tree": AdmissionLimit(max_concurrency=1, max_queue=1, queue_timeout=0.2),
+            "POST /login": AdmissionLimit(rate=1, burst=1),
+        }
+        controller = AdmissionController(limits, clock)
+        middleware = AdmissionMiddleware(app, controller)
+
+        async def request(method: str, path: str):
+            messages = []
+
+            async def send(message):
+                messages.append(message)
+
+            await middleware({"type": "http", "method": method, "path": path, "headers": []}, None, send)
+            return messages[0]["status"], dict(messages[0]["headers"])
+
+        running = asyncio.create_task(request("GET", "/comments/1/tree"))
+        queued = asyncio.create_task(request("GET", "/comments/2/tree"))
+        await asyncio.sleep(0)
+        limiter = controller.match("GET", "/comments/3/tree")
+        assert (limiter.in_flight, len(limiter.waiters)) == (1, 1)
+
+        # 队列已满时立即拒绝
+        status, headers = await request("GET", "/comments/3/tree")
+        assert status == 503 and headers[b"retry-after"] == b"1"
+        # 未配置的路由不受影响
+        release.set()
+        assert (await request("GET", "/comments/3"))[0] == 200
+        assert (await running)[0] == 200 and (await queued)[0] == 200
+        assert (limiter.in_flight, limiter.admitted, limiter.shed["queue_full"]) == (0, 2, 1)
+
+        release.clear()
+        running = asyncio.create_task(request("GET", "/comments/1/tree"))
+        await asyncio.sleep(0)
+        assert (await request("GET", "/comments/2/tree"))[0] == 503
+        assert limiter.shed["queue_timeout"] == 1 and not limiter.waiters
+        release.set()
+        await running
+
+        assert (await request("POST", "/login"))[0] == 200
+        status, headers = await request("POST", "/login")
+        assert status == 429 and headers[b"retry-after"] == b"1"
+
+        text = controller.render()
+        assert 'http_admission_admitted_total{method="GET",route="/comments/{comment_id}/tree"} 3' in text
+        assert 'http_admission_shed_total{method="POST",route="/login",reason="rate_limited"} 1' in text
+        assert 'http_admission_queue_depth{method="GET",route="/comments/{comment_id}/tree"} 0' in text
+
+    asyncio.run(run())
+
+
+def test_deferred_admission_skips_cache_hits():
+    clock = FakeClock()
+    controller = AdmissionController({"GET /items/{name}": AdmissionLimit(rate=1, burst=1)}, clock)
+    cache = {}
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+
+    @app.get("/items/{name}")
+    @defer_admission
+    async def get_item(name: str, request: Request):
+        if name not in cache:
+            async with admit(request):
+                cache[name] = name.upper()
+        return cache[name]
+
+    client = TestClient(app)
+    assert client.get("/items/a").json() == "A"
+    # 缓存命中不消耗令牌
+    assert [client.get("/items/a").status_code for _ in range(3)] == [200, 200, 200]
+    response = client.get("/items/b")
+    assert response.status_code == 429 and response.headers["Retry-After"] == "1"
+    clock.now = 1
+    assert client.get("/items/b").json() == "B"
+    assert controller.match("GET", "/items/b").admitted == 2
@@ -1,11 +1,15 @@
+import asyncio
 import random
 import string
 from datetime import datetime, timedelta
 
+import pytest
 from jose import jwt
 
 from app.config import settings
 from app.utils import verify_password, encrypt_password, create_access_token
+from app.utils import PasswordHasher, PasswordHasherBusyError
+from app.utils.auth import _hash_password, _verify_password
 
 special_characters = r" !\"  # $%&'()*+,-./:;<=>?@[\]^_`{|}~"
 allow_characters = string.ascii_letters + string.digits + special_characters
@@ -24,3 +28,23 @@ def test_create_access_token():
     access_token = create_access_token(subject=subject, expires_delta=expires_delta)
     payload = jwt.decode(access_token, settings.SECRET_KEY)
     assert payload == {"exp": int((now + timedelta(minutes=10)).timestamp()), "sub": subject}
+
+
+def test_password_hasher_fails_fast_when_busy():
+    hasher = PasswordHasher(max_workers=1, max_pending=0)
+    with pytest.raises(PasswordHasherBusyError):
+        hasher.run(pow, 2, 10)
+    hasher.shutdown()
+
+
+def test_password_hasher_runs_in_process_pool():
+    hasher = PasswordHasher(max_workers=1, max_pending=4)
+    try:
+        encrypted_password = hasher.run(_hash_password, "secret")
+        assert hasher.run(_verify_password, "secret", encrypted_password)
+        assert not hasher.run(_verify_password, "wrong", encrypted_password)
+        # 异步代码中等待进程池的结果, 不阻塞事件循环
+        assert asyncio.run(hasher.run_async(_verify_password, "secret", encrypted_password))
+        assert hasher.pending == 0
+    finally:
+        hasher.shutdown()
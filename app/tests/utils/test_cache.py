@@ -0,0 +1,23 @@
+from types import SimpleNamespace
+
+from app.utils import cache
+from app.utils.cache import VersionedCache
+
+
+def test_versioned_cache(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    versioned = VersionedCache(maxsize=2, ttl=5)
+    version = versioned.version
+    versioned.set("a", 1, version)
+    assert versioned.get("a") == 1
+    # 查询期间发生写入时不缓存旧数据
+    versioned.bump()
+    versioned.set("a", 1, version)
+    assert versioned.get("a") is None
+
+    versioned.set("a", 2, versioned.version)
+    now[0] = 6
+    # 其他进程的写入不会调用 bump, 缓存过期后重新查询
+    assert versioned.get("a") is None
+    assert versioned.stats()["size"] == 0
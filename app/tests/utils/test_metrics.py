@@ -0,0 +1,21 @@
+from app.utils.metrics import Histogram, MetricsRegistry, RequestMetrics
+
+
+def test_histogram_render():
+    histogram = Histogram("test_seconds", "测试", ("route",), (0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(("/comments",), value)
+    lines = histogram.render()
+    assert 'test_seconds_bucket{route="/comments",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{route="/comments",le="1"} 3' in lines
+    assert 'test_seconds_bucket{route="/comments",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{route="/comments"} 4' in lines
+    assert 'test_seconds_sum{route="/comments"} 2.65' in lines
+
+
+def test_metrics_registry():
+    registry = MetricsRegistry()
+    registry.observe("GET", "/api/v1/comments", 0.2, RequestMetrics(queries=3, db_time=0.05))
+    text = registry.render()
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert 'http_request_sql_queries_bucket{method="GET",route="/api/v1/comments",le="5"} 1' in text
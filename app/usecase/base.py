@@ -0,0 +1,21 @@
+from typing import Any, Callable, Type, TypeVar
+
+T = TypeVar("T")
+
+
+class AsyncUseCase(object):
+    """
+    UseCase 的异步实现, 子类为同步 UseCase 的每个方法声明同名的异步方法, 通过 run 调用
+    整个方法在 AsyncRepository.run_sync 中执行, 业务逻辑只需要在同步 UseCase 中维护一份
+    """
+
+    usecase_class: Type = None
+
+    def __init__(self, repository: "AsyncRepository"):
+        self.repository = repository
+
+    async def run(self, func: Callable[[Any], T]) -> T:
+        """
+        以同步 UseCase 为参数执行 func
+        """
+        return await self.repository.run_sync(lambda repository: func(self.usecase_class(repository)))
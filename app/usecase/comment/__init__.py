@@ -1,2 +1,6 @@
-from .usecase import CommentCommandUseCase
+from .usecase import CommentCommandUseCase, AsyncCommentCommandUseCase
 from .dto import CommentCreateDTO, CommentReadDTO, CommentUpdateDTO
+from .dto import CommentBulkItemDTO, CommentBulkCreateDTO, CommentBulkResultDTO
+from .cache import comment_tree_cache
+from .index import comment_forest_index
+from .events import comment_event_broadcaster, TooManySubscribersError
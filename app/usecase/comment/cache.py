@@ -0,0 +1,6 @@
+from app.config import settings
+from app.utils.cache import VersionedCache
+
+# 评论列表的响应缓存: 查询参数 -> (序列化后的响应体, ETag), 评论的任何写操作都会使其失效
+# 缓存只在当前进程内有效, 其他进程的写入要等到缓存过期(COMMENT_CACHE_TTL 秒)后才能读到
+comment_tree_cache = VersionedCache(maxsize=settings.COMMENT_CACHE_SIZE, ttl=settings.COMMENT_CACHE_TTL)
@@ -1,2 +1,3 @@
-from .query import CommentReadDTO, CommentTreeNodeDTO
-from .command import CommentCreateDTO, CommentUpdateDTO
+from .query import CommentReadDTO, CommentTreeNodeDTO, CommentPageDTO, CommentBulkResultDTO
+from .query import CommentSearchItemDTO, CommentSearchPageDTO
+from .command import CommentCreateDTO, CommentUpdateDTO, CommentBulkItemDTO, CommentBulkCreateDTO
@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 
 
 class CommentCreateDTO(BaseModel):
@@ -15,6 +15,29 @@ class CommentCreateDTO(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class CommentBulkItemDTO(CommentCreateDTO):
+    """
+    Comment Bulk Item Data Transfer Object
+    """
+
+    parent_index: Optional[int] = Field(None, ge=0, example=0, description="父评论在同一批次中的下标, 设置后忽略 parent_id")
+
+
+class CommentBulkCreateDTO(BaseModel):
+    """
+    Comment Bulk Create Data Transfer Object
+    """
+
+    items: List[CommentBulkItemDTO] = Field(min_items=1, max_items=10000)
+
+    @validator("items")
+    def _check_parent_index(cls, items: List[CommentBulkItemDTO], **kwargs) -> List[CommentBulkItemDTO]:
+        for index, item in enumerate(items):
+            if item.parent_index is not None and item.parent_index >= index:
+                raise ValueError(f"第 {index} 条评论的 parent_index 必须指向它之前的评论")
+        return items
+
+
 class CommentUpdateDTO(BaseModel):
     """
     Comment Update Data Transfer Object
@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from app.domain.comment import Comment, CommentTreeNode
 
@@ -25,6 +25,8 @@ class CommentReadDTO(BaseModel):
     created_by: str
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    reply_count: int = 0
+    descendant_count: int = 0
 
     @staticmethod
     def from_entity(comment: Comment) -> "CommentReadDTO":
@@ -35,6 +37,8 @@ class CommentReadDTO(BaseModel):
             created_by=comment.created_by,
             created_at=comment.created_at,
             updated_at=comment.updated_at,
+            reply_count=comment.reply_count,
+            descendant_count=comment.descendant_count,
         )
 
 
@@ -49,6 +53,13 @@ class CommentTreeNodeDTO(BaseModel):
     created_by: str
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    reply_count: int = 0
+    descendant_count: int = 0
+    children_cursor: Optional[str] = Field(
+        None,
+        description="children 少于 reply_count 时还有回复未返回, 把该游标传给 GET /comments/{id}/children 获取之后的回复, "
+        "为 null 时从第一条回复开始获取",
+    )
 
     @staticmethod
     def from_entity(comment: CommentTreeNode) -> "CommentTreeNodeDTO":
@@ -58,8 +69,53 @@ class CommentTreeNodeDTO(BaseModel):
             created_by=comment.created_by,
             created_at=comment.created_at,
             updated_at=comment.updated_at,
+            reply_count=comment.reply_count,
+            descendant_count=comment.descendant_count,
+            children_cursor=comment.children_cursor,
         )
         children: List[CommentTreeNode] = comment.children
         if children:
             comment_tree_dto.children = [CommentTreeNodeDTO.from_entity(child) for child in children]
         return comment_tree_dto
+
+
+class CommentBulkResultDTO(BaseModel):
+    """
+    Comment Bulk Create Result Data Transfer Object
+    """
+
+    count: int
+    ids: List[int]
+    seconds: float
+    rows_per_second: float
+
+
+class CommentPageDTO(BaseModel):
+    """
+    Comment Page Data Transfer Object
+    """
+
+    items: List[CommentTreeNodeDTO]
+    next_cursor: Optional[str] = None
+
+
+class CommentSearchItemDTO(CommentReadDTO):
+    """
+    Comment Search Item Data Transfer Object
+    """
+
+    # 高亮了匹配内容的摘要, 匹配内容以【】标记
+    snippet: str
+
+    @staticmethod
+    def from_result(comment: Comment, snippet: str) -> "CommentSearchItemDTO":
+        return CommentSearchItemDTO(**CommentReadDTO.from_entity(comment).dict(), snippet=snippet)
+
+
+class CommentSearchPageDTO(BaseModel):
+    """
+    Comment Search Page Data Transfer Object
+    """
+
+    items: List[CommentSearchItemDTO]
+    next_offset: Optional[int] = None
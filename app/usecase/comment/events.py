@@ -0,0 +1,181 @@
+"""
+评论实时推送(Server-Sent Events)
+
+CommentEventBroadcaster 作为 OutboxDispatcher 的订阅者, 每批领域事件只查询一次数据库, 序列化一次,
+再把同一份消息放入每个客户端的有界队列; 没有客户端连接时不查询数据库
+客户端可以只订阅某条评论的子树, 按祖先评论 id 查找订阅者, 每条事件的开销与评论深度相关, 与客户端总数无关
+队列已满的客户端(消费过慢)会被断开, 收到 evicted 事件后应重新拉取评论并重新连接
+
+推送只覆盖当前进程的连接, 多进程部署时 outbox 中的事件只会被其中一个进程投递
+"""
+import asyncio
+import json
+from collections import defaultdict
+from typing import AsyncIterator, Callable, ContextManager, Dict, Iterable, List, Optional, Set
+
+from app.config import settings
+from app.domain.comment import CommentCreated, CommentDeleted
+from app.usecase.comment.dto import CommentReadDTO
+
+# 返回只读 CommentRepository 的上下文管理器, 退出时关闭会话
+RepositoryFactory = Callable[[], ContextManager["CommentRepository"]]
+
+
+def format_event(name: str, data: str) -> bytes:
+    return f"event: {name}\ndata: {data}\n\n".encode("utf-8")
+
+
+EVICTED_MESSAGE = format_event("evicted", "{}")
+HEARTBEAT_MESSAGE = b": ping\n\n"
+# 建议客户端断开后的重连间隔(毫秒)
+CONNECTED_MESSAGE = b"retry: 3000\n\n"
+
+
+class TooManySubscribersError(Exception):
+    message = "实时推送的连接数已达上限"
+
+    def __str__(self):
+        return TooManySubscribersError.message
+
+
+class CommentEventClient(object):
+    def __init__(self, root_id: Optional[int], queue_size: int):
+        # 只接收该评论及其子孙评论的事件, 为 None 时接收全部事件
+        self.root_id = root_id
+        # 元素为待发送的消息, None 表示关闭连接
+        self.queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue(queue_size)
+
+
+class CommentEventBroadcaster(object):
+    """
+    进程内唯一的评论事件广播器, 只在事件循环中访问, 不需要加锁
+    """
+
+    def __init__(
+        self,
+        queue_size: int,
+        max_clients: int,
+        heartbeat: float,
+        repository_factory: Optional[RepositoryFactory] = None,
+    ):
+        self.repository_factory = repository_factory
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self.heartbeat = heartbeat
+        # 订阅的子树根评论 id -> 客户端, None 对应订阅全部评论的客户端
+        self.clients: Dict[Optional[int], Set[CommentEventClient]] = defaultdict(set)
+        self.client_count = 0
+        self.enabled = False
+
+    def register(self, dispatcher, repository_factory: RepositoryFactory) -> None:
+        """
+        订阅 OutboxDispatcher 投递的评论事件
+        :param repository_factory: 查询事件对应的评论及其祖先评论时使用
+        """
+        if self.enabled:
+            return
+        self.repository_factory = repository_factory
+        dispatcher.subscribe(CommentCreated, self.on_comments_created)
+        dispatcher.subscribe(CommentDeleted, self.on_comments_deleted)
+        self.enabled = True
+
+    def connect(self, root_id: Optional[int] = None) -> CommentEventClient:
+        if self.client_count >= self.max_clients:
+            raise TooManySubscribersError
+        client = CommentEventClient(root_id, self.queue_size)
+        self.clients[root_id].add(client)
+        self.client_count += 1
+        return client
+
+    def disconnect(self, client: CommentEventClient) -> None:
+        clients = self.clients.get(client.root_id)
+        if clients is None or client not in clients:
+            return
+        clients.remove(client)
+        if not clients:
+            del self.clients[client.root_id]
+        self.client_count -= 1
+
+    def _close(self, client: CommentEventClient, message: Optional[bytes]) -> None:
+        """
+        断开客户端, 丢弃尚未发送的消息, 发送 message(EVICTED_MESSAGE 或表示直接关闭的 None) 后结束推送
+        """
+        self.disconnect(client)
+        while not client.queue.empty():
+            client.queue.get_nowait()
+        client.queue.put_nowait(message)
+
+    def close_all(self) -> None:
+        for clients in list(self.clients.values()):
+            for client in list(clients):
+                self._close(client, None)
+
+    def publish(self, lineage: Iterable[int], message: bytes) -> None:
+        """
+        把消息放入订阅了全部评论以及订阅了 lineage 中任意一条评论的子树的客户端队列
+        :param lineage: 事件对应评论自身及其全部祖先评论的 id
+        """
+        for root_id in (None, *lineage):
+            for client in list(self.clients.get(root_id, ())):
+                try:
+                    client.queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    self._close(client, EVICTED_MESSAGE)
+
+    async def stream(self, client: CommentEventClient) -> AsyncIterator[bytes]:
+        """
+        逐条发送客户端队列中的消息, 空闲时定期发送心跳, 连接断开后自动取消订阅
+        """
+        try:
+            yield CONNECTED_MESSAGE
+            while True:
+                try:
+                    message = await asyncio.wait_for(client.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT_MESSAGE
+                    continue
+                if message is None:
+                    return
+                yield message
+                if message is EVICTED_MESSAGE:
+                    return
+        finally:
+            self.disconnect(client)
+
+    def load_created(self, comment_ids: List[int]):
+        with self.repository_factory() as repository:
+            return repository.find_many(comment_ids), repository.find_lineages(comment_ids)
+
+    def load_lineages(self, comment_ids: Iterable[int]) -> Dict[int, List[int]]:
+        with self.repository_factory() as repository:
+            return repository.find_lineages(comment_ids)
+
+    async def on_comments_created(self, events: List[CommentCreated]) -> None:
+        if not self.client_count:
+            return
+        # 投递前已被删除的评论不再推送, 之后的 CommentDeleted 事件会通知客户端
+        comments, lineages = await asyncio.to_thread(self.load_created, [event.comment_id for event in events])
+        for comment in comments:
+            data = CommentReadDTO.from_entity(comment).json(ensure_ascii=False)
+            self.publish(lineages.get(comment.id, [comment.id]), format_event("created", data))
+
+    async def on_comments_deleted(self, events: List[CommentDeleted]) -> None:
+        if not self.client_count:
+            return
+        parent_ids = {event.parent_id for event in events if event.parent_id is not None}
+        lineages = await asyncio.to_thread(self.load_lineages, parent_ids) if parent_ids else {}
+        for event in events:
+            lineage = lineages.get(event.parent_id, []) if event.parent_id is not None else []
+            payload = {"id": event.comment_id, "parent_id": event.parent_id}
+            if event.cascade:
+                # 级联删除只有一条事件, 客户端应同时移除这条评论的整棵子树
+                payload["cascade"] = True
+            self.publish([*lineage, event.comment_id], format_event("deleted", json.dumps(payload)))
+
+
+# 进程内唯一的广播器, OUTBOX_ENABLED 开启时在启动时订阅 outbox 事件并传入 Repository 工厂
+comment_event_broadcaster = CommentEventBroadcaster(
+    queue_size=settings.COMMENT_EVENTS_QUEUE_SIZE,
+    max_clients=settings.COMMENT_EVENTS_MAX_CLIENTS,
+    heartbeat=settings.COMMENT_EVENTS_HEARTBEAT,
+)
@@ -0,0 +1,266 @@
+"""
+进程内的评论森林索引
+
+开启 COMMENT_INDEX_ENABLED 后, 启动时从 CommentRepository 读取整个评论森林构建索引, 之后由 CommentCommandUseCase
+在每次写入后增量更新, CommentQueryUseCase 的 fetch_all / fetch_one 直接读取索引, 不再访问数据库
+
+索引的每个版本都是不可变的快照: 写入时复制 id 映射, 评论树只复制被修改的节点及其全部祖先节点(路径复制), 其余子树在新旧快照间共享,
+新快照构造完成后一次性替换引用, 读请求取得的快照在之后的写入中不会发生变化, 读取不需要加锁
+索引只在当前进程内有效, 多进程部署时其他进程的写入不会反映到索引中;
+回复的父评论不在索引中(由其他进程写入)时, 只从数据库重新读取这条回复所在的评论树替换索引中的同一棵树
+"""
+import threading
+from datetime import datetime
+from bisect import bisect_left
+from heapq import merge
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.domain.comment import Comment, CommentTreeNode
+
+
+@dataclass(frozen=True)
+class CommentForestSnapshot:
+    """
+    评论森林的一个版本, 发布后不再修改, 节点顺序与 CommentRepository.find_all 一致
+    """
+
+    version: int
+    # id -> 评论树中的节点, 每个节点的 children 按 (created_at, id) 升序排列
+    nodes: Dict[int, CommentTreeNode]
+    # id -> 父评论 id
+    parents: Dict[int, Optional[int]]
+    # 按 (created_at, id) 倒序排列的根评论
+    roots: Tuple[CommentTreeNode, ...]
+
+    def find(self, comment_id: int) -> Optional[Comment]:
+        node = self.nodes.get(comment_id)
+        if node is None:
+            return None
+        return Comment(
+            id=node.id,
+            content=node.content,
+            parent_id=self.parents[node.id],
+            created_by=node.created_by,
+            created_at=node.created_at,
+            updated_at=node.updated_at,
+            reply_count=node.reply_count,
+            descendant_count=node.descendant_count,
+        )
+
+
+def sibling_order(node: CommentTreeNode) -> Tuple[datetime, int]:
+    # 与 link_comment_nodes 一致, 比较时忽略时区
+    return node.created_at.replace(tzinfo=None), node.id
+
+
+def node_position(nodes: Sequence[CommentTreeNode], node: CommentTreeNode) -> int:
+    """
+    在按 (created_at, id) 升序排列的子评论中查找 node 的位置
+    """
+    return bisect_left(nodes, sibling_order(node), key=sibling_order)
+
+
+def root_position(roots: Sequence[CommentTreeNode], node: CommentTreeNode) -> int:
+    """
+    在按 (created_at, id) 倒序排列的根评论中查找 node 的位置
+    """
+    key = sibling_order(node)
+    low, high = 0, len(roots)
+    while low < high:
+        middle = (low + high) // 2
+        if sibling_order(roots[middle]) > key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class CommentForestIndex(object):
+    def __init__(self):
+        self.snapshot: Optional[CommentForestSnapshot] = None
+        # 写入之间互斥, 读取直接使用 self.snapshot
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.snapshot is not None
+
+    def build(self, roots: List[CommentTreeNode]) -> None:
+        """
+        根据 CommentRepository.find_all 的结果构建索引, 传入的节点之后归索引所有, 调用方不能再修改
+        """
+        nodes: Dict[int, CommentTreeNode] = {}
+        parents: Dict[int, Optional[int]] = {}
+        stack: List[Tuple[CommentTreeNode, Optional[int]]] = [(root, None) for root in roots]
+        while stack:
+            node, parent_id = stack.pop()
+            nodes[node.id] = node
+            parents[node.id] = parent_id
+            stack.extend((child, node.id) for child in node.children)
+        with self.lock:
+            version = self.snapshot.version + 1 if self.snapshot else 1
+            self.snapshot = CommentForestSnapshot(version, nodes, parents, tuple(roots))
+
+    def disable(self) -> None:
+        with self.lock:
+            self.snapshot = None
+
+    @staticmethod
+    def _copy_ancestors(
+        parents: Dict[int, Optional[int]],
+        nodes: Dict[int, CommentTreeNode],
+        roots: Tuple[CommentTreeNode, ...],
+        node: CommentTreeNode,
+        descendant_delta: int,
+    ) -> Tuple[CommentTreeNode, ...]:
+        """
+        node 是某个节点修改后的副本, 沿父评论向上复制全部祖先节点, 使其引用新的子节点并更新子孙数
+        :return: 替换了根节点的根评论列表
+        """
+        parent_id = parents[node.id]
+        while parent_id is not None:
+            parent = nodes[parent_id]
+            children = list(parent.children)
+            children[node_position(children, node)] = node
+            node = replace(parent, children=children, descendant_count=parent.descendant_count + descendant_delta)
+            nodes[node.id] = node
+            parent_id = parents[node.id]
+        position = root_position(roots, node)
+        return roots[:position] + (node,) + roots[position + 1 :]
+
+    def add(self, comment: Comment) -> bool:
+        """
+        加入一条新评论
+        :return: 父评论不在索引中(例如其他进程写入的评论)时返回 False, 此时无法增量更新, 需要调用 put_tree
+        """
+        return not self.add_all([comment])
+
+    def add_all(self, comments: Sequence[Comment]) -> List[Comment]:
+        """
+        按顺序加入多条新评论, 父评论可以是同一批次中排在前面的评论, 整个批次只复制一次 id 映射并发布一个新快照
+        :return: 父评论不在索引中而未能加入的评论
+        """
+        with self.lock:
+            snapshot = self.snapshot
+            if snapshot is None:
+                return []
+            nodes = dict(snapshot.nodes)
+            parents = dict(snapshot.parents)
+            roots = snapshot.roots
+            missing: List[Comment] = []
+            for comment in comments:
+                if comment.id in nodes:
+                    continue
+                if comment.parent_id is not None and comment.parent_id not in nodes:
+                    missing.append(comment)
+                    continue
+                node = CommentTreeNode(
+                    id=comment.id,
+                    content=comment.content,
+                    created_by=comment.created_by,
+                    created_at=comment.created_at,
+                    updated_at=comment.updated_at,
+                )
+                nodes[node.id] = node
+                parents[node.id] = comment.parent_id
+                if comment.parent_id is None:
+                    position = root_position(roots, node)
+                    roots = roots[:position] + (node,) + roots[position:]
+                    continue
+                parent = nodes[comment.parent_id]
+                children = list(parent.children)
+                children.insert(node_position(children, node), node)
+                parent = replace(
+                    parent,
+                    children=children,
+                    reply_count=parent.reply_count + 1,
+                    descendant_count=parent.descendant_count + 1,
+                )
+                nodes[parent.id] = parent
+                roots = self._copy_ancestors(parents, nodes, roots, parent, 1)
+            if len(nodes) > len(snapshot.nodes):
+                self.snapshot = CommentForestSnapshot(snapshot.version + 1, nodes, parents, roots)
+            return missing
+
+    def put_tree(self, root: CommentTreeNode) -> None:
+        """
+        用从数据库读取的一棵完整评论树替换索引中的同一棵树, 增量更新失败时只需重新读取受影响的评论树, 不必重新构建整个索引
+        :param root: CommentRepository.find_tree 读取的根评论, 之后归索引所有
+        """
+        with self.lock:
+            snapshot = self.snapshot
+            if snapshot is None:
+                return
+            nodes = dict(snapshot.nodes)
+            parents = dict(snapshot.parents)
+            roots = snapshot.roots
+            old_root = snapshot.nodes.get(root.id)
+            if old_root is not None and snapshot.parents[root.id] is None:
+                old_nodes = [old_root]
+                while old_nodes:
+                    node = old_nodes.pop()
+                    del nodes[node.id]
+                    del parents[node.id]
+                    old_nodes.extend(node.children)
+                position = root_position(roots, old_root)
+                roots = roots[:position] + roots[position + 1 :]
+            stack: List[Tuple[CommentTreeNode, Optional[int]]] = [(root, None)]
+            while stack:
+                node, parent_id = stack.pop()
+                nodes[node.id] = node
+                parents[node.id] = parent_id
+                stack.extend((child, node.id) for child in node.children)
+            position = root_position(roots, root)
+            roots = roots[:position] + (root,) + roots[position:]
+            self.snapshot = CommentForestSnapshot(snapshot.version + 1, nodes, parents, roots)
+
+    def remove(self, comment_id: int, cascade: bool = False) -> None:
+        """
+        删除一条评论, 与 CommentRepository.remove 一致, 其直接回复的 parent_id 被置空, 连同各自的子树成为根评论
+        :param cascade: 为 True 时与 CommentRepository.remove_tree 一致, 整棵子树一起删除
+        """
+        with self.lock:
+            snapshot = self.snapshot
+            if snapshot is None or comment_id not in snapshot.nodes:
+                return
+            node = snapshot.nodes[comment_id]
+            parent_id = snapshot.parents[comment_id]
+            nodes = dict(snapshot.nodes)
+            parents = dict(snapshot.parents)
+            del nodes[comment_id]
+            del parents[comment_id]
+            if cascade:
+                stack = list(node.children)
+                while stack:
+                    descendant = stack.pop()
+                    del nodes[descendant.id]
+                    del parents[descendant.id]
+                    stack.extend(descendant.children)
+            else:
+                for child in node.children:
+                    parents[child.id] = None
+            if parent_id is None:
+                position = root_position(snapshot.roots, node)
+                roots = snapshot.roots[:position] + snapshot.roots[position + 1 :]
+            else:
+                parent = snapshot.nodes[parent_id]
+                removed = 1 + node.descendant_count
+                children = list(parent.children)
+                del children[node_position(children, node)]
+                parent = replace(
+                    parent,
+                    children=children,
+                    reply_count=parent.reply_count - 1,
+                    descendant_count=parent.descendant_count - removed,
+                )
+                nodes[parent.id] = parent
+                roots = self._copy_ancestors(snapshot.parents, nodes, snapshot.roots, parent, -removed)
+            if node.children and not cascade:
+                promoted = sorted(node.children, key=sibling_order, reverse=True)
+                roots = tuple(merge(roots, promoted, key=sibling_order, reverse=True))
+            self.snapshot = CommentForestSnapshot(snapshot.version + 1, nodes, parents, roots)
+
+
+# 进程内唯一的评论森林索引, COMMENT_INDEX_ENABLED 开启时在启动时构建
+comment_forest_index = CommentForestIndex()
@@ -0,0 +1,259 @@
+"""
+评论树的 JSON 序列化
+
+跳过 Pydantic 模型, 直接把 CommentTreeNode 树或 CommentForest 写成 JSON 字节串,
+输出与 CommentTreeNodeDTO 经 FastAPI JSONResponse 渲染的结果逐字节一致:
+字段顺序为 id, content, children, created_by, created_at, updated_at, reply_count, descendant_count, children_cursor,
+紧凑分隔符, 不转义非 ASCII 字符
+安装了 orjson 时使用 orjson 编码, 否则使用标准库 json
+"""
+import gc
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from json.encoder import encode_basestring
+from typing import List, Optional, Any, Dict, Tuple, Iterable, Sequence
+
+from app.config import settings
+from app.domain.comment import Comment, CommentTreeNode, CommentForest
+from app.domain.comment.forest import NULL_INDEX
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# orjson 不支持嵌套超过 255 层的对象, 更深的评论树使用标准库编码
+ORJSON_MAX_DEPTH = 254
+
+
+def format_datetime(value: Optional[datetime]) -> Optional[str]:
+    return None if value is None else value.isoformat()
+
+
+def _dump_value(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, str):
+        return encode_basestring(value)
+    if isinstance(value, int):
+        return str(value)
+    return json.dumps(value)
+
+
+# 同时暂停垃圾回收的线程数, 以及第一个线程暂停前垃圾回收是否开启
+_gc_lock = threading.Lock()
+_gc_pausers = 0
+_gc_was_enabled = False
+
+
+@contextmanager
+def _gc_paused(pause: Optional[bool] = None):
+    """
+    构建 orjson 的中间 dict/list 时暂停循环垃圾回收: 大量新建的容器对象会反复触发分代回收, 见 benchmarks/bench_serializer.py
+    暂停对整个解释器生效, 由 SERIALIZER_PAUSE_GC 开启; 多个线程同时暂停时由最后一个退出的线程恢复原来的状态
+    :param pause: 为 None 时使用 SERIALIZER_PAUSE_GC
+    """
+    global _gc_pausers, _gc_was_enabled
+    if not (settings.SERIALIZER_PAUSE_GC if pause is None else pause):
+        yield
+        return
+    with _gc_lock:
+        if not _gc_pausers:
+            _gc_was_enabled = gc.isenabled()
+            gc.disable()
+        _gc_pausers += 1
+    try:
+        yield
+    finally:
+        with _gc_lock:
+            _gc_pausers -= 1
+            if not _gc_pausers and _gc_was_enabled:
+                gc.enable()
+
+
+def _push_nodes(stack: List[Any], nodes: Sequence[Any]) -> None:
+    """
+    倒序压栈, 使节点按原顺序出栈, 节点之间插入逗号
+    """
+    for index in range(len(nodes) - 1, -1, -1):
+        stack.append(nodes[index])
+        if index:
+            stack.append(",")
+
+
+def _write_forest(nodes: List[CommentTreeNode], parts: List[str]) -> None:
+    """
+    用显式栈按先序遍历写出评论树, 不受递归深度限制
+    栈中的字符串原样写出, 节点写出开头部分后把结尾部分和子节点压栈
+    """
+    stack: List[Any] = ["]"]
+    _push_nodes(stack, nodes)
+    parts.append("[")
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+            continue
+        parts.append(f'{{"id":{_dump_value(item.id)},"content":{encode_basestring(item.content)},"children":[')
+        stack.append(
+            f'],"created_by":{encode_basestring(item.created_by)}'
+            f',"created_at":{_dump_value(format_datetime(item.created_at))}'
+            f',"updated_at":{_dump_value(format_datetime(item.updated_at))}'
+            f',"reply_count":{item.reply_count},"descendant_count":{item.descendant_count}'
+            f',"children_cursor":{_dump_value(item.children_cursor)}}}'
+        )
+        if item.children:
+            _push_nodes(stack, item.children)
+
+
+def _to_builtins(nodes: List[CommentTreeNode]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    把评论树转成 dict/list, 同时返回树的最大深度
+    """
+    result: List[Dict[str, Any]] = []
+    max_depth = 0
+    stack = [(nodes, result, 1)]
+    while stack:
+        siblings, target, depth = stack.pop()
+        max_depth = max(max_depth, depth)
+        for node in siblings:
+            children: List[Dict[str, Any]] = []
+            target.append(
+                {
+                    "id": node.id,
+                    "content": node.content,
+                    "children": children,
+                    "created_by": node.created_by,
+                    "created_at": format_datetime(node.created_at),
+                    "updated_at": format_datetime(node.updated_at),
+                    "reply_count": node.reply_count,
+                    "descendant_count": node.descendant_count,
+                    "children_cursor": node.children_cursor,
+                }
+            )
+            if node.children:
+                stack.append((node.children, children, depth + 1))
+    return result, max_depth
+
+
+def dumps_comment_forest(
+    nodes: Sequence[CommentTreeNode], use_orjson: bool = True, pause_gc: Optional[bool] = None
+) -> bytes:
+    """
+    序列化评论树列表, 等价于 List[CommentTreeNodeDTO] 的响应体
+    :param pause_gc: 构建 orjson 的中间对象时是否暂停垃圾回收, 为 None 时使用 SERIALIZER_PAUSE_GC
+    """
+    if use_orjson and orjson is not None:
+        with _gc_paused(pause_gc):
+            builtins, depth = _to_builtins(nodes)
+        if depth <= ORJSON_MAX_DEPTH:
+            return orjson.dumps(builtins)
+    parts: List[str] = []
+    _write_forest(nodes, parts)
+    return "".join(parts).encode("utf-8")
+
+
+def _write_compact_forest(forest: CommentForest, parts: List[str]) -> None:
+    """
+    与 _write_forest 相同, 栈中的整数为节点下标
+    """
+    stack: List[Any] = ["]"]
+    _push_nodes(stack, forest.roots)
+    parts.append("[")
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+            continue
+        parts.append(f'{{"id":{forest.ids[item]},"content":{encode_basestring(forest.content(item))},"children":[')
+        created_at = forest.timestamp(forest.created_at[item], forest.created_at_zones[item])
+        updated_at = forest.timestamp(forest.updated_at[item], forest.updated_at_zones[item])
+        stack.append(
+            f'],"created_by":{encode_basestring(forest.authors[forest.author_indexes[item]])}'
+            f',"created_at":{_dump_value(format_datetime(created_at))}'
+            f',"updated_at":{_dump_value(format_datetime(updated_at))}'
+            f',"reply_count":{forest.reply_counts[item]},"descendant_count":{forest.descendant_counts[item]}'
+            ',"children_cursor":null}'
+        )
+        if forest.first_children[item] != NULL_INDEX:
+            _push_nodes(stack, list(forest.iter_children(item)))
+
+
+def _compact_to_builtins(forest: CommentForest) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    与 _to_builtins 相同, 直接读取 CommentForest 的数组, 不创建节点视图
+    """
+    result: List[Dict[str, Any]] = []
+    max_depth = 0
+    stack: List[Tuple[Iterable[int], List[Dict[str, Any]], int]] = [(forest.roots, result, 1)]
+    while stack:
+        siblings, target, depth = stack.pop()
+        max_depth = max(max_depth, depth)
+        for index in siblings:
+            children: List[Dict[str, Any]] = []
+            target.append(
+                {
+                    "id": forest.ids[index],
+                    "content": forest.content(index),
+                    "children": children,
+                    "created_by": forest.authors[forest.author_indexes[index]],
+                    "created_at": format_datetime(
+                        forest.timestamp(forest.created_at[index], forest.created_at_zones[index])
+                    ),
+                    "updated_at": format_datetime(
+                        forest.timestamp(forest.updated_at[index], forest.updated_at_zones[index])
+                    ),
+                    "reply_count": forest.reply_counts[index],
+                    "descendant_count": forest.descendant_counts[index],
+                    "children_cursor": None,
+                }
+            )
+            if forest.first_children[index] != NULL_INDEX:
+                stack.append((forest.iter_children(index), children, depth + 1))
+    return result, max_depth
+
+
+def dumps_compact_forest(forest: CommentForest, use_orjson: bool = True, pause_gc: Optional[bool] = None) -> bytes:
+    """
+    序列化 CommentForest, 输出与 dumps_comment_forest 序列化同样的评论树一致
+    :param pause_gc: 同 dumps_comment_forest
+    """
+    if use_orjson and orjson is not None:
+        with _gc_paused(pause_gc):
+            builtins, depth = _compact_to_builtins(forest)
+        if depth <= ORJSON_MAX_DEPTH:
+            return orjson.dumps(builtins)
+    parts: List[str] = []
+    _write_compact_forest(forest, parts)
+    return "".join(parts).encode("utf-8")
+
+
+def dumps_comment_tree(node: CommentTreeNode, use_orjson: bool = True) -> bytes:
+    """
+    序列化单棵评论树, 等价于 CommentTreeNodeDTO 的响应体
+    """
+    return dumps_comment_forest([node], use_orjson)[1:-1]
+
+
+def dumps_comment_page(nodes: List[CommentTreeNode], next_cursor: Optional[str], use_orjson: bool = True) -> bytes:
+    """
+    序列化一页评论, 等价于 CommentPageDTO 的响应体
+    """
+    items = dumps_comment_forest(nodes, use_orjson)
+    return b'{"items":' + items + b',"next_cursor":' + _dump_value(next_cursor).encode("utf-8") + b"}"
+
+
+def dumps_comment_lines(rows: Iterable[Tuple[Comment, Optional[int]]]) -> bytes:
+    """
+    把 (评论, 层级) 序列化为 NDJSON, 每行一条评论
+    """
+    lines = [
+        f'{{"id":{_dump_value(comment.id)},"parent_id":{_dump_value(comment.parent_id)},"depth":{_dump_value(depth)}'
+        f',"content":{encode_basestring(comment.content)},"created_by":{encode_basestring(comment.created_by)}'
+        f',"created_at":{_dump_value(format_datetime(comment.created_at))}'
+        f',"updated_at":{_dump_value(format_datetime(comment.updated_at))}}}\n'
+        for comment, depth in rows
+    ]
+    return "".join(lines).encode("utf-8")
@@ -1,2 +1,2 @@
-from .command import CommentCommandUseCase
-from .query import CommentQueryUseCase
+from .command import CommentCommandUseCase, AsyncCommentCommandUseCase
+from .query import CommentQueryUseCase, AsyncCommentQueryUseCase
@@ -1,7 +1,13 @@
-from typing import Optional
+import time
+from dataclasses import replace
+from typing import List, Optional
 
 from app.domain.comment import Comment
+from app.usecase.base import AsyncUseCase
+from app.usecase.comment.cache import comment_tree_cache
 from app.usecase.comment.dto import CommentReadDTO, CommentCreateDTO
+from app.usecase.comment.dto import CommentBulkCreateDTO, CommentBulkResultDTO
+from app.usecase.comment.index import comment_forest_index
 
 
 class CommentCommandUseCase(object):
@@ -16,7 +22,83 @@ class CommentCommandUseCase(object):
             created_at=data.created_at,
         )
         created_comment = self.repository.save(comment)
+        self.update_index([created_comment])
+        comment_tree_cache.bump()
         return CommentReadDTO.from_entity(created_comment)
 
-    def delete_comment(self, comment_id: int):
-        self.repository.remove(comment_id)
+    def create_comments(self, data: CommentBulkCreateDTO, emit_events: bool = True) -> CommentBulkResultDTO:
+        """
+        在一个事务中批量创建评论, 同一批次中的评论可以通过 parent_index 回复之前的评论
+        :param emit_events: 为 False 时不写入 CommentCreated 事件, 见 CommentRepository.save_all
+        """
+        comments = [
+            Comment(
+                content=item.content,
+                parent_id=item.parent_id if item.parent_index is None else None,
+                created_by=item.created_by,
+                created_at=item.created_at,
+            )
+            for item in data.items
+        ]
+        start = time.perf_counter()
+        ids = self.repository.save_all(comments, [item.parent_index for item in data.items], emit_events)
+        seconds = time.perf_counter() - start
+        if comment_forest_index.enabled:
+            parent_ids = [
+                item.parent_id if item.parent_index is None else ids[item.parent_index] for item in data.items
+            ]
+            self.update_index(
+                [
+                    replace(comment, id=comment_id, parent_id=parent_id)
+                    for comment, comment_id, parent_id in zip(comments, ids, parent_ids)
+                ]
+            )
+        comment_tree_cache.bump()
+        return CommentBulkResultDTO(
+            count=len(ids),
+            ids=ids,
+            seconds=seconds,
+            rows_per_second=len(ids) / seconds if seconds else 0,
+        )
+
+    def update_index(self, comments: List[Comment]) -> None:
+        """
+        把新评论增量加入索引, 父评论不在索引中(例如由其他进程写入)时只读取这些评论所在的评论树, 不重新构建整个索引
+        """
+        missing = comment_forest_index.add_all(comments)
+        if not missing:
+            return
+        lineages = self.repository.find_lineages({comment.id for comment in missing})
+        # 父评论总是先于回复写入, 评论所在的评论树中根评论的 id 最小
+        for root_id in {min(lineage) for lineage in lineages.values()}:
+            root = self.repository.find_tree(root_id)
+            if root is not None:
+                comment_forest_index.put_tree(root)
+
+    def delete_comment(self, comment_id: int, cascade: bool = False) -> Optional[int]:
+        """
+        :param cascade: 为 True 时删除整棵子树并返回删除的评论条数, 否则只删除这条评论, 其直接回复成为根评论
+        """
+        if not cascade:
+            self.repository.remove(comment_id)
+            comment_forest_index.remove(comment_id)
+            comment_tree_cache.bump()
+            return None
+        removed = self.repository.remove_tree(comment_id)
+        if removed:
+            comment_forest_index.remove(comment_id, cascade=True)
+            comment_tree_cache.bump()
+        return removed
+
+
+class AsyncCommentCommandUseCase(AsyncUseCase):
+    usecase_class = CommentCommandUseCase
+
+    async def create_comment(self, data: CommentCreateDTO) -> Optional[CommentReadDTO]:
+        return await self.run(lambda usecase: usecase.create_comment(data))
+
+    async def create_comments(self, data: CommentBulkCreateDTO, emit_events: bool = True) -> CommentBulkResultDTO:
+        return await self.run(lambda usecase: usecase.create_comments(data, emit_events))
+
+    async def delete_comment(self, comment_id: int, cascade: bool = False) -> Optional[int]:
+        return await self.run(lambda usecase: usecase.delete_comment(comment_id, cascade))
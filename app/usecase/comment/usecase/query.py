@@ -1,7 +1,31 @@
-from typing import Optional, List
+from itertools import islice
+from typing import Optional, List, Tuple, Iterator, Sequence
 
-from app.domain.comment import CommentDoesNotExistError
-from app.usecase.comment.dto import CommentReadDTO, CommentTreeNodeDTO
+from app.domain.comment import CommentDoesNotExistError, CommentTreeNode
+from app.usecase.base import AsyncUseCase
+from app.usecase.comment.index import comment_forest_index
+from app.usecase.comment.dto import CommentReadDTO, CommentTreeNodeDTO, CommentPageDTO
+from app.usecase.comment.dto import CommentSearchItemDTO, CommentSearchPageDTO
+from app.usecase.comment.serializer import dumps_comment_forest, dumps_comment_tree, dumps_comment_page
+from app.usecase.comment.serializer import dumps_comment_lines, dumps_compact_forest
+from app.utils import encode_cursor, decode_cursor, measure_serialization
+
+
+def set_children_cursors(nodes: List[CommentTreeNode]) -> List[CommentTreeNode]:
+    """
+    为只返回了部分直接回复的评论设置 children_cursor, 指向已返回的回复中按 (created_at, id) 最后的一条
+    一条回复都没有返回的评论(例如超过 max_depth)游标为 None, 客户端根据 reply_count 判断是否还有回复
+    """
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if not node.children:
+            continue
+        if len(node.children) < node.reply_count:
+            last = max(node.children, key=lambda child: (child.created_at, child.id))
+            node.children_cursor = encode_cursor(last.created_at, last.id)
+        stack.extend(node.children)
+    return nodes
 
 
 class CommentQueryUseCase(object):
@@ -10,19 +34,250 @@ class CommentQueryUseCase(object):
 
     def fetch_one(self, comment_id: int) -> Optional[CommentReadDTO]:
         try:
-            comment = self.repository.find(comment_id)
+            snapshot = comment_forest_index.snapshot
+            # 索引中没有的评论仍以数据库为准
+            comment = snapshot.find(comment_id) if snapshot else None
+            if comment is None:
+                comment = self.repository.find(comment_id)
             if comment is None:
                 raise CommentDoesNotExistError
         except:
             raise
         return CommentReadDTO.from_entity(comment)
 
-    def fetch_all(self) -> List[CommentTreeNodeDTO]:
+    def _find_all(
+        self, max_children: Optional[int] = None, max_depth: Optional[int] = None
+    ) -> Sequence[CommentTreeNode]:
+        """
+        开启评论森林索引时读取当前快照, 否则从数据库读取; 只返回部分子评论时总是从数据库读取
+        """
+        if max_children is not None or max_depth is not None:
+            return set_children_cursors(self.repository.find_all(max_children, max_depth))
+        snapshot = comment_forest_index.snapshot
+        if snapshot is not None:
+            return snapshot.roots
+        return self.repository.find_all()
+
+    def fetch_all(
+        self, max_children: Optional[int] = None, max_depth: Optional[int] = None
+    ) -> List[CommentTreeNodeDTO]:
         try:
-            comments = self.repository.find_all()
+            comments = self._find_all(max_children, max_depth)
         except:
             raise
         return [CommentTreeNodeDTO.from_entity(comment) for comment in comments]
 
+    def fetch_all_json(self, max_children: Optional[int] = None, max_depth: Optional[int] = None) -> bytes:
+        """
+        获取全部评论并直接序列化为 JSON, 响应体与 fetch_all 的结果一致
+        """
+        if max_children is None and max_depth is None and comment_forest_index.snapshot is None:
+            # 未开启索引时按列读取, 不为每条评论创建 CommentTreeNode
+            forest = self.repository.find_all_compact()
+            with measure_serialization():
+                return dumps_compact_forest(forest)
+        comments = self._find_all(max_children, max_depth)
+        with measure_serialization():
+            return dumps_comment_forest(comments)
+
+    def _find_tree(self, comment_id: int, max_depth: Optional[int], max_children: Optional[int]) -> CommentTreeNode:
+        comment = self.repository.find_tree(comment_id, max_depth, max_children)
+        if comment is None:
+            raise CommentDoesNotExistError
+        set_children_cursors([comment])
+        return comment
+
+    def fetch_tree(
+        self, comment_id: int, max_depth: Optional[int] = None, max_children: Optional[int] = None
+    ) -> CommentTreeNodeDTO:
+        return CommentTreeNodeDTO.from_entity(self._find_tree(comment_id, max_depth, max_children))
+
+    def fetch_tree_json(
+        self, comment_id: int, max_depth: Optional[int] = None, max_children: Optional[int] = None
+    ) -> bytes:
+        """
+        获取单条评论及其子评论并直接序列化为 JSON, 响应体与 fetch_tree 的结果一致
+        """
+        comment = self._find_tree(comment_id, max_depth, max_children)
+        with measure_serialization():
+            return dumps_comment_tree(comment)
+
+    def _find_page(
+        self, limit: int, cursor: Optional[str], max_children: Optional[int], max_depth: Optional[int]
+    ) -> Tuple[List[CommentTreeNode], Optional[str]]:
+        after = decode_cursor(cursor) if cursor else None
+        comments, has_more = self.repository.find_page(limit, after, max_children, max_depth)
+        next_cursor = None
+        if has_more:
+            last = comments[-1]
+            next_cursor = encode_cursor(last.created_at, last.id)
+        return set_children_cursors(comments), next_cursor
+
+    def fetch_page(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        max_children: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> CommentPageDTO:
+        comments, next_cursor = self._find_page(limit, cursor, max_children, max_depth)
+        return CommentPageDTO(
+            items=[CommentTreeNodeDTO.from_entity(comment) for comment in comments],
+            next_cursor=next_cursor,
+        )
+
+    def fetch_page_json(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        max_children: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> bytes:
+        """
+        分页获取评论并直接序列化为 JSON, 响应体与 fetch_page 的结果一致
+        """
+        comments, next_cursor = self._find_page(limit, cursor, max_children, max_depth)
+        with measure_serialization():
+            return dumps_comment_page(comments, next_cursor)
+
+    def _find_children(
+        self,
+        comment_id: int,
+        limit: int,
+        cursor: Optional[str],
+        max_children: Optional[int],
+        max_depth: Optional[int],
+    ) -> Tuple[List[CommentTreeNode], Optional[str]]:
+        after = decode_cursor(cursor) if cursor else None
+        comments, has_more = self.repository.find_children(comment_id, limit, after, max_children, max_depth)
+        # 没有回复时才需要区分评论不存在与评论没有(更多)回复
+        if not comments and self.repository.find(comment_id) is None:
+            raise CommentDoesNotExistError
+        next_cursor = None
+        if has_more:
+            last = comments[-1]
+            next_cursor = encode_cursor(last.created_at, last.id)
+        return set_children_cursors(comments), next_cursor
+
+    def fetch_children(
+        self,
+        comment_id: int,
+        limit: int,
+        cursor: Optional[str] = None,
+        max_children: Optional[int] = None,
+        max_depth: Optional[int] = 0,
+    ) -> CommentPageDTO:
+        comments, next_cursor = self._find_children(comment_id, limit, cursor, max_children, max_depth)
+        return CommentPageDTO(
+            items=[CommentTreeNodeDTO.from_entity(comment) for comment in comments],
+            next_cursor=next_cursor,
+        )
+
+    def fetch_children_json(
+        self,
+        comment_id: int,
+        limit: int,
+        cursor: Optional[str] = None,
+        max_children: Optional[int] = None,
+        max_depth: Optional[int] = 0,
+    ) -> bytes:
+        """
+        按 (created_at, id) 顺序分页获取一条评论的直接回复并直接序列化为 JSON, 响应体与 fetch_children 的结果一致
+        """
+        comments, next_cursor = self._find_children(comment_id, limit, cursor, max_children, max_depth)
+        with measure_serialization():
+            return dumps_comment_page(comments, next_cursor)
+
+    def search(self, query: str, limit: int, offset: int = 0) -> CommentSearchPageDTO:
+        results, has_more = self.repository.search(query, limit, offset)
+        return CommentSearchPageDTO(
+            items=[CommentSearchItemDTO.from_result(comment, snippet) for comment, snippet in results],
+            next_offset=offset + limit if has_more else None,
+        )
+
+    def export_ndjson(self, batch_size: int = 1000) -> Iterator[bytes]:
+        """
+        按 id 顺序导出全部评论, 每批 batch_size 条生成一段 NDJSON
+        """
+        rows = self.repository.stream_all(batch_size)
+        while True:
+            chunk = dumps_comment_lines(islice(rows, batch_size))
+            if not chunk:
+                return
+            yield chunk
+
     def count(self) -> int:
         return self.repository.count()
+
+
+class AsyncCommentQueryUseCase(AsyncUseCase):
+    usecase_class = CommentQueryUseCase
+
+    async def fetch_one(self, comment_id: int) -> Optional[CommentReadDTO]:
+        return await self.run(lambda usecase: usecase.fetch_one(comment_id))
+
+    async def fetch_all(
+        self, max_children: Optional[int] = None, max_depth: Optional[int] = None
+    ) -> List[CommentTreeNodeDTO]:
+        return await self.run(lambda usecase: usecase.fetch_all(max_children, max_depth))
+
+    async def fetch_all_json(self, max_children: Optional[int] = None, max_depth: Optional[int] = None) -> bytes:
+        return await self.run(lambda usecase: usecase.fetch_all_json(max_children, max_depth))
+
+    async def fetch_tree(
+        self, comment_id: int, max_depth: Optional[int] = None, max_children: Optional[int] = None
+    ) -> CommentTreeNodeDTO:
+        return await self.run(lambda usecase: usecase.fetch_tree(comment_id, max_depth, max_children))
+
+    async def fetch_tree_json(
+        self, comment_id: int, max_depth: Optional[int] = None, max_children: Optional[int] = None
+    ) -> bytes:
+        return await self.run(lambda usecase: usecase.fetch_tree_json(comment_id, max_depth, max_children))
+
+    async def fetch_page(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        max_children: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> CommentPageDTO:
+        return await self.run(lambda usecase: usecase.fetch_page(limit, cursor, max_children, max_depth))
+
+    async def fetch_page_json(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        max_children: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> bytes:
+        return await self.run(lambda usecase: usecase.fetch_page_json(limit, cursor, max_children, max_depth))
+
+    async def fetch_children(
+        self,
+        comment_id: int,
+        limit: int,
+        cursor: Optional[str] = None,
+        max_children: Optional[int] = None,
+        max_depth: Optional[int] = 0,
+    ) -> CommentPageDTO:
+        return await self.run(
+            lambda usecase: usecase.fetch_children(comment_id, limit, cursor, max_children, max_depth)
+        )
+
+    async def fetch_children_json(
+        self,
+        comment_id: int,
+        limit: int,
+        cursor: Optional[str] = None,
+        max_children: Optional[int] = None,
+        max_depth: Optional[int] = 0,
+    ) -> bytes:
+        return await self.run(
+            lambda usecase: usecase.fetch_children_json(comment_id, limit, cursor, max_children, max_depth)
+        )
+
+    async def search(self, query: str, limit: int, offset: int = 0) -> CommentSearchPageDTO:
+        return await self.run(lambda usecase: usecase.search(query, limit, offset))
+
+    async def count(self) -> int:
+        return await self.run(lambda usecase: usecase.count())
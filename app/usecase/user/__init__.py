@@ -1,2 +1,3 @@
 from .dto import UserRegisterDTO, UserCreateDTO, UserReadDTO
-from .usecase import UserQueryUseCase, UserCommandUseCase
+from .usecase import UserQueryUseCase, UserCommandUseCase, AsyncUserQueryUseCase, AsyncUserCommandUseCase
+from .cache import principal_cache
@@ -0,0 +1,6 @@
+from app.config import settings
+from app.utils.cache import TTLCache
+
+# 已认证用户缓存: 用户 id(JWT 的 subject) -> UserReadDTO
+# 缓存只在当前进程内有效, 多进程部署时其他进程最多在 PRINCIPAL_CACHE_TTL 秒后才能感知用户的变更
+principal_cache = TTLCache(maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL)
@@ -58,3 +58,13 @@ class UserReadDTO(BaseModel):
             created_at=user.created_at,
             updated_at=user.updated_at,
         )
+
+
+class CacheStatsDTO(BaseModel):
+    """
+    Cache Stats Data Transfer Object
+    """
+
+    size: int
+    hits: int
+    misses: int
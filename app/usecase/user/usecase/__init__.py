@@ -1,2 +1,2 @@
-from .query import UserQueryUseCase
-from .command import UserCommandUseCase
+from .query import UserQueryUseCase, AsyncUserQueryUseCase
+from .command import UserCommandUseCase, AsyncUserCommandUseCase
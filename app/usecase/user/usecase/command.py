@@ -2,19 +2,24 @@ from typing import Optional
 
 from app.domain.user import User, Email
 from app.infrastructure.user import UserRepository
+from app.usecase.base import AsyncUseCase
+from app.usecase.user.cache import principal_cache
 from app.usecase.user.dto import UserRegisterDTO, UserCreateDTO, UserReadDTO
 from app.domain.user import UserIsAlreadyExistsError
-from app.utils import encrypt_password
+from app.utils import encrypt_password, encrypt_password_async
 
 
 class UserCommandUseCase(object):
     def __init__(self, repository: UserRepository):
         self.repository = repository
 
-    def register_user(self, data: UserRegisterDTO) -> Optional[UserReadDTO]:
+    def register_user(self, data: UserRegisterDTO, encrypted_password: str = None) -> Optional[UserReadDTO]:
+        """
+        :param encrypted_password: 调用方已经计算好的密码哈希, 为空时在当前线程中计算
+        """
         user = User(
             username=data.username,
-            password=encrypt_password(str(data.password)),
+            password=encrypted_password or encrypt_password(str(data.password)),
             email=Email(data.email),
             created_at=data.created_at,
         )
@@ -23,10 +28,13 @@ class UserCommandUseCase(object):
         created_user = self.repository.save(user)
         return UserReadDTO.from_entity(created_user)
 
-    def create_user(self, data: UserCreateDTO) -> Optional[UserReadDTO]:
+    def create_user(self, data: UserCreateDTO, encrypted_password: str = None) -> Optional[UserReadDTO]:
+        """
+        :param encrypted_password: 同 register_user
+        """
         user = User(
             username=data.username,
-            password=encrypt_password(str(data.password)),
+            password=encrypted_password or encrypt_password(str(data.password)),
             email=Email(data.email),
             created_at=data.created_at,
             is_active=data.is_active,
@@ -39,3 +47,20 @@ class UserCommandUseCase(object):
 
     def delete_user(self, user_id: int):
         self.repository.remove(user_id)
+        principal_cache.invalidate(user_id)
+
+
+class AsyncUserCommandUseCase(AsyncUseCase):
+    usecase_class = UserCommandUseCase
+
+    async def register_user(self, data: UserRegisterDTO) -> Optional[UserReadDTO]:
+        # 在数据库会话之外等待密码哈希, 不占用线程池线程或数据库连接
+        encrypted_password = await encrypt_password_async(str(data.password))
+        return await self.run(lambda usecase: usecase.register_user(data, encrypted_password))
+
+    async def create_user(self, data: UserCreateDTO) -> Optional[UserReadDTO]:
+        encrypted_password = await encrypt_password_async(str(data.password))
+        return await self.run(lambda usecase: usecase.create_user(data, encrypted_password))
+
+    async def delete_user(self, user_id: int) -> None:
+        return await self.run(lambda usecase: usecase.delete_user(user_id))
@@ -1,9 +1,10 @@
 from typing import List
 
-from app.domain.user import UserDoesNotExistError
+from app.domain.user import User, UserDoesNotExistError
 from app.domain.user.exception import AuthenticateError
 from app.infrastructure.user import UserRepository
-from app.utils import verify_password
+from app.usecase.base import AsyncUseCase
+from app.utils import verify_password, verify_password_async
 from app.usecase.user.dto import UserReadDTO
 from app.usecase.user.dto.query import UserLoginDTO
 
@@ -21,7 +22,7 @@ class UserQueryUseCase(object):
             raise
         return UserReadDTO.from_entity(user)
 
-    def authenticate(self, plain_password: str, username: str = None, email: str = None) -> UserLoginDTO:
+    def find_login_user(self, username: str = None, email: str = None) -> User:
         try:
             if username:
                 user = self.repository.find_by_username(username)
@@ -33,6 +34,10 @@ class UserQueryUseCase(object):
                 raise UserDoesNotExistError
         except:
             raise
+        return user
+
+    def authenticate(self, plain_password: str, username: str = None, email: str = None) -> UserLoginDTO:
+        user = self.find_login_user(username, email)
         if not verify_password(plain_password=plain_password, encrypted_password=user.password):
             raise AuthenticateError
         return UserLoginDTO.from_entity(user)
@@ -43,3 +48,20 @@ class UserQueryUseCase(object):
         except:
             raise
         return [UserReadDTO.from_entity(user) for user in users]
+
+
+class AsyncUserQueryUseCase(AsyncUseCase):
+    usecase_class = UserQueryUseCase
+
+    async def fetch_one(self, user_id: int) -> UserReadDTO:
+        return await self.run(lambda usecase: usecase.fetch_one(user_id))
+
+    async def authenticate(self, plain_password: str, username: str = None, email: str = None) -> UserLoginDTO:
+        user = await self.run(lambda usecase: usecase.find_login_user(username, email))
+        # 在数据库会话之外等待密码校验, 不占用线程池线程或数据库连接
+        if not await verify_password_async(plain_password=plain_password, encrypted_password=user.password):
+            raise AuthenticateError
+        return UserLoginDTO.from_entity(user)
+
+    async def fetch_all(self) -> List[UserReadDTO]:
+        return await self.run(lambda usecase: usecase.fetch_all())
@@ -1 +1,7 @@
 from .auth import verify_password, encrypt_password, get_authorization_from_headers, create_access_token
+from .auth import verify_password_async, encrypt_password_async
+from .auth import password_hasher, PasswordHasher, PasswordHasherBusyError
+from .pagination import encode_cursor, decode_cursor, InvalidCursorError
+from .http import make_etag, etag_matches, TimedJSONResponse
+from .metrics import MetricsMiddleware, metrics_registry, measure_serialization
+from .admission import AdmissionMiddleware, admission_controller, admit, defer_admission
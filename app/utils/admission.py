@@ -0,0 +1,241 @@
+"""
+准入控制与过载保护
+
+AdmissionMiddleware 在路由之前按 "方法 路径" 找到请求对应的 RouteLimiter:
+- 令牌桶中没有令牌时立即返回 429, Retry-After 为下一个令牌到达的时间
+- 正在处理的请求达到并发上限时排队等待, 队列已满或等待超时返回 503
+未配置的路由直接放行, 过载时开销小的路由仍能正常响应
+带缓存的路由可以用 defer_admission 标记, 由路由在缓存未命中时通过 admit 申请名额, 缓存命中与 304 响应不受限制
+状态只在事件循环中访问, 不需要加锁; 限制只作用于当前进程
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route, compile_path
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import settings, AdmissionLimit
+from app.utils.metrics import escape_label
+
+RATE_LIMITED_MESSAGE = "请求过于频繁, 请稍后重试"
+OVERLOADED_MESSAGE = "系统繁忙, 请稍后重试"
+# 排队已满或超时后建议客户端重试的间隔(秒)
+OVERLOADED_RETRY_AFTER = 1
+SHED_REASONS = ("rate_limited", "queue_full", "queue_timeout")
+# 推迟准入时, 中间件把匹配到的 RouteLimiter 保存在请求状态中的键
+DEFERRED_LIMITER = "admission_limiter"
+
+
+def defer_admission(endpoint: Callable) -> Callable:
+    """
+    标记路由自行申请准入名额, 需要放在路由装饰器之下
+    中间件只记录匹配到的 RouteLimiter, 路由在确实需要查询时(例如缓存未命中)调用 admit, 缓存命中与 304 响应不占用名额
+    """
+    endpoint.defer_admission = True
+    return endpoint
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+class TokenBucket(object):
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.clock = clock
+        self.updated = clock()
+
+    def take(self) -> float:
+        """
+        取一个令牌
+        :return: 成功时为 0, 否则为下一个令牌到达前还需等待的秒数
+        """
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RouteLimiter(object):
+    def __init__(self, method: str, path: str, limit: AdmissionLimit, clock: Callable[[], float] = time.monotonic):
+        self.method = method
+        self.path = path
+        self.pattern = compile_path(path)[0]
+        self.max_concurrency = limit.max_concurrency
+        self.max_queue = limit.max_queue
+        self.queue_timeout = limit.queue_timeout
+        self.bucket = TokenBucket(limit.rate, limit.burst, clock) if limit.rate else None
+        # 对应的路由是否由 defer_admission 标记, 第一次请求时从应用的路由表中查找
+        self.deferred: Optional[bool] = None
+        self.in_flight = 0
+        # 排队中的请求, 释放的名额直接交给队首的请求, 不会被之后到达的请求抢走
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.shed: Dict[str, int] = dict.fromkeys(SHED_REASONS, 0)
+
+    def matches(self, method: str, path: str) -> bool:
+        return method == self.method and self.pattern.match(path) is not None
+
+    def is_deferred(self, app: Optional[ASGIApp]) -> bool:
+        if self.deferred is None:
+            self.deferred = any(
+                isinstance(route, Route)
+                and route.path == self.path
+                and self.method in (route.methods or ())
+                and getattr(route.endpoint, "defer_admission", False)
+                for route in getattr(app, "routes", ())
+            )
+        return self.deferred
+
+    async def acquire(self) -> Optional[Tuple[int, str, float]]:
+        """
+        申请处理名额, 放行后必须调用 release
+        :return: 放行时为 None, 否则为 (状态码, 错误信息, Retry-After 秒数)
+        """
+        if self.bucket is not None:
+            wait = self.bucket.take()
+            if wait:
+                self.shed["rate_limited"] += 1
+                return 429, RATE_LIMITED_MESSAGE, wait
+        if self.max_concurrency is None or self.in_flight < self.max_concurrency:
+            self.in_flight += 1
+            self.admitted += 1
+            return None
+        if len(self.waiters) >= self.max_queue:
+            self.shed["queue_full"] += 1
+            return 503, OVERLOADED_MESSAGE, OVERLOADED_RETRY_AFTER
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed["queue_timeout"] += 1
+            return 503, OVERLOADED_MESSAGE, OVERLOADED_RETRY_AFTER
+        except asyncio.CancelledError:
+            # 已经分到名额后才被取消(客户端断开)时归还名额
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+        self.admitted += 1
+        return None
+
+    def release(self) -> None:
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+class AdmissionController(object):
+    def __init__(self, limits: Dict[str, AdmissionLimit], clock: Callable[[], float] = time.monotonic):
+        """
+        :param limits: "方法 路径" -> 准入控制配置, 例如 {"GET /api/v1/comments/{comment_id}/tree": AdmissionLimit(...)}
+        """
+        self.limiters: List[RouteLimiter] = []
+        for route, limit in limits.items():
+            method, path = route.split(" ", 1)
+            self.limiters.append(RouteLimiter(method.upper(), path.strip(), limit, clock))
+
+    def match(self, method: str, path: str) -> Optional[RouteLimiter]:
+        for limiter in self.limiters:
+            if limiter.matches(method, path):
+                return limiter
+        return None
+
+    def render(self) -> str:
+        """
+        以 Prometheus 文本格式输出每个路由的排队数、处理中的请求数、放行数与按原因统计的拒绝数
+        """
+        lines: List[str] = []
+        for name, kind, description, value in (
+            ("http_admission_queue_depth", "gauge", "排队等待的请求数", lambda limiter: len(limiter.waiters)),
+            ("http_admission_in_flight", "gauge", "正在处理的请求数", lambda limiter: limiter.in_flight),
+            ("http_admission_admitted_total", "counter", "放行的请求数", lambda limiter: limiter.admitted),
+        ):
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            for limiter in self.limiters:
+                lines.append(f"{name}{{{self._labels(limiter)}}} {value(limiter)}")
+        lines += ["# HELP http_admission_shed_total 被拒绝的请求数", "# TYPE http_admission_shed_total counter"]
+        for limiter in self.limiters:
+            for reason, count in limiter.shed.items():
+                lines.append(f'http_admission_shed_total{{{self._labels(limiter)},reason="{reason}"}} {count}')
+        return "\n".join(lines) + "\n" if lines else ""
+
+    @staticmethod
+    def _labels(limiter: RouteLimiter) -> str:
+        return f'method="{limiter.method}",route="{escape_label(limiter.path)}"'
+
+
+class AdmissionMiddleware(object):
+    """
+    按路由做准入控制, 应作为最外层的中间件, 被拒绝的请求不经过其他中间件与路由
+    """
+
+    def __init__(self, app: ASGIApp, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or admission_controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limiter = self.controller.match(scope["method"], scope["path"])
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        if limiter.is_deferred(scope.get("app")):
+            scope.setdefault("state", {})[DEFERRED_LIMITER] = limiter
+            await self.app(scope, receive, send)
+            return
+        rejection = await limiter.acquire()
+        if rejection is not None:
+            status_code, message, retry_after = rejection
+            response = JSONResponse(
+                {"detail": message}, status_code=status_code, headers=retry_after_header(retry_after)
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+@asynccontextmanager
+async def admit(request: Request) -> AsyncIterator[None]:
+    """
+    在 defer_admission 标记的路由中申请准入名额, 被拒绝时抛出带 Retry-After 的 HTTPException
+    未开启准入控制或路由未配置限制时直接放行
+    """
+    limiter: Optional[RouteLimiter] = request.scope.get("state", {}).get(DEFERRED_LIMITER)
+    if limiter is None:
+        yield
+        return
+    rejection = await limiter.acquire()
+    if rejection is not None:
+        status_code, message, retry_after = rejection
+        raise HTTPException(status_code=status_code, detail=message, headers=retry_after_header(retry_after))
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+# 进程内唯一的准入控制器, ADMISSION_ENABLED 开启时由 AdmissionMiddleware 使用, 同时通过 /metrics 输出统计
+admission_controller = AdmissionController(settings.ADMISSION_LIMITS)
@@ -1,4 +1,9 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import timedelta, datetime
+from typing import Any, Callable, Optional
 
 from fastapi import HTTPException, status, Request
 from jose import jwt
@@ -7,12 +12,94 @@ from passlib.hash import pbkdf2_sha256
 from app.config import settings
 
 
-def verify_password(plain_password: str, encrypted_password: str) -> bool:
+class PasswordHasherBusyError(Exception):
+    message = "系统繁忙, 请稍后重试"
+
+    def __str__(self):
+        return PasswordHasherBusyError.message
+
+
+def _hash_password(password: str) -> str:
+    return pbkdf2_sha256.hash(password)
+
+
+def _verify_password(plain_password: str, encrypted_password: str) -> bool:
     return pbkdf2_sha256.verify(plain_password, encrypted_password)
 
 
+class PasswordHasher(object):
+    """
+    在进程池中执行 PBKDF2 计算, 避免占用事件循环与 GIL
+    同时执行的计算数由进程数限制, 排队与执行中的任务超过 max_pending 时立即抛出 PasswordHasherBusyError
+    进程池在第一次使用时才创建, 此时服务已经启动了线程池等线程, 以 spawn 方式启动子进程, 不 fork 多线程进程的状态(例如被其他线程持有的锁)
+    异步代码使用 run_async 等待结果, 不阻塞事件循环; 同步代码(线程池、脚本)使用 run 阻塞当前线程
+    """
+
+    def __init__(self, max_workers: Optional[int], max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _submit(self, func: Callable, *args) -> Future:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise PasswordHasherBusyError
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            self.pending += 1
+        try:
+            future = self._executor.submit(func, *args)
+        except:
+            self._done()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future = None) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    def run(self, func: Callable, *args) -> Any:
+        if self.max_workers == 0:
+            return func(*args)
+        return self._submit(func, *args).result()
+
+    async def run_async(self, func: Callable, *args) -> Any:
+        if self.max_workers == 0:
+            return func(*args)
+        return await asyncio.wrap_future(self._submit(func, *args))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
+
+
+def verify_password(plain_password: str, encrypted_password: str) -> bool:
+    return password_hasher.run(_verify_password, plain_password, encrypted_password)
+
+
 def encrypt_password(password: str) -> str:
-    return pbkdf2_sha256.hash(password)
+    return password_hasher.run(_hash_password, password)
+
+
+async def verify_password_async(plain_password: str, encrypted_password: str) -> bool:
+    return await password_hasher.run_async(_verify_password, plain_password, encrypted_password)
+
+
+async def encrypt_password_async(password: str) -> str:
+    return await password_hasher.run_async(_hash_password, password)
 
 
 def get_authorization_from_headers(request: Request) -> str:
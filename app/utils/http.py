@@ -0,0 +1,34 @@
+import hashlib
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse
+
+from .metrics import measure_serialization
+
+
+def make_etag(body: bytes) -> str:
+    """
+    根据响应体生成强 ETag
+    """
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    判断请求头 If-None-Match 是否命中 ETag, If-None-Match 按 RFC 7232 使用弱比较
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class TimedJSONResponse(JSONResponse):
+    """
+    统计 JSON 渲染耗时的 JSONResponse, 计入当前请求的序列化耗时
+    """
+
+    def render(self, content: Any) -> bytes:
+        with measure_serialization():
+            return super().render(content)
@@ -0,0 +1,160 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+@dataclass
+class RequestMetrics:
+    """
+    单个请求的耗时统计, 时间单位为秒
+    """
+
+    queries: int = 0
+    db_time: float = 0
+    serialization_time: float = 0
+
+
+# 当前请求的统计, 线程池与 greenlet 中执行的代码会复制上下文, 修改的是同一个对象
+current_request_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar("current_request_metrics", default=None)
+
+
+def record_query(duration: float) -> None:
+    """
+    记录一条 SQL 的执行时间, 不在请求中执行(例如启动脚本)时忽略
+    """
+    metrics = current_request_metrics.get()
+    if metrics is not None:
+        metrics.queries += 1
+        metrics.db_time += duration
+
+
+@contextmanager
+def measure_serialization() -> Iterator[None]:
+    """
+    统计响应序列化耗时
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = current_request_metrics.get()
+        if metrics is not None:
+            metrics.serialization_time += time.perf_counter() - start
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram(object):
+    """
+    按标签分组的直方图, 输出 Prometheus 文本格式
+    """
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # 标签值 -> (各个桶的计数, 总和, 总数), 桶的计数不累加, 输出时再累加
+        self.series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        counts, total = self.series.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self.series.items()):
+            label_text = ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{self.name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total[0]:g}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry(object):
+    """
+    按路由汇总请求耗时, 只在事件循环中更新, 不需要加锁
+    """
+
+    def __init__(self):
+        labels = ("method", "route")
+        self.duration = Histogram("http_request_duration_seconds", "请求处理耗时", labels, DURATION_BUCKETS)
+        self.db_time = Histogram("http_request_db_seconds", "请求中 SQL 的执行耗时", labels, DURATION_BUCKETS)
+        self.serialization_time = Histogram(
+            "http_request_serialization_seconds", "请求中响应序列化的耗时", labels, DURATION_BUCKETS
+        )
+        self.queries = Histogram("http_request_sql_queries", "请求中执行的 SQL 条数", labels, QUERY_BUCKETS)
+
+    def observe(self, method: str, route: str, duration: float, metrics: RequestMetrics) -> None:
+        labels = (method, route)
+        self.duration.observe(labels, duration)
+        self.db_time.observe(labels, metrics.db_time)
+        self.serialization_time.observe(labels, metrics.serialization_time)
+        self.queries.observe(labels, metrics.queries)
+
+    def render(self) -> str:
+        histograms = (self.duration, self.db_time, self.serialization_time, self.queries)
+        return "\n".join(line for histogram in histograms for line in histogram.render()) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+
+def format_server_timing(duration: float, metrics: RequestMetrics) -> str:
+    return (
+        f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"'
+        f", ser;dur={metrics.serialization_time * 1000:.2f}"
+        f", app;dur={duration * 1000:.2f}"
+    )
+
+
+class MetricsMiddleware(object):
+    """
+    统计每个请求的 SQL 条数、SQL 耗时、序列化耗时与处理耗时
+    处理耗时为收到请求到开始发送响应的时间, 通过 Server-Timing 响应头返回, 同时按路由汇总到 metrics_registry
+    """
+
+    def __init__(self, app: ASGIApp, server_timing: bool = True, registry: MetricsRegistry = metrics_registry):
+        self.app = app
+        self.server_timing = server_timing
+        self.registry = registry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        metrics = RequestMetrics()
+        token = current_request_metrics.set(metrics)
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                duration = time.perf_counter() - start
+                route = scope.get("route")
+                self.registry.observe(scope["method"], getattr(route, "path", "unmatched"), duration, metrics)
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", format_server_timing(duration, metrics).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request_metrics.reset(token)
@@ -0,0 +1,31 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Tuple
+
+
+class InvalidCursorError(ValueError):
+    message = "分页游标无效"
+
+    def __str__(self):
+        return InvalidCursorError.message
+
+
+def encode_cursor(created_at: datetime, comment_id: int) -> str:
+    """
+    将 (created_at, id) 编码为不透明的分页游标
+    """
+    raw = f"{created_at.isoformat()}|{comment_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    将分页游标解码为 (created_at, id)
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, comment_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(comment_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise InvalidCursorError
@@ -0,0 +1,143 @@
+"""
+混合负载下的接口延迟: 阻塞事件循环的基线 vs 同步 Session(线程池) vs 异步 AsyncSession
+
+一部分客户端不断请求代价很高的 GET /comments(全量评论树), 另一部分客户端请求代价很低的 GET /comments/{id},
+对比各模式下低代价接口的 p50/p99 延迟
+- blocking: 在事件循环中直接执行同步 Session 的数据库调用, 即 async 路由直接调用同步 UseCase 的写法
+- sync: DATABASE_ASYNC=false, 同步 Session 在线程池中执行
+- async: DATABASE_ASYNC=true, 使用 AsyncSession
+
+运行方式: python -m benchmarks.bench_concurrency
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.infrastructure.database import AsyncRepository, Base
+from benchmarks.dataset import load_forest, wide_forest
+
+# 模式 -> (DATABASE_ASYNC, uvicorn 的应用参数)
+MODES: Dict[str, Tuple[str, List[str]]] = {
+    "blocking": ("false", ["benchmarks.bench_concurrency:create_blocking_app", "--factory"]),
+    "sync": ("false", ["server:app"]),
+    "async": ("true", ["server:app"]),
+}
+
+
+def create_blocking_app() -> Callable:
+    """
+    基线模式的应用, 由 uvicorn --factory 在服务进程中调用
+    AsyncRepository.run_sync 不再交给线程池, 直接在事件循环中执行, 一个慢查询会阻塞同一进程中的全部请求
+    """
+
+    async def run_sync(self: AsyncRepository, func: Callable):
+        return func(self.repository_class(self.session))
+
+    AsyncRepository.run_sync = run_sync
+    from server import app
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(latencies: List[float], percent: float) -> float:
+    if not latencies:
+        return float("nan")
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100))] * 1000
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get("/api/v1/comments/count/")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("服务启动超时")
+
+
+async def worker(client: httpx.AsyncClient, url: str, deadline: float, latencies: List[float]) -> None:
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        response = await client.get(url)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_load(base_url: str, args: argparse.Namespace) -> Dict[str, List[float]]:
+    latencies: Dict[str, List[float]] = {"heavy": [], "light": []}
+    limits = httpx.Limits(max_connections=args.heavy_clients + args.light_clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await wait_until_ready(client)
+        deadline = time.monotonic() + args.duration
+        workers = [worker(client, "/api/v1/comments", deadline, latencies["heavy"]) for _ in range(args.heavy_clients)]
+        workers += [
+            worker(client, "/api/v1/comments/1", deadline, latencies["light"]) for _ in range(args.light_clients)
+        ]
+        await asyncio.gather(*workers)
+    return latencies
+
+
+def bench(mode: str, args: argparse.Namespace) -> Dict[str, List[float]]:
+    with tempfile.TemporaryDirectory() as directory:
+        database_uri = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        engine = create_engine(database_uri, future=True)
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        load_forest(session, wide_forest(args.comments))
+        session.close()
+        engine.dispose()
+
+        port = free_port()
+        database_async, app_args = MODES[mode]
+        # 关闭评论列表缓存, 每个全量评论树请求都要查询数据库
+        env = {**os.environ, "DATABASE_URI": database_uri, "DATABASE_ASYNC": database_async, "COMMENT_CACHE_SIZE": "0"}
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", *app_args, "--port", str(port), "--log-level", "warning"],
+            env=env,
+        )
+        try:
+            return asyncio.run(run_load(f"http://127.0.0.1:{port}", args))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--comments", type=int, default=5000, help="评论树的节点数")
+    parser.add_argument("--duration", type=float, default=10, help="每种模式的压测时长(秒)")
+    parser.add_argument("--heavy-clients", type=int, default=4, help="请求全量评论树的并发数")
+    parser.add_argument("--light-clients", type=int, default=16, help="请求单条评论的并发数")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'route':<8}{'requests':>10}{'rps':>10}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+    for mode in args.modes:
+        latencies = bench(mode, args)
+        for route, values in latencies.items():
+            print(
+                f"{mode:<10}{route:<8}{len(values):>10}{len(values) / args.duration:>10.1f}"
+                f"{percentile(values, 50):>12.2f}{percentile(values, 99):>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
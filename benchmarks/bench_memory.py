@@ -0,0 +1,96 @@
+"""
+评论森林内存占用对比: CommentTreeNode 树(以及同时构建的 CommentTreeNodeDTO 副本) vs 按列存储的 CommentForest
+
+用 tracemalloc 统计从评论行构建完成后各个结构仍然占用的内存, 包括结构引用的字符串与 datetime, 不包括已释放的评论行,
+同时校验两者的序列化结果一致
+
+运行方式: python -m benchmarks.bench_memory
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from collections import namedtuple
+from typing import Callable, Dict, List
+
+from app.domain.comment import CommentForest
+from app.infrastructure.comment.do import get_comments_tree
+from app.usecase.comment.dto import CommentTreeNodeDTO
+from app.usecase.comment.serializer import dumps_comment_forest, dumps_compact_forest
+from benchmarks.dataset import SHAPES, make_comments
+
+# 与 CommentRepository.find_all 读取的 COMMENT_TREE_COLUMNS 字段相同
+Row = namedtuple("Row", "id parent_id content created_by created_at updated_at reply_count descendant_count")
+
+
+def make_rows(shape: str, size: int, roots: int) -> List[Row]:
+    parents = SHAPES[shape](size, roots)
+    return [
+        Row(
+            id=index + 1,
+            parent_id=None if parent is None else parent + 1,
+            content=comment.content,
+            created_by=comment.created_by,
+            created_at=comment.created_at,
+            updated_at=None,
+            reply_count=0,
+            descendant_count=0,
+        )
+        for index, (comment, parent) in enumerate(zip(make_comments(parents), parents))
+    ]
+
+
+def build_tree_with_dto(rows: List[Row]) -> object:
+    tree = get_comments_tree(rows)
+    return tree, [CommentTreeNodeDTO.from_entity(node) for node in tree]
+
+
+STRUCTURES: Dict[str, Callable[[List[Row]], object]] = {
+    "dataclass": get_comments_tree,
+    "dataclass+dto": build_tree_with_dto,
+    "compact": CommentForest.from_rows,
+}
+
+
+def measure_memory(make: Callable[[], List[Row]], build: Callable[[List[Row]], object]) -> int:
+    """
+    :return: 构建完成并释放评论行后, 结构本身及其引用的对象占用的字节数
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build(make())
+    gc.collect()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return used
+
+
+def measure_seconds(rows: List[Row], build: Callable[[List[Row]], object]) -> float:
+    start = time.perf_counter()
+    build(rows)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", choices=list(SHAPES), default="random")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10000, 100000, 1000000], help="评论森林的节点数")
+    parser.add_argument("--roots", type=int, default=100, help="根评论数")
+    parser.add_argument("--structures", nargs="+", choices=list(STRUCTURES), default=list(STRUCTURES))
+    args = parser.parse_args()
+
+    print(f"{'nodes':>10}{'structure':>16}{'bytes/node':>12}{'MB':>10}{'seconds':>10}")
+    for size in args.sizes:
+        rows = make_rows(args.shape, size, args.roots)
+        expected = dumps_comment_forest(get_comments_tree(rows))
+        assert dumps_compact_forest(CommentForest.from_rows(rows)) == expected, "CommentForest 的序列化结果与评论树不一致"
+        for name in args.structures:
+            build = STRUCTURES[name]
+            used = measure_memory(lambda: make_rows(args.shape, size, args.roots), build)
+            elapsed = measure_seconds(rows, build)
+            print(f"{size:>10}{name:>16}{used / size:>12.1f}{used / 1e6:>10.1f}{elapsed:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
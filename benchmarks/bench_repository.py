@@ -0,0 +1,187 @@
+"""
+CommentRepository 与 CommentQueryUseCase 基准测试
+
+在合成的评论森林上分别测量 find_all、find、count、save、remove 以及 fetch_all(含 DTO 转换)的
+耗时、SQL 查询次数与峰值内存, 结果写入 JSON 文件, 可以通过 --baseline 与之前的结果对比
+
+运行方式: python -m benchmarks.bench_repository --output results.json [--baseline old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from app.domain.comment import Comment
+from app.infrastructure.comment import CommentRepository
+from app.infrastructure.database import Base
+from app.usecase.comment.usecase import CommentQueryUseCase
+from benchmarks.dataset import SHAPES, load_forest
+
+
+class QueryCounter(object):
+    """
+    统计 engine 上执行的 SQL 条数
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.count = 0
+
+    def __enter__(self) -> "QueryCounter":
+        event.listen(self.engine, "before_cursor_execute", self.before_cursor_execute)
+        return self
+
+    def __exit__(self, *args) -> None:
+        event.remove(self.engine, "before_cursor_execute", self.before_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.count += 1
+
+
+def measure(engine: Engine, operation: Callable[[int], object], calls: int) -> Dict[str, float]:
+    """
+    执行 calls 次 operation, 分两轮测量: 第一轮计时并统计查询次数, 第二轮开启 tracemalloc 统计峰值内存
+    """
+    with QueryCounter(engine) as counter:
+        start = time.perf_counter()
+        for call in range(calls):
+            operation(call)
+        seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        for call in range(calls):
+            operation(calls + call)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "calls": calls,
+        "seconds": seconds,
+        "seconds_per_call": seconds / calls,
+        "queries_per_call": counter.count / calls,
+        "peak_memory_bytes": peak,
+    }
+
+
+def bench_forest(shape: str, size: int, args: argparse.Namespace) -> List[Dict]:
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}", future=True)
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        start = time.perf_counter()
+        ids = load_forest(session, SHAPES[shape](size, args.roots, args.seed))
+        load_seconds = time.perf_counter() - start
+
+        rng = random.Random(args.seed)
+        repository = CommentRepository(session)
+        query_usecase = CommentQueryUseCase(repository)
+        # save 新增的评论在 remove 中依次删除, 两者的调用次数相同, 数据集大小在测量前后保持不变
+        saved_ids: List[int] = []
+
+        def save(call: int) -> None:
+            comment = Comment(
+                content="基准测试回复",
+                created_by="benchmark",
+                parent_id=rng.choice(ids),
+                created_at=datetime.utcnow(),
+            )
+            saved_ids.append(repository.save(comment).id)
+
+        def remove(call: int) -> None:
+            repository.remove(saved_ids.pop())
+
+        operations: Dict[str, Callable[[int], object]] = {
+            "find_all": lambda call: repository.find_all(),
+            "fetch_all": lambda call: query_usecase.fetch_all(),
+            "find": lambda call: repository.find(rng.choice(ids)),
+            "count": lambda call: repository.count(),
+            "save": save,
+            "remove": remove,
+        }
+        results = [{"shape": shape, "size": size, "operation": "load", "calls": 1, "seconds": load_seconds}]
+        for name, operation in operations.items():
+            calls = args.tree_calls if name in ("find_all", "fetch_all") else args.calls
+            # 会话中残留的 ORM 对象会影响内存统计, 每项测量前清空
+            session.expunge_all()
+            results.append({"shape": shape, "size": size, "operation": name, **measure(engine, operation, calls)})
+        session.close()
+        engine.dispose()
+        return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict], baseline_path: str) -> None:
+    """
+    打印与基准结果的耗时比值, 大于 1 表示变慢
+    """
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = {(item["shape"], item["size"], item["operation"]): item for item in json.load(file)["results"]}
+    print(f"\n{'shape':<10}{'size':>10}{'operation':>12}{'time ratio':>12}{'queries':>16}")
+    for item in results:
+        old = baseline.get((item["shape"], item["size"], item["operation"]))
+        if old is None or "seconds_per_call" not in item:
+            continue
+        ratio = item["seconds_per_call"] / old["seconds_per_call"]
+        queries = f"{old['queries_per_call']:g} -> {item['queries_per_call']:g}"
+        print(f"{item['shape']:<10}{item['size']:>10}{item['operation']:>12}{ratio:>12.2f}{queries:>16}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shapes", nargs="+", choices=list(SHAPES), default=list(SHAPES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000])
+    parser.add_argument("--roots", type=int, default=100, help="根评论数")
+    parser.add_argument("--calls", type=int, default=100, help="find/count/save/remove 的调用次数")
+    parser.add_argument("--tree-calls", type=int, default=3, help="find_all/fetch_all 的调用次数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_repository.json", help="结果文件路径")
+    parser.add_argument("--baseline", help="用于对比的历史结果文件")
+    args = parser.parse_args()
+
+    results: List[Dict] = []
+    print(f"{'shape':<10}{'size':>10}{'operation':>12}{'ms/call':>12}{'queries':>10}{'peak MB':>10}")
+    for shape in args.shapes:
+        for size in args.sizes:
+            for item in bench_forest(shape, size, args):
+                results.append(item)
+                if "seconds_per_call" in item:
+                    print(
+                        f"{shape:<10}{size:>10}{item['operation']:>12}{item['seconds_per_call'] * 1000:>12.3f}"
+                        f"{item['queries_per_call']:>10g}{item['peak_memory_bytes'] / 1e6:>10.2f}"
+                    )
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+评论树序列化性能对比: Pydantic(CommentTreeNodeDTO + jsonable_encoder) vs 直接序列化(标准库 json / orjson)
+orjson-nogc 在构建 orjson 的中间对象时暂停垃圾回收, 对应开启 SERIALIZER_PAUSE_GC
+
+运行方式: python -m benchmarks.bench_serializer
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.domain.comment import CommentTreeNode
+from app.usecase.comment.dto import CommentTreeNodeDTO
+from app.usecase.comment.serializer import dumps_comment_forest, orjson
+
+
+def random_forest(size: int, roots: int, seed: int = 0) -> List[CommentTreeNode]:
+    """
+    随机生成评论树: 每条评论随机回复一条已有评论, 前 roots 条为根评论
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    nodes: List[CommentTreeNode] = []
+    for comment_id in range(1, size + 1):
+        node = CommentTreeNode(
+            id=comment_id,
+            content=f"评论{comment_id}: " + "内容" * rng.randint(1, 20),
+            created_by="benchmark(benchmark@devops.com)",
+            created_at=now + timedelta(seconds=comment_id),
+        )
+        if comment_id > roots:
+            nodes[rng.randrange(len(nodes))].children.append(node)
+        nodes.append(node)
+    return nodes[:roots]
+
+
+def pydantic_dumps(forest: List[CommentTreeNode]) -> bytes:
+    return JSONResponse(jsonable_encoder([CommentTreeNodeDTO.from_entity(node) for node in forest])).body
+
+
+SERIALIZERS: Dict[str, Callable[[List[CommentTreeNode]], bytes]] = {
+    "pydantic": pydantic_dumps,
+    "json": lambda forest: dumps_comment_forest(forest, use_orjson=False),
+}
+if orjson is not None:
+    SERIALIZERS["orjson"] = lambda forest: dumps_comment_forest(forest, pause_gc=False)
+    SERIALIZERS["orjson-nogc"] = lambda forest: dumps_comment_forest(forest, pause_gc=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 100000, 1000000], help="评论树的节点数")
+    parser.add_argument("--roots", type=int, default=100, help="根评论数")
+    parser.add_argument("--serializers", nargs="+", choices=list(SERIALIZERS), default=list(SERIALIZERS))
+    args = parser.parse_args()
+
+    print(f"{'nodes':>10}{'serializer':>13}{'seconds':>12}{'nodes/s':>14}{'MB':>10}")
+    for size in args.sizes:
+        forest = random_forest(size, min(args.roots, size))
+        expected = None
+        for name in args.serializers:
+            start = time.perf_counter()
+            body = SERIALIZERS[name](forest)
+            elapsed = time.perf_counter() - start
+            if expected is None:
+                expected = body
+            assert body == expected, f"{name} 的输出与 {args.serializers[0]} 不一致"
+            print(f"{size:>10}{name:>13}{elapsed:>12.3f}{size / elapsed:>14.0f}{len(body) / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+子树查询性能对比: 物化路径范围扫描 vs WITH RECURSIVE vs 逐节点懒加载的递归遍历
+
+物化路径的长度随深度线性增长, 单链这类极深的评论树上路径读取的字节数为 O(深度²), 扁平或常见形状的评论树上优势明显
+
+运行方式: python -m benchmarks.bench_subtree
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.infrastructure.comment import CommentDO, CommentRepository
+from app.infrastructure.database import Base
+from benchmarks.dataset import SHAPES, load_forest
+
+
+def lazy_walk(comment_do: CommentDO) -> int:
+    """
+    逐节点访问 CommentDO.children, 每个节点触发一次查询
+    """
+    count = 1
+    stack = list(comment_do.children)
+    while stack:
+        child = stack.pop()
+        count += 1
+        stack.extend(child.children)
+    return count
+
+
+def timeit(func: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=500, help="每棵评论树的节点数")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数, 取最快一次")
+    args = parser.parse_args()
+
+    print(f"{'shape':<8}{'size':>8}{'path (ms)':>14}{'cte (ms)':>14}{'lazy (ms)':>14}")
+    for shape in ("deep", "wide"):
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}", future=True)
+            Base.metadata.create_all(engine)
+            session: Session = sessionmaker(bind=engine)()
+            root_id = load_forest(session, SHAPES[shape](args.size))[0]
+            repository = CommentRepository(session)
+
+            def lazy():
+                session.expunge_all()
+                return lazy_walk(session.get(CommentDO, root_id))
+
+            assert len(repository.find_descendants(root_id)) == args.size
+            assert lazy() == args.size
+            path_ms = timeit(lambda: repository.find_descendants(root_id), args.repeat)
+            cte_ms = timeit(lambda: repository.find_tree(root_id), args.repeat)
+            lazy_ms = timeit(lazy, args.repeat)
+            print(f"{shape:<8}{args.size:>8}{path_ms:>14.2f}{cte_ms:>14.2f}{lazy_ms:>14.2f}")
+            session.close()
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
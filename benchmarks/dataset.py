@@ -0,0 +1,139 @@
+"""
+合成评论森林: 按形状生成每条评论的父评论下标, 并批量写入数据库
+
+形状:
+- wide: 每棵评论树中的评论都直接回复根评论
+- deep: 每棵评论树是一条单链, 每条评论都回复上一条评论
+- random: 每条评论随机回复一条已有评论
+- power-law: 优先连接, 回复越多的评论越容易得到新的回复, 回复数近似幂律分布
+
+运行方式: python -m benchmarks.dataset --shape power-law --size 100000 --output comments.ndjson
+"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.domain.comment import Comment
+from app.infrastructure.comment import CommentRepository
+
+Parents = List[Optional[int]]
+
+
+def split_roots(size: int, roots: int) -> List[int]:
+    """
+    把 size 条评论尽量平均地分给 roots 棵评论树, 返回每棵树的节点数
+    """
+    roots = max(1, min(roots, size))
+    return [size // roots + (1 if index < size % roots else 0) for index in range(roots)]
+
+
+def wide_forest(size: int, roots: int = 1, seed: int = 0) -> Parents:
+    parents: Parents = []
+    for tree_size in split_roots(size, roots):
+        root = len(parents)
+        parents.append(None)
+        parents.extend([root] * (tree_size - 1))
+    return parents
+
+
+def deep_forest(size: int, roots: int = 1, seed: int = 0) -> Parents:
+    parents: Parents = []
+    for tree_size in split_roots(size, roots):
+        parents.append(None)
+        parents.extend(range(len(parents) - 1, len(parents) + tree_size - 2))
+    return parents
+
+
+def random_forest(size: int, roots: int = 1, seed: int = 0) -> Parents:
+    rng = random.Random(seed)
+    roots = max(1, min(roots, size))
+    return [None] * roots + [rng.randrange(index) for index in range(roots, size)]
+
+
+def power_law_forest(size: int, roots: int = 1, seed: int = 0) -> Parents:
+    rng = random.Random(seed)
+    roots = max(1, min(roots, size))
+    parents: Parents = [None] * roots
+    # 每条评论在 tickets 中出现 1 + 回复数 次, 随机抽取即为按 (回复数 + 1) 加权选择
+    tickets: List[int] = list(range(roots))
+    for index in range(roots, size):
+        parent = tickets[rng.randrange(len(tickets))]
+        parents.append(parent)
+        tickets.append(parent)
+        tickets.append(index)
+    return parents
+
+
+SHAPES: Dict[str, Callable[..., Parents]] = {
+    "wide": wide_forest,
+    "deep": deep_forest,
+    "random": random_forest,
+    "power-law": power_law_forest,
+}
+
+
+def make_comments(parents: Parents, seed: int = 0) -> List[Comment]:
+    """
+    为每个节点生成评论内容, 创建时间随下标递增
+    """
+    rng = random.Random(seed)
+    start = datetime(2022, 1, 1)
+    return [
+        Comment(
+            content=f"评论{index + 1}: " + "内容" * rng.randint(1, 40),
+            created_by="benchmark(benchmark@devops.com)",
+            created_at=start + timedelta(seconds=index),
+        )
+        for index in range(len(parents))
+    ]
+
+
+def load_forest(session: Session, parents: Parents, batch_size: int = 10000, seed: int = 0) -> List[int]:
+    """
+    通过 CommentRepository.save_all 逐批写入评论森林, 物化路径与计数器同时写好
+    :return: 每个节点的评论 id
+    """
+    repository = CommentRepository(session)
+    comments = make_comments(parents, seed)
+    ids: List[int] = []
+    for start in range(0, len(parents), batch_size):
+        batch = comments[start : start + batch_size]
+        parent_indexes: List[Optional[int]] = []
+        for comment, parent in zip(batch, parents[start : start + batch_size]):
+            if parent is not None and parent < start:
+                comment.parent_id = ids[parent]
+                parent_indexes.append(None)
+            else:
+                parent_indexes.append(None if parent is None else parent - start)
+        ids.extend(repository.save_all(batch, parent_indexes, emit_events=False))
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", choices=list(SHAPES), default="random")
+    parser.add_argument("--size", type=int, default=10000, help="评论总数")
+    parser.add_argument("--roots", type=int, default=100, help="根评论数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="NDJSON 文件路径, 可以通过 import_comments.py 导入")
+    args = parser.parse_args()
+
+    parents = SHAPES[args.shape](args.size, args.roots, args.seed)
+    with open(args.output, "w", encoding="utf-8") as file:
+        for index, (comment, parent) in enumerate(zip(make_comments(parents, args.seed), parents)):
+            record = {
+                "id": index + 1,
+                "parent_id": None if parent is None else parent + 1,
+                "content": comment.content,
+                "created_by": comment.created_by,
+                "created_at": comment.created_at.isoformat(),
+            }
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
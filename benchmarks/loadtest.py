@@ -0,0 +1,228 @@
+"""
+端到端压测: 在 uvicorn 中启动 server:app, 用 httpx 异步客户端按比例混合请求真实的接口
+
+场景:
+- list: 匿名分页读取评论列表 GET /comments?limit=20
+- forest: 匿名读取全部评论 GET /comments, 不分页
+- revalidate: 带上次响应的 ETag 读取全部评论 GET /comments + If-None-Match, 数据未变化时返回 304
+- tree: 匿名读取一条根评论的评论树 GET /comments/{id}/tree
+- login: 普通用户登录 POST /login
+- post: 普通用户发表回复 POST /comments
+- delete: 超级用户删除一条压测中发表的回复 DELETE /comments/{id}
+
+种子数据: init_data 创建的用户(test1 / admin) 与 benchmarks.dataset 生成的评论森林, 相同参数下可以完全复现
+报告每个场景的请求数、错误数、304 响应数、RPS 以及 p50/p95/p99 延迟
+评论列表缓存默认关闭, 通过 --comment-cache-size 开启后 forest 与 revalidate 场景才会命中缓存
+
+运行方式: python -m benchmarks.loadtest --concurrency 32 --duration 30 --mix list=40,tree=40,login=5,post=10,delete=5
+对比评论列表缓存: python -m benchmarks.loadtest --mix forest=45,revalidate=45,post=10 --comment-cache-size 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.infrastructure.database import Base
+from benchmarks.bench_concurrency import free_port, percentile, wait_until_ready
+from benchmarks.dataset import SHAPES, load_forest
+from init_db import init_data
+
+API = "/api/v1"
+NORMAL_USER = {"username": "test1", "password": "Test1@123"}
+SUPERUSER = {"username": "admin", "password": "Admin@123"}
+SCENARIOS = ("list", "forest", "revalidate", "tree", "login", "post", "delete")
+
+
+class LoadTest(object):
+    def __init__(self, client: httpx.AsyncClient, root_ids: List[int], args: argparse.Namespace):
+        self.client = client
+        self.root_ids = root_ids
+        self.args = args
+        self.mix = parse_mix(args.mix)
+        self.latencies: Dict[str, List[float]] = {scenario: [] for scenario in SCENARIOS}
+        self.errors: Dict[str, int] = {scenario: 0 for scenario in SCENARIOS}
+        self.not_modified: Dict[str, int] = {scenario: 0 for scenario in SCENARIOS}
+        # revalidate 场景最近一次收到的评论列表 ETag, 各虚拟用户共享, 相当于客户端的协商缓存
+        self.forest_etag: Optional[str] = None
+        self.user_headers: Dict[str, str] = {}
+        self.superuser_headers: Dict[str, str] = {}
+        # post 场景发表的回复, 供 delete 场景删除, 种子数据在压测过程中保持不变
+        self.posted_ids: List[int] = []
+
+    async def request(self, scenario: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[scenario] += 1
+            return None
+        self.latencies[scenario].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[scenario] += 1
+        elif response.status_code == 304:
+            self.not_modified[scenario] += 1
+        return response
+
+    async def login(self, user: Dict[str, str]) -> Dict[str, str]:
+        response = await self.client.post(f"{API}/login", json=user)
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['token']}"}
+
+    async def run_list(self, rng: random.Random) -> None:
+        await self.request("list", "GET", f"{API}/comments", params={"limit": 20})
+
+    async def run_forest(self, rng: random.Random) -> None:
+        await self.request("forest", "GET", f"{API}/comments")
+
+    async def run_revalidate(self, rng: random.Random) -> None:
+        headers = {"If-None-Match": self.forest_etag} if self.forest_etag else {}
+        response = await self.request("revalidate", "GET", f"{API}/comments", headers=headers)
+        if response is not None and response.status_code == 200:
+            self.forest_etag = response.headers.get("ETag")
+
+    async def run_tree(self, rng: random.Random) -> None:
+        await self.request("tree", "GET", f"{API}/comments/{rng.choice(self.root_ids)}/tree")
+
+    async def run_login(self, rng: random.Random) -> None:
+        await self.request("login", "POST", f"{API}/login", json=NORMAL_USER)
+
+    async def run_post(self, rng: random.Random) -> None:
+        data = {"content": "压测回复", "parent_id": rng.choice(self.root_ids)}
+        response = await self.request("post", "POST", f"{API}/comments", json=data, headers=self.user_headers)
+        if response is not None and response.status_code == 201:
+            self.posted_ids.append(response.json()["id"])
+
+    async def run_delete(self, rng: random.Random) -> None:
+        if not self.posted_ids:
+            await self.run_post(rng)
+            return
+        comment_id = self.posted_ids.pop(rng.randrange(len(self.posted_ids)))
+        await self.request("delete", "DELETE", f"{API}/comments/{comment_id}", headers=self.superuser_headers)
+
+    async def worker(self, seed: int, deadline: float) -> None:
+        rng = random.Random(seed)
+        scenarios, weights = list(self.mix), list(self.mix.values())
+        while time.monotonic() < deadline:
+            scenario = rng.choices(scenarios, weights)[0]
+            await getattr(self, f"run_{scenario}")(rng)
+
+    async def run(self) -> None:
+        await wait_until_ready(self.client)
+        self.user_headers = await self.login(NORMAL_USER)
+        self.superuser_headers = await self.login(SUPERUSER)
+        deadline = time.monotonic() + self.args.duration
+        await asyncio.gather(*[self.worker(self.args.seed + index, deadline) for index in range(self.args.concurrency)])
+
+    def report(self) -> List[Dict]:
+        return [
+            {
+                "route": scenario,
+                "requests": len(self.latencies[scenario]),
+                "errors": self.errors[scenario],
+                "not_modified": self.not_modified[scenario],
+                "rps": len(self.latencies[scenario]) / self.args.duration,
+                "p50_ms": percentile(self.latencies[scenario], 50),
+                "p95_ms": percentile(self.latencies[scenario], 95),
+                "p99_ms": percentile(self.latencies[scenario], 99),
+            }
+            for scenario in SCENARIOS
+            if scenario in self.mix
+        ]
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    解析形如 list=40,tree=40,login=5 的场景权重
+    """
+    weights: Dict[str, float] = {}
+    for item in mix.split(","):
+        scenario, _, weight = item.partition("=")
+        if scenario not in SCENARIOS:
+            raise ValueError(f"未知的场景: {scenario}, 可选: {', '.join(SCENARIOS)}")
+        weights[scenario] = float(weight or 1)
+    return weights
+
+
+def seed_database(database_uri: str, args: argparse.Namespace) -> List[int]:
+    """
+    创建表并写入种子数据, 返回根评论 id
+    """
+    engine = create_engine(database_uri, future=True)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    init_data(session)
+    parents = SHAPES[args.shape](args.comments, args.roots, args.seed)
+    ids = load_forest(session, parents, seed=args.seed)
+    session.close()
+    engine.dispose()
+    return [comment_id for comment_id, parent in zip(ids, parents) if parent is None]
+
+
+async def run_load(base_url: str, root_ids: List[int], args: argparse.Namespace) -> List[Dict]:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        load_test = LoadTest(client, root_ids, args)
+        await load_test.run()
+        return load_test.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32, help="并发的虚拟用户数")
+    parser.add_argument("--duration", type=float, default=30, help="压测时长(秒)")
+    parser.add_argument("--mix", default="list=40,tree=40,login=5,post=10,delete=5", help="场景权重")
+    parser.add_argument("--shape", choices=list(SHAPES), default="power-law", help="种子评论森林的形状")
+    parser.add_argument("--comments", type=int, default=10000, help="种子评论数")
+    parser.add_argument("--roots", type=int, default=500, help="种子根评论数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn 的进程数")
+    parser.add_argument("--async-db", action="store_true", help="开启 DATABASE_ASYNC")
+    parser.add_argument("--comment-cache-size", type=int, default=0, help="服务端 COMMENT_CACHE_SIZE, 0 表示关闭缓存")
+    parser.add_argument("--timeout", type=float, default=60, help="单个请求的超时时间(秒)")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_uri = f"sqlite:///{os.path.join(directory, 'loadtest.db')}"
+        root_ids = seed_database(database_uri, args)
+        port = free_port()
+        env = {
+            **os.environ,
+            "DATABASE_URI": database_uri,
+            "DATABASE_ASYNC": str(args.async_db).lower(),
+            "COMMENT_CACHE_SIZE": str(args.comment_cache_size),
+        }
+        command = [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"]
+        server = subprocess.Popen(command + ["--workers", str(args.workers)], env=env)
+        try:
+            report = asyncio.run(run_load(f"http://127.0.0.1:{port}", root_ids, args))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(
+        f"{'route':<12}{'requests':>10}{'errors':>8}{'304':>8}{'rps':>10}"
+        f"{'p50 (ms)':>12}{'p95 (ms)':>12}{'p99 (ms)':>12}"
+    )
+    for item in report:
+        print(
+            f"{item['route']:<12}{item['requests']:>10}{item['errors']:>8}{item['not_modified']:>8}{item['rps']:>10.1f}"
+            f"{item['p50_ms']:>12.2f}{item['p95_ms']:>12.2f}{item['p99_ms']:>12.2f}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"parameters": vars(args), "results": report}, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
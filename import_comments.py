@@ -0,0 +1,136 @@
+"""
+从 NDJSON 文件批量导入评论, 文件格式与 GET /api/v1/comments/export 的导出结果相同
+
+每行一条评论, 包含 content、created_by、created_at, 以及可选的 id 与 parent_id:
+- id 为源数据中的 id, 仅用于解析回复关系, 导入后会重新分配
+- parent_id 指向文件中之前出现过的评论 id
+  文件中找不到父评论时不写入任何评论并报错, 指定 --orphans-as-roots 时把这些评论作为根评论导入
+
+运行方式: python import_comments.py comments.ndjson
+"""
+import argparse
+import json
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from app.infrastructure import CommentRepository
+from app.infrastructure.database import SessionLocal
+from app.infrastructure.database import upgrade_tables
+from app.usecase.comment import CommentCommandUseCase, CommentBulkItemDTO, CommentBulkCreateDTO
+
+
+# 每个事务写入的评论条数上限, 与 CommentBulkCreateDTO 一致
+MAX_BATCH_SIZE = 10000
+
+
+def read_records(path: str) -> Iterator[Tuple[int, dict]]:
+    """
+    逐行读取评论, 跳过空行
+    :return: (行号, 评论)
+    """
+    with open(path, encoding="utf-8") as file:
+        for line_number, line in enumerate(file, 1):
+            if line.strip():
+                yield line_number, json.loads(line)
+
+
+def find_orphans(path: str) -> List[Tuple[int, int]]:
+    """
+    查找 parent_id 不是文件中之前出现过的评论 id 的评论
+    :return: (行号, parent_id)
+    """
+    source_ids: Set[int] = set()
+    orphans: List[Tuple[int, int]] = []
+    for line_number, record in read_records(path):
+        parent_id = record.get("parent_id")
+        if parent_id is not None and parent_id not in source_ids:
+            orphans.append((line_number, parent_id))
+        if record.get("id") is not None:
+            source_ids.add(record["id"])
+    return orphans
+
+
+def import_comments(
+    command_usecase: CommentCommandUseCase, path: str, batch_size: int = 1000, orphans_as_roots: bool = False
+) -> int:
+    """
+    逐批导入评论, 每批一个事务
+    :param orphans_as_roots: 为 True 时把文件中找不到父评论的评论作为根评论导入, 否则在写入前报错
+    :return: 导入的评论条数
+    """
+    if not orphans_as_roots:
+        orphans = find_orphans(path)
+        if orphans:
+            line_number, parent_id = orphans[0]
+            raise ValueError(
+                f"{len(orphans)} 条评论的父评论不在文件中, 第一条位于第 {line_number} 行(parent_id={parent_id}), "
+                f"可以使用 --orphans-as-roots 作为根评论导入"
+            )
+    # 源数据 id 到新 id 的映射, 以及当前批次中源数据 id 到批次内下标的映射
+    new_ids: Dict[int, int] = {}
+    batch_indexes: Dict[int, int] = {}
+    batch_source_ids: List[int] = []
+    items: List[CommentBulkItemDTO] = []
+    total = 0
+    start = time.perf_counter()
+
+    def flush() -> None:
+        nonlocal total
+        # 导入的是历史数据, 不为每条评论写入 outbox 事件, 避免写入量翻倍
+        result = command_usecase.create_comments(CommentBulkCreateDTO(items=items), emit_events=False)
+        for source_id, new_id in zip(batch_source_ids, result.ids):
+            if source_id is not None:
+                new_ids[source_id] = new_id
+        total += result.count
+        print(f"已导入 {total} 条, 本批 {result.rows_per_second:.0f} 条/秒, 累计 {total / (time.perf_counter() - start):.0f} 条/秒")
+        items.clear()
+        batch_indexes.clear()
+        batch_source_ids.clear()
+
+    for _, record in read_records(path):
+        source_id, source_parent_id = record.get("id"), record.get("parent_id")
+        parent_index = batch_indexes.get(source_parent_id)
+        parent_id: Optional[int] = None
+        if parent_index is None and source_parent_id is not None:
+            # 找不到的父评论已在写入前检查过, 只有 orphans_as_roots 时才会作为根评论导入
+            parent_id = new_ids.get(source_parent_id)
+        fields = {key: record[key] for key in ("content", "created_by", "created_at") if record.get(key) is not None}
+        items.append(CommentBulkItemDTO(parent_id=parent_id, parent_index=parent_index, **fields))
+        if source_id is not None:
+            batch_indexes[source_id] = len(items) - 1
+        batch_source_ids.append(source_id)
+        if len(items) >= batch_size:
+            flush()
+    if items:
+        flush()
+    return total
+
+
+def batch_size_type(value: str) -> int:
+    batch_size = int(value)
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise argparse.ArgumentTypeError(f"取值范围为 1 到 {MAX_BATCH_SIZE}")
+    return batch_size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="NDJSON 文件路径")
+    parser.add_argument("--batch-size", type=batch_size_type, default=1000, help=f"每个事务写入的评论条数, 不超过 {MAX_BATCH_SIZE}")
+    parser.add_argument("--orphans-as-roots", action="store_true", help="把文件中找不到父评论的评论作为根评论导入")
+    args = parser.parse_args()
+
+    print("评论导入...")
+    upgrade_tables()
+    session = SessionLocal()
+    start = time.perf_counter()
+    try:
+        count = import_comments(
+            CommentCommandUseCase(CommentRepository(session)), args.path, args.batch_size, args.orphans_as_roots
+        )
+    except ValueError as e:
+        parser.exit(1, f"评论导入失败: {e}\n")
+    finally:
+        session.close()
+    seconds = time.perf_counter() - start
+    print(f"评论导入完毕: {count} 条, 耗时 {seconds:.1f} 秒, {count / seconds if seconds else 0:.0f} 条/秒.")
@@ -0,0 +1,14 @@
+from app.infrastructure.comment.maintenance import backfill_comment_paths, rebuild_comment_counters
+from app.infrastructure.comment.maintenance import rebuild_comment_search
+from app.infrastructure.database import SessionLocal
+from app.infrastructure.database import upgrade_tables
+
+if __name__ == "__main__":
+    print("数据修复...")
+    upgrade_tables()
+    session = SessionLocal()
+    print(f"补全评论物化路径: {backfill_comment_paths(session)} 条")
+    print(f"修复评论计数: {rebuild_comment_counters(session)} 条")
+    print(f"重建评论全文索引: {rebuild_comment_search(session)} 条")
+    session.close()
+    print("数据修复完毕.")
@@ -1,3 +1,6 @@
+from contextlib import contextmanager
+from typing import Iterator
+
 import uvicorn
 from fastapi import FastAPI, Request, status
 from fastapi.exceptions import RequestValidationError
@@ -5,9 +8,25 @@ from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from app.config import settings
-from app.routers import user, comment
+from app.infrastructure.comment import CommentRepository
+from app.infrastructure.database import ReadSessionLocal, SessionLocal
+from app.infrastructure.outbox import outbox_dispatcher
+from app.routers import user, comment, metrics
+from app.routers.session import ReadYourWritesMiddleware
+from app.usecase.comment import comment_event_broadcaster
+from app.usecase.comment.index import comment_forest_index
+from app.utils import password_hasher, MetricsMiddleware, TimedJSONResponse, AdmissionMiddleware
 
-app = FastAPI(title="Comments Tree", description="A Domain-Drive Design project in FastAPI")
+app = FastAPI(
+    title="Comments Tree",
+    description="A Domain-Drive Design project in FastAPI",
+    default_response_class=TimedJSONResponse,
+)
+app.add_middleware(MetricsMiddleware, server_timing=settings.SERVER_TIMING_ENABLED)
+app.add_middleware(ReadYourWritesMiddleware, seconds=settings.READ_YOUR_WRITES_SECONDS)
+# 最后添加的中间件在最外层, 被拒绝的请求不再经过其他中间件
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
 
 
 class SPAStaticFiles(StaticFiles):
@@ -27,9 +46,45 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"detail": error_message})
 
 
+@app.on_event("startup")
+def build_comment_forest_index():
+    if settings.COMMENT_INDEX_ENABLED:
+        with SessionLocal() as session:
+            comment_forest_index.build(CommentRepository(session).find_all())
+
+
+@contextmanager
+def comment_read_repository() -> Iterator[CommentRepository]:
+    """
+    评论事件广播器查询评论时使用的只读 Repository
+    """
+    with ReadSessionLocal() as session:
+        yield CommentRepository(session)
+
+
+@app.on_event("startup")
+async def start_outbox_dispatcher():
+    if settings.OUTBOX_ENABLED:
+        comment_event_broadcaster.register(outbox_dispatcher, comment_read_repository)
+        await outbox_dispatcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_outbox_dispatcher():
+    comment_event_broadcaster.close_all()
+    await outbox_dispatcher.stop()
+
+
+@app.on_event("shutdown")
+def shutdown_password_hasher():
+    password_hasher.shutdown()
+
+
 app.mount("/web", SPAStaticFiles(directory="static", html=True), name="static")
 app.include_router(user.api, prefix="/api/v1", tags=["users"])
 app.include_router(comment.api, prefix="/api/v1", tags=["comments"])
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.api)
 
 
 if __name__ == "__main__":